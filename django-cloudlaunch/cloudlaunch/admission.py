@@ -0,0 +1,200 @@
+"""
+Admission control of launches based on the number of launches waiting to
+start.
+
+The launches waiting in the launch queue are counted as they are admitted
+and until their task starts, rather than read from the depth of the queue,
+which also holds the stages of launches under way and counts a batch of
+launches as a single message.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+
+log = get_task_logger('cloudlaunch')
+
+QUEUED_LAUNCHES_KEY = 'cloudlaunch:admission:queued'
+
+# Admit launches if they fit under the limit; see
+# ``LocalAdmissionBackend.admit``
+REDIS_ADMIT_SCRIPT = """
+local count, limit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local queued = tonumber(redis.call('get', KEYS[1])) or 0
+if queued + count > limit then
+    return {0, queued}
+end
+redis.call('set', KEYS[1], queued + count, 'EX', math.ceil(ARGV[3]))
+return {1, queued}
+"""
+
+# Count launches as started; see ``LocalAdmissionBackend.release``
+REDIS_RELEASE_SCRIPT = """
+local queued = redis.call('decrby', KEYS[1], ARGV[1])
+if queued <= 0 then
+    redis.call('del', KEYS[1])
+end
+return queued
+"""
+
+
+class LaunchCapacityExceeded(Exception):
+
+    def __init__(self, message, wait):
+        super(LaunchCapacityExceeded, self).__init__(message)
+        self.wait = wait
+
+
+class LocalAdmissionBackend(object):
+    """
+    Counts kept in this process.
+
+    Only counts the launches admitted by a single process, so this backend
+    is meant for tests and single process deployments.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        count, expires = self._counts.get(key, (0, 0))
+        return count if expires > time.time() else 0
+
+    def admit(self, key, count, limit, ttl):
+        """
+        Add ``count`` to a count if the result doesn't exceed ``limit``.
+
+        The count expires ``ttl`` seconds after it was last added to.
+
+        :rtype: ``tuple``
+        :return: Whether the count was added and the count before.
+        """
+        with self._lock:
+            queued = self._get(key)
+            if queued + count > limit:
+                return False, queued
+            self._counts[key] = (queued + count, time.time() + ttl)
+            return True, queued
+
+    def release(self, key, count):
+        """Subtract ``count`` from a count, down to 0."""
+        with self._lock:
+            queued = self._get(key) - count
+            if queued > 0:
+                self._counts[key] = (queued, self._counts[key][1])
+            else:
+                self._counts.pop(key, None)
+
+
+class RedisAdmissionBackend(object):
+    """Counts kept in Redis and shared by the servers and workers."""
+
+    def __init__(self, url):
+        # Only required with this backend
+        import redis
+        client = redis.Redis.from_url(url)
+        self._admit = client.register_script(REDIS_ADMIT_SCRIPT)
+        self._release = client.register_script(REDIS_RELEASE_SCRIPT)
+
+    def admit(self, key, count, limit, ttl):
+        admitted, queued = self._admit(keys=[key], args=[count, limit, ttl])
+        return bool(admitted), int(queued)
+
+    def release(self, key, count):
+        self._release(keys=[key], args=[count])
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Get the admission backend selected with ``CLOUDLAUNCH_ADMISSION_BACKEND``.
+
+    Either ``redis`` (counts kept at ``CLOUDLAUNCH_ADMISSION_REDIS_URL``) or
+    ``local`` (in-process counts).
+    """
+    global _backend
+    with _backend_lock:
+        if not _backend:
+            backend = settings.CLOUDLAUNCH_ADMISSION_BACKEND
+            if backend == 'redis':
+                _backend = RedisAdmissionBackend(
+                    settings.CLOUDLAUNCH_ADMISSION_REDIS_URL)
+            elif backend == 'local':
+                _backend = LocalAdmissionBackend()
+            else:
+                raise ValueError(
+                    "Unsupported admission backend: {}".format(backend))
+    return _backend
+
+
+def estimate_wait(excess):
+    """
+    Estimate the seconds until ``excess`` queued launches have started.
+
+    Launches are assumed to take ``CLOUDLAUNCH_LAUNCH_DURATION`` seconds and
+    to be run ``CLOUDLAUNCH_LAUNCH_CONCURRENCY`` at a time.
+
+    :rtype: ``int``
+    """
+    return int(math.ceil(excess / settings.CLOUDLAUNCH_LAUNCH_CONCURRENCY) *
+               settings.CLOUDLAUNCH_LAUNCH_DURATION)
+
+
+def check_launch_admission(count=1):
+    """
+    Admit ``count`` more launches, counting them as queued.
+
+    Launches are admitted while no more than ``CLOUDLAUNCH_LAUNCH_QUEUE_LIMIT``
+    admitted launches would be waiting to start; a limit of 0 admits all
+    launches. Admitted launches must be counted as started, with
+    ``release_launches``, once their task starts or if they are not queued
+    after all.
+
+    The count is an approximation. It expires once no launches have been
+    admitted for as long as it takes to start a full queue of launches, so
+    that launches lost from the queue (e.g., by purging it) don't count
+    forever. A launch redelivered to another worker is counted as started
+    only once, unless its worker was lost before its first checkpoint.
+    Launches are also admitted, uncounted, if the count can't be read so
+    that a Redis hiccup doesn't block launches.
+
+    :type count: ``int``
+    :param count: The number of launches, e.g., the size of a batch.
+
+    :raise LaunchCapacityExceeded: If the launches can't be admitted, with
+                                   the estimated seconds until they could be.
+    """
+    limit = settings.CLOUDLAUNCH_LAUNCH_QUEUE_LIMIT
+    if not limit:
+        return
+    ttl = estimate_wait(limit) + settings.CLOUDLAUNCH_LAUNCH_DURATION
+    try:
+        admitted, queued = get_backend().admit(QUEUED_LAUNCHES_KEY, count,
+                                               limit, ttl)
+    except Exception:
+        log.exception("Could not count the queued launches; admitting the "
+                      "launch")
+        return
+    if not admitted:
+        log.warning("Rejecting %s launches with %s launches queued", count,
+                    queued)
+        raise LaunchCapacityExceeded(
+            "The launch queue is full with {0} launches waiting. Please try "
+            "again later.".format(queued), estimate_wait(queued + count - limit))
+
+
+def release_launches(count=1):
+    """Count ``count`` admitted launches as no longer queued."""
+    if not settings.CLOUDLAUNCH_LAUNCH_QUEUE_LIMIT:
+        return
+    try:
+        get_backend().release(QUEUED_LAUNCHES_KEY, count)
+    except Exception:
+        log.exception("Could not count %s launches as started", count)
@@ -0,0 +1,79 @@
+"""Ansible callback plugin recording the duration and outcome of each task."""
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = '''
+    callback: cloudlaunch_timings
+    type: aggregate
+    short_description: Record the duration and outcome of each task
+    description:
+      - Writes the name, host, status and duration of each task run, along
+        with the name of the first failed task, as JSON to the file named by
+        the CLOUDLAUNCH_TIMINGS_FILE environment variable. The file is
+        updated as tasks complete so it is usable even if the run is killed.
+    requirements:
+      - whitelisting in configuration
+'''
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'cloudlaunch_timings'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self.path = os.environ.get('CLOUDLAUNCH_TIMINGS_FILE')
+        self.tasks = []
+        self.failed_task = None
+        self._started = {}
+
+    def _start(self, task, handler=False):
+        self._started[task._uuid] = (time.time(), handler)
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._start(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._start(task, handler=True)
+
+    def _record(self, result, status):
+        task = result._task
+        started, handler = self._started.get(task._uuid, (time.time(), False))
+        self.tasks.append({
+            'name': task.get_name(),
+            'host': result._host.get_name(),
+            'status': status,
+            'handler': handler,
+            'duration': round(time.time() - started, 3)})
+        if status in ('failed', 'unreachable') and not self.failed_task:
+            self.failed_task = {'name': task.get_name(), 'handler': handler}
+        self._write()
+
+    def _write(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'tasks': self.tasks, 'failed_task': self.failed_task},
+                      f)
+        os.rename(tmp_path, self.path)
+
+    def v2_runner_on_ok(self, result):
+        self._record(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result, 'ignored' if ignore_errors else 'failed')
+
+    def v2_runner_on_unreachable(self, result):
+        self._record(result, 'unreachable')
+
+    def v2_runner_on_skipped(self, result):
+        self._record(result, 'skipped')
@@ -1,5 +1,6 @@
 """interface for app plugins."""
 import abc
+import copy
 
 
 class AppPlugin():
@@ -139,8 +140,9 @@ class AppPlugin():
                                                     this appliance
                                 * ``ssh_user``: User name with which to access
                                                 the host(s)
-                                * ``ssh_public_key``: Public RSA ssh key to be
-                                                      used when running the app
+                                * ``ssh_public_key``: Public ssh key (Ed25519
+                                                      by default) to be used
+                                                      when running the app
                                                       configuration step. This
                                                       should be the actual key.
                                                       CloudLaunch will auto-gen
@@ -151,19 +153,65 @@ class AppPlugin():
                                                       CloudLaunch's public key
                                                       but this value should not
                                                       be supplied.
-                                * ``ssh_private_key``: Private portion of an
-                                                       RSA ssh key. This should
+                                * ``ssh_private_key``: Private portion of the
+                                                       ssh key. This should
                                                        not be supplied by a
                                                        user and is intended
                                                        only for internal use.
                                 * ``run_cmd``: A list of strings with commands
                                                to run upon system boot.
+                                * ``baked_images``: A dict of the IDs of images
+                                                    baked from configured
+                                                    hosts, keyed by the hash
+                                                    of their configuration.
+                                                    A launch with a matching
+                                                    configuration boots the
+                                                    baked image instead.
 
         :rtype: ``dict``
         :return: Results of the deployment process.
         """
         pass
 
+    def deploy_batch(self, names, tasks, app_config, provider_config):
+        """
+        Deploy several identical instances of this app plugin.
+
+        The default implementation simply calls ``deploy`` for each name in
+        turn. Plugins can override this method to share work, such as
+        resource lookups, between the deployments of a batch.
+
+        @type  names: ``list`` of ``str``
+        @param names: Names of the deployments in this batch.
+
+        @type  tasks: ``list`` of :class:`Task`
+        @param tasks: A Task object for each deployment, in the same order as
+                      ``names``, used to report the progress of that
+                      deployment.
+
+        @type  app_config: ``dict``
+        @param app_config: The appliance configuration shared by all the
+                           deployments. See ``deploy`` for details.
+
+        @type  provider_config: ``dict``
+        @param provider_config: The infrastructure provider details shared by
+                                all the deployments. See ``deploy`` for
+                                details.
+
+        :rtype: ``list``
+        :return: The result of ``deploy`` for each deployment, in the same
+                 order as ``names``. If a deployment failed, its entry is the
+                 raised exception instead.
+        """
+        results = []
+        for name, task in zip(names, tasks):
+            try:
+                results.append(self.deploy(name, task, copy.deepcopy(app_config),
+                                           dict(provider_config)))
+            except Exception as e:
+                results.append(e)
+        return results
+
     @abc.abstractmethod
     def health_check(self, provider, deployment):
         """
@@ -234,3 +282,27 @@ class AppPlugin():
         :return: The result of delete invocation.
         """
         pass
+
+    def bake(self, provider, deployment):
+        """
+        Bake the configured host of the supplied deployment into an image.
+
+        Later launches with the same configuration boot the baked image (see
+        the ``baked_images`` key of ``provider_config`` in ``deploy``). Apps
+        that can't be baked need not override this method.
+
+        @type  provider: :class:`CloudBridge.CloudProvider`
+        @param provider: Cloud provider where the supplied deployment was
+                         created.
+
+        @type  deployment: ``dict``
+        @param deployment: A dictionary describing an instance of the
+                           app deployment to be baked. The dict must have at
+                           least `launch_result` and `launch_status` keys.
+
+        :rtype: ``dict``
+        :return: The ``image_id`` of the baked image and the ``config_hash``
+                 of the configuration it was baked with.
+        """
+        raise NotImplementedError("Baking images is not supported by this "
+                                  "app")
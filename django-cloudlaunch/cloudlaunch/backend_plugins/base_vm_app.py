@@ -1,22 +1,73 @@
 """Base VM plugin implementations."""
+import asyncio
 import copy
+import hashlib
 import ipaddress
+import json
+import os
+import secrets
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+import requests.exceptions
 import tenacity
+import yaml
 
 from celery.utils.log import get_task_logger
-from cloudbridge.base.helpers import generate_key_pair
 from cloudbridge.interfaces import InstanceState
 from cloudbridge.interfaces.exceptions import CloudBridgeBaseException
 from cloudbridge.interfaces.resources import DnsRecordType
+from cloudbridge.interfaces.resources import MachineImageState
 from cloudbridge.interfaces.resources import TrafficDirection
 
+from django.conf import settings
+from django.db import connections
+
+from cloudlaunch import circuit_breaker
+from cloudlaunch import cloud_cache
 from cloudlaunch import configurers
+from cloudlaunch import instance_poller
+from cloudlaunch import locks
+from cloudlaunch import ssh_keys
+from cloudlaunch import util
+from cloudlaunch.http_prober import HttpReadinessProber
 
 from .app_plugin import AppPlugin
 
 log = get_task_logger('cloudlaunch')
 
+# Stages of a launch run through ``BaseVMAppPlugin.run_launch_stage``
+LAUNCH_PROVISION = 'PROVISION'
+LAUNCH_WAIT_READY = 'WAIT_READY'
+LAUNCH_CONFIGURE = 'CONFIGURE'
+LAUNCH_WAIT_CONFIGURED = 'WAIT_CONFIGURED'
+LAUNCH_WAIT_HTTP = 'WAIT_HTTP'
+LAUNCH_DONE = 'DONE'
+
+# Seconds between instance state checks during a staged launch
+LAUNCH_POLL_INTERVAL = 5
+# Seconds to wait for an instance to become ready during a staged launch
+INSTANCE_READY_TIMEOUT = 600
+# Seconds to wait for a host configured during boot to report its outcome
+BOOT_CONFIGURE_TIMEOUT = 3600
+# Seconds between and maximum number of http checks during a staged launch
+HTTP_POLL_INTERVAL = 5
+HTTP_MAX_POLLS = 200
+# Seconds to wait for an app to answer a single http check
+HTTP_CHECK_TIMEOUT = 10
+# Seconds between instance state checks during a deletion, and seconds after
+# which, and up to how many times, the deletion of an instance that still
+# exists is requested again
+DELETE_POLL_INTERVAL = 5
+DELETE_RETRY_INTERVAL = 60
+DELETE_MAX_ATTEMPTS = 7
+# Seconds between image state checks while baking an image, and seconds to
+# wait for the image to become available
+BAKE_POLL_INTERVAL = 30
+BAKE_TIMEOUT = 3 * 3600
+
 
 class InstanceNotDeleted(Exception):
     pass
@@ -43,12 +94,20 @@ class BaseVMAppPlugin(AppPlugin):
 
     def _get_or_create_kp(self, provider, kp_name):
         """Get or create an SSH key pair with the supplied name."""
-        kps = provider.security.key_pairs.find(name=kp_name)
-        if kps:
-            return kps[0]
-        else:
-            log.debug("Creating key pair {0}".format(kp_name))
-            return provider.security.key_pairs.create(name=kp_name)
+        cache = cloud_cache.get_cache()
+        kp = cache.get(provider, 'key_pair', kp_name)
+        if kp:
+            return kp
+        with locks.lock(provider, 'key_pair:%s' % kp_name):
+            kps = provider.security.key_pairs.find(name=kp_name)
+            if kps:
+                cache.put(provider, 'key_pair', kp_name, kps[0])
+                return kps[0]
+            else:
+                log.debug("Creating key pair {0}".format(kp_name))
+                # Not cached: the private key material of a new key pair must
+                # only be reported to the launch that created it
+                return provider.security.key_pairs.create(name=kp_name)
 
     def _get_or_create_vmf(self, provider, subnet, vmf_name, description):
         """
@@ -59,6 +118,19 @@ class BaseVMAppPlugin(AppPlugin):
         """
         # Check for None in case of NeCTAR
         network_id = subnet.network_id if subnet else None
+        cache = cloud_cache.get_cache()
+        vmf = cache.get(provider, 'vm_firewall', (vmf_name, network_id))
+        if vmf:
+            return vmf
+        with locks.lock(provider, 'vm_firewall:%s' % vmf_name):
+            vmf = self._find_or_create_vmf(provider, network_id, vmf_name,
+                                           description)
+        cache.put(provider, 'vm_firewall', (vmf_name, network_id), vmf)
+        return vmf
+
+    def _find_or_create_vmf(self, provider, network_id, vmf_name,
+                            description):
+        """Look up a VM firewall for ``_get_or_create_vmf`` or create one."""
         vmfs = provider.security.vm_firewalls.find(label=vmf_name)
         # First, look for firewall with the same associated network
         vm = None
@@ -217,6 +289,33 @@ class BaseVMAppPlugin(AppPlugin):
         sn = provider.networking.subnets.get_or_create_default()
         return sn
 
+    def _get_or_create_router(self, provider, subnet):
+        """Fetch a router attached to the subnet or create one."""
+        # This will allow to re-use a router when subnets from multiple networks are attached to it
+        # xref: https://github.com/galaxyproject/cloudlaunch/pull/261
+        if provider.PROVIDER_ID == 'openstack':
+            found_routers = [router for router in provider.networking.routers
+                             if subnet.network_id in [port.network_id for port in
+                                                      provider.os_conn.list_ports(filters={'device_id': self.id})]]
+        else:
+            found_routers = [router for router in provider.networking.routers
+                             if router.network_id == subnet.network_id]
+        # Check if the subnet's network is connected to a router
+        router = None
+        for r in found_routers:
+            is_attached = bool([sn for sn in r.subnets
+                                if sn.id == subnet.id])
+            if is_attached:
+                router = r
+                break
+        # Create a new router if not
+        if not router:
+            router_name = 'cl-router-%s' % subnet.network.name
+            log.debug("Creating CloudLaunch router %s", router_name)
+            router = provider.networking.routers.create(
+                label=router_name, network=subnet.network_id)
+        return router
+
     def _setup_networking(self, provider, net_id, subnet_id, placement):
         log.debug("Setting up networking for net %s, sn %s, in zone %s",
                   net_id, subnet_id, placement)
@@ -227,40 +326,21 @@ class BaseVMAppPlugin(AppPlugin):
                 provider, net_id, placement)
         # Make sure the subnet has Internet connectivity
         try:
-            # This will allow to re-use a router when subnets from multiple networks are attached to it
-            # xref: https://github.com/galaxyproject/cloudlaunch/pull/261
-            if provider.PROVIDER_ID == 'openstack':
-                found_routers = [router for router in provider.networking.routers
-                                 if subnet.network_id in [port.network_id for port in
-                                                          provider.os_conn.list_ports(filters={'device_id': self.id})]]
-            else:
-                found_routers = [router for router in provider.networking.routers
-                                 if router.network_id == subnet.network_id]
-            # Check if the subnet's network is connected to a router
-            router = None
-            for r in found_routers:
-                is_attached = bool([sn for sn in r.subnets
-                                    if sn.id == subnet.id])
-                if is_attached:
-                    router = r
-                    break
-            # Create a new router if not
-            if not router:
-                router_name = 'cl-router-%s' % subnet.network.name
-                log.debug("Creating CloudLaunch router %s", router_name)
-                router = provider.networking.routers.create(
-                    label=router_name, network=subnet.network_id)
-
-            # Attach a gateway to the router
-            net = provider.networking.networks.get(subnet.network_id)
-            log.debug("Creating inet gateway for net %s", net.id)
-            gw = net.gateways.get_or_create()
-            router.attach_gateway(gw)
-            try:
-                for sn in subnet.network.subnets:
-                    router.attach_subnet(sn)
-            except Exception as e:
-                log.debug("Couldn't attach subnet; ignoring: %s", e)
+            # Serialize the setup of the router of a network; until its
+            # subnets are attached, other launches wouldn't find the router
+            with locks.lock(provider, 'router:%s' % subnet.network_id):
+                router = self._get_or_create_router(provider, subnet)
+
+                # Attach a gateway to the router
+                net = provider.networking.networks.get(subnet.network_id)
+                log.debug("Creating inet gateway for net %s", net.id)
+                gw = net.gateways.get_or_create()
+                router.attach_gateway(gw)
+                try:
+                    for sn in subnet.network.subnets:
+                        router.attach_subnet(sn)
+                except Exception as e:
+                    log.debug("Couldn't attach subnet; ignoring: %s", e)
         except Exception as e:
             # Creating a router/gateway may not work with classic
             # networking so ignore errors if they occur.
@@ -295,45 +375,239 @@ class BaseVMAppPlugin(AppPlugin):
                 provider, subnet, cloudlaunch_config['firewall'])
         return subnet, placement, vmf
 
-    def deploy(self, name, task, app_config, provider_config):
-        """See the parent class in ``app_plugin.py`` for the docstring."""
+    def _prepare_launch(self, name, task, app_config, provider_config):
+        """
+        Make any app-specific changes to the configs before a launch.
+
+        Called once per launch, before anything is provisioned. Plugins can
+        override this method to, for example, format ``cloud_user_data``.
+        """
+        pass
+
+    def _finalize_launch(self, result, app_config):
+        """
+        Add any app-specific values to the result of a launch.
+
+        Called once the host has been provisioned and configured.
+
+        :rtype: ``dict``
+        :return: The (possibly updated) launch result.
+        """
+        return result
+
+    def _get_http_check(self, result):
+        """
+        Describe the http check that signals the launched app is ready.
+
+        :rtype: ``tuple``
+        :return: A ``(url, ok_status_codes)`` tuple, or ``None`` if the app
+                 does not need to be waited on. See ``wait_for_http`` for
+                 the meaning of ``ok_status_codes``.
+        """
+        return None
+
+    def check_http(self, url, ok_status_codes=None):
+        """
+        Check once whether the app is responding at http URL.
+
+        :type ok_status_codes: ``list`` of int
+        :param ok_status_codes: List of HTTP status codes that are considered
+                                OK by the appliance. Code 200 is assumed.
+
+        :rtype: ``bool``
+        :return: ``True`` if the app responded with an OK status code;
+                 ``False`` if it responded otherwise, or not within
+                 ``HTTP_CHECK_TIMEOUT`` seconds, or the request failed.
+        """
+        if ok_status_codes is None:
+            ok_status_codes = [401, 403]
+        try:
+            r = requests.head(url, verify=False, timeout=HTTP_CHECK_TIMEOUT)
+            r.raise_for_status()
+            return True
+        except requests.exceptions.HTTPError as http_exc:
+            return http_exc.response.status_code in ok_status_codes
+        except requests.exceptions.RequestException as e:
+            log.debug("HTTP check of %s failed: %s", url, e)
+            return False
+
+    def wait_for_http(self, url, ok_status_codes=None, max_retries=200,
+                      poll_interval=5):
+        """
+        Wait till app is responding at http URL.
+
+        The URL is probed with an exponential, jittered backoff capped at
+        ``poll_interval`` seconds for up to ``max_retries * poll_interval``
+        seconds in total.
+
+        :type ok_status_codes: ``list`` of int
+        :param ok_status_codes: List of HTTP status codes that are considered
+                                OK by the appliance. Code 200 is assumed.
+
+        :rtype: ``bool``
+        :return: ``True`` if the app became ready before the time ran out.
+        """
+        prober = HttpReadinessProber(max_delay=poll_interval)
+
+        async def _wait():
+            async with prober.create_session() as session:
+                return await prober.wait_for(
+                    session, url, ok_status_codes,
+                    timeout=max_retries * poll_interval)
+
+        return asyncio.run(_wait())
+
+    def _create_host_config(self, app_config):
+        """Compose the host config used to configure a provisioned host."""
+        host_config = {}
+        if not app_config.get('config_appliance'):
+            return host_config
+        configurer = self._get_configurer(app_config)
+        if configurer.configures_at_boot:
+            # The host configures itself while booting and reports back to
+            # the phone-home endpoint
+            token = secrets.token_urlsafe(32)
+            host_config = {
+                'phone_home_token': token,
+                'cloud_config': configurer.render_cloud_config(
+                    app_config, util.get_phone_home_url(token))
+            }
+        else:
+            # Host config will take place; get a tmp ssh config key
+            public_key, private_key = ssh_keys.get_key_pair()
+            host_config = {
+                'ssh_private_key': private_key,
+                'ssh_public_key': public_key,
+                'ssh_user': app_config.get(
+                    'config_appliance', {}).get('sshUser'),
+                'run_cmd': app_config.get(
+                    'config_appliance', {}).get('runCmd')
+            }
+        return host_config
+
+    def _get_config_hash(self, app_config, image_id):
+        """
+        Hash the inputs that determine the configured state of a host.
+
+        The hash covers the image the host is launched from and the
+        appliance configuration (e.g., the playbooks and their vars). Note
+        that playbooks are identified by their repository and ``ref`` so apps
+        should pin ``ref`` to a commit for baked images to match the
+        playbooks exactly.
+
+        :rtype: ``str``
+        :return: The hex digest of the configuration inputs or ``None`` if
+                 hosts of this app can't be baked into an image, which is the
+                 case if they are not configured, configure themselves during
+                 boot, or are configured by a customized configurer.
+        """
+        config_appliance = app_config.get('config_appliance')
+        if (not config_appliance or not image_id or
+                type(self)._configure_host is not
+                BaseVMAppPlugin._configure_host):
+            return None
+        try:
+            configurer = self._get_configurer(app_config)
+        except Exception:
+            return None
+        if type(configurer).configure not in (
+                configurers.AnsibleAppConfigurer.configure,
+                configurers.ScriptAppConfigurer.configure):
+            return None
+        inputs = {'image_id': image_id, 'config_appliance': config_appliance}
+        return hashlib.sha256(
+            json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _get_baked_image(self, app_config, provider_config):
+        """
+        Look up an image baked with the configuration of a launch.
+
+        Baked images are supplied as a ``{config_hash: image_id}`` dict under
+        the ``baked_images`` key of ``provider_config``.
+
+        :rtype: ``tuple``
+        :return: The config hash of the launch and the ID of the matching
+                 baked image. Either may be ``None``.
+        """
+        cloud_config = provider_config.get('cloud_config') or {}
+        image_id = (app_config.get('config_cloudlaunch', {}).get(
+            'customImageID') or cloud_config.get('image', {}).get('image_id'))
+        config_hash = self._get_config_hash(app_config, image_id)
+        baked_images = provider_config.get('baked_images') or {}
+        return config_hash, baked_images.get(config_hash)
+
+    def _skips_configure(self, app_config, p_result):
+        """
+        Whether the configuration of a provisioned host can be skipped.
+
+        This is the case for hosts booted from a baked image unless the app
+        sets ``rerunOnBakedImage`` in its ``config_appliance``.
+        """
+        return bool(p_result.get('cloudLaunch', {}).get('bakedImageID') and
+                    not app_config.get('config_appliance', {}).get(
+                        'rerunOnBakedImage'))
+
+    def _update_host_config(self, host_config, p_result):
+        """Record the address details of a provisioned host."""
+        host_config['host_address'] = p_result['cloudLaunch'].get(
+            'hostname')
+        host_config['public_ip'] = p_result['cloudLaunch'].get(
+            'publicIP')
+        host_config['private_ip'] = p_result['cloudLaunch'].get(
+            'private_ip')
+        host_config['instance_id'] = p_result['cloudLaunch'].get(
+            'instance').get('id')
+
+    def deploy(self, name, task, app_config, provider_config, **kwargs):
+        """
+        See the parent class in ``app_plugin.py`` for the docstring.
+
+        Pass boolean ``check_http`` as a ``False`` kwarg if you don't
+        want this method to wait for the app http check and prefer to handle
+        it in the child class.
+
+        The launch is checkpointed through ``task.checkpoint`` once the
+        instance has been requested, once its IP address and hostname have
+        been assigned and once the host has been configured. A launch whose
+        task is redelivered after its worker was lost resumes from its last
+        checkpoint, with the app config and host config it was started with,
+        instead of launching another instance.
+        """
         p_result = {}
         c_result = {}
-        app_config['deployment_config'] = {
-            'name': name
-        }
+        checkpoint = task.get_checkpoint()
+        if checkpoint.get('app_config'):
+            log.info("Resuming launch of %s from its last checkpoint", name)
+            self._check_resumable(task, provider_config, checkpoint)
+            app_config.clear()
+            app_config.update(checkpoint['app_config'])
+        else:
+            app_config['deployment_config'] = {
+                'name': name
+            }
+            self._prepare_launch(name, task, app_config, provider_config)
         if provider_config.get('host_config'):
             # A host is provided; use CloudLaunch's default published ssh key
-            pass  # Implement this once we actually support it
+            host_config = provider_config['host_config']
         else:
-            host_config = {}
-            if app_config.get('config_appliance'):
-                # Host config will take place; generate a tmp ssh config key
-                public_key, private_key = generate_key_pair()
-                host_config = {
-                    'ssh_private_key': private_key,
-                    'ssh_public_key': public_key,
-                    'ssh_user': app_config.get(
-                        'config_appliance', {}).get('sshUser'),
-                    'run_cmd': app_config.get(
-                        'config_appliance', {}).get('runCmd')
-                }
+            host_config = checkpoint.get('host_config')
+            if host_config is None:
+                host_config = self._create_host_config(app_config)
+            if host_config:
                 provider_config['host_config'] = host_config
             p_result = self._provision_host(name, task, app_config,
                                             provider_config)
-            host_config['host_address'] = p_result['cloudLaunch'].get(
-                'hostname')
-            host_config['public_ip'] = p_result['cloudLaunch'].get(
-                'publicIP')
-            host_config['private_ip'] = p_result['cloudLaunch'].get(
-                'private_ip')
-            host_config['instance_id'] = p_result['cloudLaunch'].get(
-                'instance').get('id')
-
-        if app_config.get('config_appliance'):
+            self._update_host_config(host_config, p_result)
+
+        if (app_config.get('config_appliance') and
+                not self._skips_configure(app_config, p_result)):
             try:
-                c_result = self._configure_host(name, task, app_config,
-                                                provider_config)
+                if 'configured' in checkpoint:
+                    c_result = checkpoint['configured']
+                else:
+                    c_result = self._configure_host(name, task, app_config,
+                                                    provider_config)
+                    task.checkpoint(configured=c_result)
             except Exception:
                 # cleanup instance
                 if host_config.get('instance_id'):
@@ -343,15 +617,288 @@ class BaseVMAppPlugin(AppPlugin):
                     self._cleanup_instance(
                         provider, host_config['instance_id'], hostname_config)
                 raise
+        return self._complete_launch(task, app_config, p_result, c_result,
+                                     kwargs.get('check_http', True))
+
+    def _check_resumable(self, task, provider_config, checkpoint):
+        """
+        Count the resumes of a launch and give up on one resumed too often.
+
+        A launch that keeps losing its worker, e.g., because the worker runs
+        out of memory while configuring the host, is failed after
+        ``CLOUDLAUNCH_LAUNCH_MAX_RESUMES`` resumes and its instance deleted.
+        """
+        resumes = checkpoint.get('resumes', 0) + 1
+        if resumes <= settings.CLOUDLAUNCH_LAUNCH_MAX_RESUMES:
+            task.checkpoint(resumes=resumes)
+            return
+        if checkpoint.get('instance_id'):
+            # Only remove the hostname if it was configured by this launch
+            hostname_config = (
+                checkpoint['app_config'].get('config_cloudlaunch', {}).get(
+                    'hostnameConfig') if 'hostname' in checkpoint else None)
+            self._cleanup_instance(provider_config.get('cloud_provider'),
+                                   checkpoint['instance_id'], hostname_config)
+        raise Exception("The launch was interrupted %s times; giving up" %
+                        (resumes - 1))
+
+    def _complete_launch(self, task, app_config, p_result, c_result,
+                         check_http=True):
+        """
+        Compose the result of a provisioned and configured launch.
+
+        Unless ``check_http`` is ``False``, wait for the app http check.
+        """
         # Merge result dicts; right-most dict keys take precedence
-        return {'cloudLaunch': {**p_result.get('cloudLaunch', {}),
-                                **c_result.get('cloudLaunch', {})}}
+        result = self._finalize_launch(
+            {'cloudLaunch': {**p_result.get('cloudLaunch', {}),
+                             **c_result.get('cloudLaunch', {})}},
+            app_config)
+        http_check = self._get_http_check(result)
+        if http_check and check_http:
+            url, ok_status_codes = http_check
+            task.update_state(
+                state='PROGRESSING',
+                meta={"action": "Waiting for application to become ready at "
+                                "%s" % url})
+            log.info("Waiting on http at %s", url)
+            self.wait_for_http(url, ok_status_codes=ok_status_codes)
+        return result
+
+    @property
+    def supports_staged_launch(self):
+        """
+        Whether this plugin can be launched through ``run_launch_stage``.
+
+        Plugins that customize ``deploy`` itself must be launched in one go
+        because the staged launch does not go through ``deploy``.
+        """
+        return type(self).deploy is BaseVMAppPlugin.deploy
+
+    def run_launch_stage(self, name, task, app_config, provider_config,
+                         launch_state):
+        """
+        Run the next step of a launch split into resumable stages.
+
+        A staged launch goes through the same steps as ``deploy`` but never
+        blocks while waiting: each call performs one short step and returns
+        the updated launch state. The caller is expected to persist the
+        state and call this method again, after ``launch_state['countdown']``
+        seconds, until ``launch_state['stage']`` is ``LAUNCH_DONE``, at which
+        point ``launch_state['result']`` holds the launch result.
+
+        The stages are, in order: ``LAUNCH_PROVISION`` (request an instance),
+        ``LAUNCH_WAIT_READY`` (poll until the instance is ready),
+        ``LAUNCH_CONFIGURE`` (configure the host) and ``LAUNCH_WAIT_HTTP``
+        (poll until the app responds over http). While in the latter stage,
+        ``launch_state['http_check']`` holds the ``(url, ok_status_codes)``
+        being polled so the caller may choose to wait on the app itself.
+
+        A host that configures itself during boot (see
+        ``AppConfigurer.configures_at_boot``) goes through
+        ``LAUNCH_WAIT_CONFIGURED`` instead of ``LAUNCH_CONFIGURE``. The host
+        reports back to the phone-home URL identified by
+        ``launch_state['phone_home_token']``; the caller is expected to pass
+        the report on, as a ``{'status': ..., 'output': ...}`` dict in
+        ``launch_state['phone_home']``, once it has been received.
+
+        @type  launch_state: ``dict``
+        @param launch_state: A JSON-serializable dict carrying the launch
+                             state between calls. Use an empty dict for a new
+                             launch.
+
+        :rtype: ``dict``
+        :return: The updated launch state.
+        """
+        stage = launch_state.get('stage', LAUNCH_PROVISION)
+        provider = provider_config.get('cloud_provider')
+        cloudlaunch_config = app_config.get("config_cloudlaunch", {})
+        if launch_state.get('host_config'):
+            provider_config['host_config'] = launch_state['host_config']
+        launch_state['countdown'] = 0
+        try:
+            if stage == LAUNCH_PROVISION:
+                checkpoint = task.get_checkpoint()
+                if checkpoint.get('launch_state'):
+                    # The instance was requested before this stage was
+                    # redelivered
+                    app_config.clear()
+                    app_config.update(checkpoint['app_config'])
+                    return checkpoint['launch_state']
+                app_config['deployment_config'] = {
+                    'name': name
+                }
+                self._prepare_launch(name, task, app_config, provider_config)
+                host_config = self._create_host_config(app_config)
+                if host_config:
+                    provider_config['host_config'] = host_config
+                inst, launch_info = self._launch_instance(
+                    name, task, app_config, provider_config)
+                launch_state.update({
+                    'stage': LAUNCH_WAIT_READY,
+                    'instance_id': inst.id,
+                    'host_config': host_config,
+                    'launch_info': launch_info,
+                    'deadline': time.time() + INSTANCE_READY_TIMEOUT,
+                    'countdown': LAUNCH_POLL_INTERVAL})
+                if host_config.get('phone_home_token'):
+                    launch_state['phone_home_token'] = \
+                        host_config['phone_home_token']
+                task.checkpoint(app_config=app_config,
+                                launch_state=launch_state)
+            elif stage == LAUNCH_WAIT_READY:
+                state = instance_poller.get_poller().get_state(
+                    provider, launch_state['instance_id'])
+                if not self._is_instance_ready(launch_state['instance_id'],
+                                               state):
+                    if time.time() > launch_state['deadline']:
+                        raise Exception(
+                            "Timed out waiting for instance %s to become "
+                            "ready" % launch_state['instance_id'])
+                    launch_state['countdown'] = LAUNCH_POLL_INTERVAL
+                    return launch_state
+                inst = provider.compute.instances.get(
+                    launch_state['instance_id'])
+                p_result = self._complete_provisioning(
+                    provider, task, inst, cloudlaunch_config,
+                    launch_state['launch_info'])
+                self._update_host_config(launch_state['host_config'], p_result)
+                launch_state['result'] = p_result
+                if launch_state.get('phone_home_token'):
+                    task.update_state(
+                        state='PROGRESSING',
+                        meta={'action': 'Configuring application while the '
+                                        'instance boots...'})
+                    launch_state.update({
+                        'stage': LAUNCH_WAIT_CONFIGURED,
+                        'deadline': time.time() + BOOT_CONFIGURE_TIMEOUT,
+                        'countdown': LAUNCH_POLL_INTERVAL})
+                elif (app_config.get('config_appliance') and
+                        not self._skips_configure(app_config, p_result)):
+                    launch_state['stage'] = LAUNCH_CONFIGURE
+                else:
+                    self._start_launch_http_wait(task, app_config,
+                                                 launch_state)
+            elif stage == LAUNCH_CONFIGURE:
+                checkpoint = task.get_checkpoint()
+                if 'configured' in checkpoint:
+                    c_result = checkpoint['configured']
+                else:
+                    c_result = self._configure_host(name, task, app_config,
+                                                    provider_config)
+                    task.checkpoint(configured=c_result)
+                # Merge result dicts; right-most dict keys take precedence
+                launch_state['result'] = {'cloudLaunch': {
+                    **launch_state['result'].get('cloudLaunch', {}),
+                    **c_result.get('cloudLaunch', {})}}
+                self._start_launch_http_wait(task, app_config, launch_state)
+            elif stage == LAUNCH_WAIT_CONFIGURED:
+                phone_home = launch_state.pop('phone_home', None)
+                if not phone_home:
+                    if time.time() > launch_state['deadline']:
+                        raise Exception(
+                            "Timed out waiting for instance %s to report its "
+                            "configuration" % launch_state['instance_id'])
+                    launch_state['countdown'] = LAUNCH_POLL_INTERVAL
+                    return launch_state
+                self._record_boot_configure_report(task, phone_home)
+                self._start_launch_http_wait(task, app_config, launch_state)
+            elif stage == LAUNCH_WAIT_HTTP:
+                if (launch_state['http_polls'] < HTTP_MAX_POLLS and
+                        not self.check_http(*launch_state['http_check'])):
+                    launch_state['http_polls'] += 1
+                    launch_state['countdown'] = HTTP_POLL_INTERVAL
+                else:
+                    launch_state['stage'] = LAUNCH_DONE
+            else:
+                raise ValueError("Unknown launch stage: %s" % stage)
+        except Exception:
+            if launch_state.get('instance_id'):
+                # Only remove the hostname if it was configured by this launch
+                hostname_config = (cloudlaunch_config.get('hostnameConfig')
+                                   if stage in (LAUNCH_CONFIGURE,
+                                                LAUNCH_WAIT_CONFIGURED)
+                                   else None)
+                self._cleanup_instance(provider, launch_state['instance_id'],
+                                       hostname_config)
+            raise
+        return launch_state
+
+    def _record_boot_configure_report(self, task, phone_home):
+        """
+        Record the report of a host configured during boot.
+
+        The reported output is archived as the configuration output of the
+        task. Raise an exception if the configuration failed.
+        """
+        output = configurers.ConfigurerOutput(
+            log_path=util.get_task_log_path(task.id))
+        for line in (phone_home.get('output') or '').splitlines():
+            output.write(line)
+        output.close()
+        if phone_home['status'] != 0:
+            msg = ("Configuration failed with exit status {0}. Last output "
+                   "lines were: {1}".format(phone_home['status'],
+                                            output.tail(10)))
+            task.update_state(state='ERROR', meta={'action': msg})
+            raise Exception(msg)
+        task.update_state(
+            state='PROGRESSING',
+            meta={'action': 'Application configuration completed '
+                            'successfully.'})
+
+    def _start_launch_http_wait(self, task, app_config, launch_state):
+        launch_state['result'] = self._finalize_launch(
+            launch_state['result'], app_config)
+        http_check = self._get_http_check(launch_state['result'])
+        if http_check:
+            task.update_state(
+                state='PROGRESSING',
+                meta={"action": "Waiting for application to become ready at "
+                                "%s" % http_check[0]})
+            launch_state['stage'] = LAUNCH_WAIT_HTTP
+            launch_state['http_check'] = list(http_check)
+            launch_state['http_polls'] = 0
+            launch_state['countdown'] = HTTP_POLL_INTERVAL
+        else:
+            launch_state['stage'] = LAUNCH_DONE
+
+    def _is_instance_ready(self, instance_id, state):
+        """
+        Check, without waiting, whether a launched instance is ready.
+
+        Raise an exception if the instance can no longer become ready.
+
+        :type state: ``str``
+        :param state: The ``InstanceState`` of the instance, ``UNKNOWN`` if
+                      it no longer exists (see
+                      ``InstanceStatePoller.get_state``).
+        """
+        if state == InstanceState.RUNNING:
+            return True
+        elif state in (InstanceState.ERROR, InstanceState.DELETED,
+                       InstanceState.UNKNOWN):
+            raise Exception("Instance %s is in state %s" % (instance_id,
+                                                           state))
+        return False
+
+    def _get_image(self, provider, image_id):
+        """Get an image, through the cache of cloud resource lookups."""
+        return cloud_cache.get_cache().get_or_lookup(
+            provider, 'image', image_id,
+            lambda: provider.compute.images.get(image_id))
+
+    def _get_dns_zone(self, provider, zone_id):
+        """Get a DNS zone, through the cache of cloud resource lookups."""
+        return cloud_cache.get_cache().get_or_lookup(
+            provider, 'dns_zone', zone_id,
+            lambda: provider.dns.host_zones.get(zone_id))
 
     def _cleanup_hostname(self, provider, hostname_config):
         if hostname_config and hostname_config.get('hostnameType') == 'cloud_dns':
             dns_zone = hostname_config.get('dnsZone')
             dns_rec_name = hostname_config.get('dnsRecordName')
-            dns_zone = provider.dns.host_zones.get(dns_zone.get('id'))
+            dns_zone = self._get_dns_zone(provider, dns_zone.get('id'))
             host_name = (dns_rec_name + "." + dns_zone.name
                          if dns_rec_name else dns_zone.name)
             try:
@@ -366,6 +913,9 @@ class BaseVMAppPlugin(AppPlugin):
 
     @tenacity.retry(stop=tenacity.stop_after_attempt(7),
                     wait=tenacity.wait_exponential(multiplier=1, min=4, max=256),
+                    # Retrying is pointless while the cloud is unavailable
+                    retry=tenacity.retry_if_not_exception_type(
+                        circuit_breaker.CloudUnavailable),
                     reraise=True,
                     after=lambda *args, **kwargs: log.debug("Node not deleted, retrying..."))
     def _cleanup_instance(self, provider, instance_id, hostname_config):
@@ -378,8 +928,10 @@ class BaseVMAppPlugin(AppPlugin):
         inst = provider.compute.instances.get(instance_id)
         if inst:
             inst.delete()
-            inst.wait_for([InstanceState.DELETED, InstanceState.UNKNOWN],
-                          terminal_states=[InstanceState.ERROR])
+            instance_poller.get_poller().wait_for(
+                provider, instance_id,
+                [InstanceState.DELETED, InstanceState.UNKNOWN],
+                terminal_states=[InstanceState.ERROR])
 
         # instance should no longer exist
 
@@ -392,19 +944,34 @@ class BaseVMAppPlugin(AppPlugin):
             raise InstanceNotDeleted(
                 f"Instance {instance_id} should have been deleted but still exists.")
 
-    def _provision_host(self, name, task, app_config, provider_config):
-        """Provision a host using the provider_config info."""
-        cloudlaunch_config = app_config.get("config_cloudlaunch", {})
-        provider = provider_config.get('cloud_provider')
-        extra_provider_args = provider_config.get('extra_provider_args') or {}
-        cloud_config = provider_config.get('cloud_config')
-        host_config = provider_config.get('host_config', {})
-        user_data = provider_config.get('cloud_user_data') or ""
-        user_data = user_data if isinstance(user_data, str) else ""
+    def _resolve_launch_resources(self, task, provider, cloud_config,
+                                  cloudlaunch_config, baked_image_id=None):
+        """
+        Look up or create the cloud resources an instance is launched with.
+
+        The returned resources depend only on the app and cloud configuration
+        so they can be resolved once and shared between multiple launches
+        via the ``launch_resources`` key of ``provider_config``.
 
-        custom_image_id = cloudlaunch_config.get("customImageID", None)
-        img = provider.compute.images.get(
-            custom_image_id or cloud_config.get('image', {}).get('image_id'))
+        If ``baked_image_id`` is supplied and the image still exists, it is
+        used instead of the configured image.
+
+        :rtype: ``dict``
+        :return: A dict with ``image``, ``key_pair``, ``subnet``,
+                 ``placement_zone``, ``vm_firewalls`` and ``launch_config``
+                 keys.
+        """
+        img = None
+        if baked_image_id:
+            img = self._get_image(provider, baked_image_id)
+            if not img:
+                log.warning("Baked image %s no longer exists; launching from "
+                            "the configured image", baked_image_id)
+        if not img:
+            custom_image_id = cloudlaunch_config.get("customImageID", None)
+            img = self._get_image(
+                provider, custom_image_id or
+                cloud_config.get('image', {}).get('image_id'))
         task.update_state(state='PROGRESSING',
                           meta={'action': "Retrieving or creating a key pair"})
         kp = self._get_or_create_kp(provider,
@@ -416,10 +983,246 @@ class BaseVMAppPlugin(AppPlugin):
             provider, cloudlaunch_config)
         cb_launch_config = self._get_cb_launch_config(provider, img,
                                                       cloudlaunch_config)
+        return {'image': img,
+                'key_pair': kp,
+                'subnet': subnet,
+                'placement_zone': placement_zone,
+                'vm_firewalls': vmfl,
+                'launch_config': cb_launch_config}
+
+    def deploy_batch(self, names, tasks, app_config, provider_config):
+        """
+        Deploy several identical appliances with one resource resolution pass.
+
+        The image, key pair, firewall and network are resolved once and then
+        each deployment is provisioned and configured in its own thread.
+        CloudBridge does not expose multi-instance creates so each thread
+        issues its own (non-blocking) instance create; the waits on instance
+        readiness and the configuration steps overlap across deployments.
+
+        If the hosts can be configured together (see
+        ``_supports_batch_configure``), all of them are configured by a
+        single configurer run once they have been provisioned.
+
+        See ``AppPlugin.deploy_batch`` for the arguments and return value.
+        """
+        provider = provider_config.get('cloud_provider')
+        cloudlaunch_config = app_config.get("config_cloudlaunch", {})
+        batch_provider_config = dict(provider_config)
+        if not batch_provider_config.get('host_config'):
+            _, baked_image_id = self._get_baked_image(app_config,
+                                                      provider_config)
+            batch_provider_config['launch_resources'] = \
+                self._resolve_launch_resources(
+                    tasks[0], provider, provider_config.get('cloud_config'),
+                    cloudlaunch_config, baked_image_id)
+            if len(names) > 1 and self._supports_batch_configure(app_config):
+                return self._deploy_batch_configured_together(
+                    names, tasks, app_config, batch_provider_config)
+
+        def _deploy(name, task):
+            try:
+                return self.deploy(name, task, copy.deepcopy(app_config),
+                                   dict(batch_provider_config))
+            except Exception as e:
+                log.exception("Deployment %s of a batch failed", name)
+                return e
+            finally:
+                # Each thread opens its own database connections
+                connections.close_all()
+
+        max_workers = min(len(names), settings.CLOUDLAUNCH_BATCH_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_deploy, names, tasks))
+
+    def _supports_batch_configure(self, app_config):
+        """
+        Whether the hosts of a batch can be configured by a single run.
+
+        This is the case for plugins launching through the default ``deploy``
+        and ``_configure_host`` with the stock Ansible configurer, which runs
+        each playbook once for all the hosts. Configurers customized for a
+        single host, for example to pass it host specific playbook vars, are
+        run for each host instead.
+        """
+        if (not app_config.get('config_appliance') or
+                type(self).deploy is not BaseVMAppPlugin.deploy or
+                type(self)._configure_host is not
+                BaseVMAppPlugin._configure_host):
+            return False
+        try:
+            configurer = self._get_configurer(app_config)
+        except Exception:
+            # Let each deployment report the error
+            return False
+        return (type(configurer).configure is
+                configurers.AnsibleAppConfigurer.configure)
+
+    def _deploy_batch_configured_together(self, names, tasks, app_config,
+                                          provider_config):
+        """
+        Deploy a batch of appliances whose hosts are configured together.
+
+        The hosts are provisioned concurrently, as with ``deploy``, and then
+        all configured by a single configurer run (see ``_configure_hosts``)
+        before each deployment completes on its own.
+
+        See ``deploy_batch`` for the arguments and return value.
+        """
+        provider = provider_config.get('cloud_provider')
+        hostname_config = app_config.get(
+            "config_cloudlaunch", {}).get('hostnameConfig')
+
+        def _provision(name, task):
+            checkpoint = task.get_checkpoint()
+            deploy_app_config = copy.deepcopy(app_config)
+            deploy_app_config['deployment_config'] = {
+                'name': name
+            }
+            deploy_provider_config = dict(provider_config)
+            try:
+                if checkpoint.get('app_config'):
+                    # Resume the launch with the configs it was started with
+                    self._check_resumable(task, deploy_provider_config,
+                                          checkpoint)
+                    deploy_app_config = checkpoint['app_config']
+                    host_config = checkpoint['host_config']
+                else:
+                    self._prepare_launch(name, task, deploy_app_config,
+                                         deploy_provider_config)
+                    host_config = self._create_host_config(deploy_app_config)
+                deploy_provider_config['host_config'] = host_config
+                p_result = self._provision_host(name, task, deploy_app_config,
+                                                deploy_provider_config)
+            except Exception as e:
+                log.exception("Deployment %s of a batch failed", name)
+                return e
+            finally:
+                connections.close_all()
+            self._update_host_config(host_config, p_result)
+            # Identify the host by its deployment in the inventory
+            host_config['name'] = name
+            return deploy_app_config, deploy_provider_config, p_result
+
+        def _complete(launch, c_result, task):
+            deploy_app_config, _, p_result = launch
+            try:
+                return self._complete_launch(task, deploy_app_config,
+                                             p_result, c_result)
+            except Exception as e:
+                log.exception("Deployment %s of a batch failed",
+                              deploy_app_config['deployment_config']['name'])
+                return e
+            finally:
+                connections.close_all()
+
+        max_workers = min(len(names), settings.CLOUDLAUNCH_BATCH_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_provision, names, tasks))
+            provisioned = [i for i, launch in enumerate(results)
+                           if not isinstance(launch, Exception)]
+            # Hosts booted from a baked image may not need configuring
+            to_configure = [i for i in provisioned
+                            if not self._skips_configure(results[i][0],
+                                                         results[i][2])]
+            c_results = {i: {} for i in provisioned}
+            if to_configure:
+                c_results.update(zip(to_configure, self._configure_hosts(
+                    [tasks[i] for i in to_configure],
+                    results[to_configure[0]][0],
+                    [results[i][1] for i in to_configure])))
+            futures = {}
+            for i, c_result in c_results.items():
+                if isinstance(c_result, Exception):
+                    self._cleanup_instance(
+                        provider, results[i][1]['host_config']['instance_id'],
+                        hostname_config)
+                    results[i] = c_result
+                else:
+                    futures[i] = executor.submit(_complete, results[i],
+                                                 c_result, tasks[i])
+            for i, future in futures.items():
+                results[i] = future.result()
+        return results
+
+    def _provision_host(self, name, task, app_config, provider_config):
+        """
+        Provision a host using the provider_config info.
+
+        If the task's checkpoint holds an instance (see ``deploy``), the
+        provisioning of that instance is resumed instead.
+        """
+        cloudlaunch_config = app_config.get("config_cloudlaunch", {})
+        provider = provider_config.get('cloud_provider')
+        checkpoint = task.get_checkpoint()
+        if checkpoint.get('provisioned'):
+            return checkpoint['provisioned']
+        if checkpoint.get('instance_id'):
+            instance_id = checkpoint['instance_id']
+            launch_info = checkpoint['launch_info']
+            log.debug("Resuming provisioning of instance %s", instance_id)
+        else:
+            inst, launch_info = self._launch_instance(name, task, app_config,
+                                                      provider_config)
+            instance_id = inst.id
+            task.checkpoint(instance_id=instance_id, launch_info=launch_info,
+                            app_config=app_config,
+                            host_config=provider_config.get('host_config'))
+        log.debug("Waiting for instance {0} to be ready...".format(
+            instance_id))
+        try:
+            instance_poller.get_poller().wait_till_ready(provider,
+                                                         instance_id)
+            inst = provider.compute.instances.get(instance_id)
+            p_result = self._complete_provisioning(
+                provider, task, inst, cloudlaunch_config, launch_info)
+            task.checkpoint(provisioned=p_result)
+            return p_result
+        except Exception:
+            # We send a null hostname config since we don't want to delete existing
+            # hostnames
+            self._cleanup_instance(provider, instance_id, None)
+            raise
+
+    def _launch_instance(self, name, task, app_config, provider_config):
+        """
+        Issue the request to launch an instance without waiting for it.
+
+        :rtype: ``tuple``
+        :return: The launched CloudBridge instance and a JSON-serializable
+                 ``dict`` with the launch details needed to complete the
+                 provisioning once the instance is ready. See
+                 ``_complete_provisioning``.
+        """
+        cloudlaunch_config = app_config.get("config_cloudlaunch", {})
+        provider = provider_config.get('cloud_provider')
+        extra_provider_args = provider_config.get('extra_provider_args') or {}
+        cloud_config = provider_config.get('cloud_config')
+        host_config = provider_config.get('host_config', {})
+        user_data = provider_config.get('cloud_user_data') or ""
+        user_data = user_data if isinstance(user_data, str) else ""
+
+        config_hash, baked_image_id = self._get_baked_image(app_config,
+                                                            provider_config)
+        launch_resources = provider_config.get('launch_resources')
+        if not launch_resources:
+            launch_resources = self._resolve_launch_resources(
+                task, provider, cloud_config, cloudlaunch_config,
+                baked_image_id)
+        img = launch_resources['image']
+        kp = launch_resources['key_pair']
+        subnet = launch_resources['subnet']
+        placement_zone = launch_resources['placement_zone']
+        vmfl = launch_resources['vm_firewalls']
+        cb_launch_config = launch_resources['launch_config']
         vm_type = cloudlaunch_config.get('vmType')
 
         log.debug("Launching with subnet %s and VM firewalls %s", subnet, vmfl)
 
+        if host_config.get('cloud_config'):
+            log.info("Adding the app's cloud-init config to user data")
+            user_data += "\n#cloud-config\n" + yaml.safe_dump(
+                host_config['cloud_config'], default_flow_style=False)
         if host_config.get('ssh_public_key') or host_config.get(
                 'run_cmd'):
             user_data += """
@@ -445,56 +1248,89 @@ runcmd:"""
                           meta={"action": "Launching an instance of type %s "
                                           "with keypair %s in zone %s" %
                                           (vm_type, kp.name, placement_zone)})
-        inst = provider.compute.instances.create(
-            label=name, image=img, vm_type=vm_type, subnet=subnet,
-            key_pair=kp, vm_firewalls=vmfl,
-            user_data=user_data, launch_config=cb_launch_config,
-            **extra_provider_args)
+        try:
+            inst = provider.compute.instances.create(
+                label=name, image=img, vm_type=vm_type, subnet=subnet,
+                key_pair=kp, vm_firewalls=vmfl,
+                user_data=user_data, launch_config=cb_launch_config,
+                **extra_provider_args)
+        except Exception:
+            # A cached resource may have been deleted or become inaccessible
+            cloud_cache.get_cache().invalidate(provider)
+            raise
         task.update_state(state="PROGRESSING",
                           meta={"action": "Waiting for instance %s" % inst.id})
-        log.debug("Waiting for instance {0} to be ready...".format(inst.id))
-        try:
-            inst.wait_till_ready()
-            static_ip = cloudlaunch_config.get('staticIP')
-            if static_ip:
-                task.update_state(state='PROGRESSING',
-                                  meta={'action': "Assigning requested floating "
-                                                  "IP: %s" % static_ip})
-                inst.add_floating_ip(static_ip)
-                inst.refresh()
-            results = {}
-            results['keyPair'] = {'id': kp.id, 'name': kp.name,
-                                  'material': kp.material}
-            # FIXME: this does not account for multiple VM fw and expects one
-            if vmfl:
-                results['securityGroup'] = {'id': vmfl[0].id, 'name': vmfl[0].name}
-            results['instance'] = {'id': inst.id}
-            if not cloudlaunch_config.get('skip_floating_ip'):
+        launch_info = {
+            'keyPair': {'id': kp.id, 'name': kp.name, 'material': kp.material},
+            'network_id': subnet.network_id if subnet else None
+        }
+        # FIXME: this does not account for multiple VM fw and expects one
+        if vmfl:
+            launch_info['securityGroup'] = {'id': vmfl[0].id,
+                                            'name': vmfl[0].name}
+        if config_hash:
+            launch_info['configHash'] = config_hash
+            if baked_image_id and img.id == baked_image_id:
+                log.info("Launching from baked image %s", baked_image_id)
+                launch_info['bakedImageID'] = baked_image_id
+        return inst, launch_info
+
+    def _complete_provisioning(self, provider, task, inst, cloudlaunch_config,
+                               launch_info):
+        """
+        Finish provisioning an instance that has become ready.
+
+        Assign the requested IP addresses and hostname to the instance. The
+        assigned IP address and hostname are checkpointed so that a resumed
+        launch doesn't assign them again.
+
+        :rtype: ``dict``
+        :return: The provisioning results, under the ``cloudLaunch`` key.
+        """
+        checkpoint = task.get_checkpoint()
+        static_ip = cloudlaunch_config.get('staticIP')
+        if static_ip and static_ip not in inst.public_ips:
+            task.update_state(state='PROGRESSING',
+                              meta={'action': "Assigning requested floating "
+                                              "IP: %s" % static_ip})
+            inst.add_floating_ip(static_ip)
+            inst.refresh()
+        results = {}
+        results['keyPair'] = launch_info['keyPair']
+        if launch_info.get('securityGroup'):
+            results['securityGroup'] = launch_info['securityGroup']
+        results['instance'] = {'id': inst.id}
+        for key in ('configHash', 'bakedImageID'):
+            if launch_info.get(key):
+                results[key] = launch_info[key]
+        if not cloudlaunch_config.get('skip_floating_ip'):
+            results['publicIP'] = checkpoint.get('public_ip')
+            if not results['publicIP']:
                 results['publicIP'] = self._attach_public_ip(
-                    provider, inst, subnet.network_id if subnet else None)
-            results['private_ip'] = inst.private_ips[0] if inst.private_ips else results['publicIP']
-            # Configure hostname (if set)
+                    provider, inst, launch_info.get('network_id'))
+                task.checkpoint(public_ip=results['publicIP'])
+        results['private_ip'] = inst.private_ips[0] if inst.private_ips else results['publicIP']
+        # Configure hostname (if set)
+        if 'hostname' in checkpoint:
+            results['hostname'] = checkpoint['hostname']
+        else:
             results['hostname'] = self._configure_hostname(
                 provider, results['publicIP'], cloudlaunch_config.get('hostnameConfig'))
-            task.update_state(
-                state='PROGRESSING',
-                meta={"action": "Instance created successfully. " +
-                                f"Public IP: {results.get('publicIP') or results.get('private_ip')}"})
-            return {"cloudLaunch": results}
-        except Exception:
-            # We send a null hostname config since we don't want to delete existing
-            # hostnames
-            self._cleanup_instance(provider, inst.id, None)
-            raise
+            task.checkpoint(hostname=results['hostname'])
+        task.update_state(
+            state='PROGRESSING',
+            meta={"action": "Instance created successfully. " +
+                            f"Public IP: {results.get('publicIP') or results.get('private_ip')}"})
+        return {"cloudLaunch": results}
 
     def _configure_hostname(self, provider, public_ip, hostname_config):
         if not hostname_config:
             return public_ip
         elif hostname_config.get('hostnameType') == 'cloud_dns':
-            dns_zone = hostname_config.get('dnsZone')
+            dns_zone_id = hostname_config.get('dnsZone').get('id')
             dns_rec_name = hostname_config.get('dnsRecordName')
             try:
-                dns_zone = provider.dns.host_zones.get(dns_zone.get('id'))
+                dns_zone = self._get_dns_zone(provider, dns_zone_id)
                 host_name = (dns_rec_name + "." + dns_zone.name
                              if dns_rec_name else dns_zone.name)
                 dns_zone.records.create(host_name, DnsRecordType.A, [public_ip])
@@ -502,6 +1338,8 @@ runcmd:"""
                 dns_zone.records.create("*." + host_name, DnsRecordType.A, [public_ip])
                 return host_name.rstrip(".")
             except CloudBridgeBaseException:
+                cloud_cache.get_cache().invalidate(provider, 'dns_zone',
+                                                   dns_zone_id)
                 log.exception("Error while creating cloud dns records")
                 return public_ip
         elif hostname_config.get('hostnameType') == 'manual':
@@ -536,8 +1374,16 @@ runcmd:"""
             state='PROGRESSING',
             meta={'action': 'Configuring application...'}
         )
+        # Archive the configuration output and report its latest lines
+        configurer.output = configurers.ConfigurerOutput(
+            log_path=util.get_task_log_path(task.id),
+            on_progress=lambda lines: task.update_state(
+                state='PROGRESSING',
+                meta={'action': 'Configuring application...',
+                      'output': lines}))
         try:
             result = configurer.configure(app_config, provider_config)
+            configurer.output.close()
             task.update_state(
                 state='PROGRESSING',
                 meta={'action': 'Application configuration completed '
@@ -545,12 +1391,122 @@ runcmd:"""
             )
             return result
         except Exception as e:
+            configurer.output.close()
             task.update_state(
                 state='ERROR',
                 meta={'action': "Configuration failed: {}".format(e)}
             )
             raise
 
+    def _configure_hosts(self, tasks, app_config, provider_configs):
+        """
+        Configure the hosts of several deployments with one configurer run.
+
+        Each host is validated on its own, as in ``_configure_host``, and
+        the valid ones are then passed together, as ``host_configs``, to a
+        single ``configure`` call. The configuration output is recorded in
+        the log of each of the deployment tasks.
+
+        :type tasks: ``list`` of :class:`Task`
+        :param tasks: The task of each deployment.
+
+        :type app_config: ``dict``
+        :param app_config: The appliance configuration shared by all the
+                           deployments.
+
+        :type provider_configs: ``list`` of ``dict``
+        :param provider_configs: The provider config, including the
+                                 ``host_config``, of each deployment.
+
+        :rtype: ``list``
+        :return: The result of ``configure`` for each host, in the same order
+                 as ``tasks``. If configuring a host failed, its entry is the
+                 raised exception instead.
+        """
+        def _update_states(tasks, state, action, **meta):
+            for task in tasks:
+                task.update_state(state=state,
+                                  meta=dict(meta, action=action))
+
+        try:
+            configurer = self._get_configurer(app_config)
+        except Exception as e:
+            _update_states(tasks, 'ERROR',
+                           "Unable to create app configurer: {}".format(e))
+            return [e] * len(tasks)
+
+        def _validate(task, provider_config):
+            # Configurers that keep the validated connection for configure
+            # validate each host with a configurer of their own
+            validator = configurer
+            if getattr(configurer, 'reuses_ssh_connection', True):
+                validator = self._get_configurer(app_config)
+            try:
+                task.update_state(
+                    state='PROGRESSING',
+                    meta={'action': 'Validating provider connection info...'}
+                )
+                validator.validate(app_config, provider_config)
+            except Exception as e:
+                task.update_state(
+                    state='ERROR',
+                    meta={'action': "Validation of provider connection info "
+                                    "failed: {}".format(e)}
+                )
+                return e
+            finally:
+                if isinstance(validator, configurers.SSHBasedConfigurer):
+                    validator._close_ssh_client()
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            results = list(executor.map(_validate, tasks, provider_configs))
+        valid = [i for i, result in enumerate(results) if result is None]
+        if not valid:
+            return results
+        host_configs = [provider_configs[i]['host_config'] for i in valid]
+        host_names = [host_config.get('name') or host_config['host_address']
+                      for host_config in host_configs]
+        valid_tasks = [tasks[i] for i in valid]
+        _update_states(valid_tasks, 'PROGRESSING', 'Configuring application...')
+        log_path = util.get_task_log_path(valid_tasks[0].id)
+        configurer.output = configurers.ConfigurerOutput(
+            log_path=log_path,
+            on_progress=lambda lines: _update_states(
+                valid_tasks, 'PROGRESSING', 'Configuring application...',
+                output=lines))
+        try:
+            result = configurer.configure(
+                app_config, dict(provider_configs[valid[0]],
+                                 host_configs=host_configs))
+            failed_hosts, error = [], None
+        except configurers.PlaybookRunFailed as e:
+            result, error = {}, e
+            failed_hosts = e.failed_hosts or host_names
+        except Exception as e:
+            result, error = {}, e
+            failed_hosts = host_names
+        finally:
+            configurer.output.close()
+        for task in valid_tasks[1:]:
+            if os.path.exists(log_path):
+                shutil.copyfile(log_path, util.get_task_log_path(task.id))
+        for i, host_name in zip(valid, host_names):
+            if host_name in failed_hosts:
+                tasks[i].update_state(
+                    state='ERROR',
+                    meta={'action': "Configuration failed: {}".format(error)}
+                )
+                results[i] = error
+            else:
+                tasks[i].update_state(
+                    state='PROGRESSING',
+                    meta={'action': 'Application configuration completed '
+                                    'successfully.'}
+                )
+                results[i] = result
+        return results
+
     def _get_configurer(self, app_config):
         return configurers.create_configurer(app_config)
 
@@ -582,7 +1538,10 @@ runcmd:"""
         if not iid:
             return {"instance_status": "deployment_not_found"}
         log.debug("Checking the status of instance %s", iid)
-        inst = provider.compute.instances.get(iid)
+        try:
+            inst = provider.compute.instances.get(iid)
+        except circuit_breaker.CloudUnavailable as e:
+            return {"instance_status": "cloud_unavailable", "error": str(e)}
         if inst:
             return {"instance_status": inst.state}
         else:
@@ -601,6 +1560,88 @@ runcmd:"""
         # Instance does not exist so default to False
         return False
 
+    def bake(self, provider, deployment):
+        """
+        Bake the host of a deployment into an image.
+
+        Only hosts whose configuration was hashed at launch (see
+        ``_get_config_hash``) can be baked. This is a blocking call that will
+        wait until the image is ready.
+
+        :rtype: ``dict``
+        :return: The ``image_id`` of the baked image and the ``config_hash``
+                 of the configuration it was baked with.
+        """
+        bake_state = self.start_bake(provider, deployment)
+        provider.compute.images.get(bake_state['image_id']).wait_till_ready()
+        return {'image_id': bake_state['image_id'],
+                'config_hash': bake_state['config_hash']}
+
+    @property
+    def supports_staged_bake(self):
+        """
+        Whether images can be baked through ``start_bake``.
+
+        Plugins that customize ``bake`` itself must bake in one go because
+        the staged bake does not go through ``bake``.
+        """
+        return type(self).bake is BaseVMAppPlugin.bake
+
+    def start_bake(self, provider, deployment):
+        """
+        Request an image of a deployment's host without waiting for it.
+
+        The caller is expected to persist the returned state and confirm the
+        image by calling ``check_bake`` every ``bake_state['countdown']``
+        seconds until it returns ``True``.
+
+        See ``bake`` for the arguments.
+
+        :rtype: ``dict``
+        :return: A JSON-serializable dict with the state of the bake,
+                 including the ``image_id`` and ``config_hash`` returned by
+                 ``bake``.
+        """
+        config_hash = deployment.get('launch_result', {}).get(
+            'cloudLaunch', {}).get('configHash')
+        if not config_hash:
+            raise Exception("The configuration of deployment %s can't be "
+                            "baked into an image" % deployment.get('name'))
+        iid = self._get_deployment_iid(deployment)
+        inst = provider.compute.instances.get(iid) if iid else None
+        if not inst:
+            raise Exception("The instance of deployment %s was not found" %
+                            deployment.get('name'))
+        log.debug("Baking an image of deployment instance %s", iid)
+        img = inst.create_image(label='cl-baked-%s' % config_hash[:16])
+        return {'image_id': img.id,
+                'config_hash': config_hash,
+                'requested': time.time(),
+                'countdown': BAKE_POLL_INTERVAL}
+
+    def check_bake(self, provider, bake_state):
+        """
+        Check, without waiting, whether a baked image is available.
+
+        @type  bake_state: ``dict``
+        @param bake_state: The state returned by ``start_bake``.
+
+        :rtype: ``bool``
+        :return: ``True`` once the image is available.
+        """
+        image_id = bake_state['image_id']
+        img = provider.compute.images.get(image_id)
+        if not img:
+            raise Exception("Baked image %s no longer exists" % image_id)
+        if img.state == MachineImageState.AVAILABLE:
+            return True
+        if img.state == MachineImageState.ERROR:
+            raise Exception("Baking image %s failed" % image_id)
+        if time.time() - bake_state['requested'] > BAKE_TIMEOUT:
+            raise Exception("Image %s did not become available in time; it "
+                            "is in state %s" % (image_id, img.state))
+        return False
+
     def delete(self, provider, deployment):
         """
         Delete resource(s) associated with the supplied deployment.
@@ -617,3 +1658,84 @@ runcmd:"""
         hostname_config = deployment.get('launch_result', {}).get(
             'cloudLaunch', {}).get('hostNameConfig', {})
         return self._cleanup_instance(provider, instance_id, hostname_config)
+
+    @property
+    def supports_staged_delete(self):
+        """
+        Whether deployments can be deleted through ``start_delete``.
+
+        Plugins that customize ``delete`` itself must be deleted in one go
+        because the staged deletion does not go through ``delete``.
+        """
+        return type(self).delete is BaseVMAppPlugin.delete
+
+    def start_delete(self, provider, deployment):
+        """
+        Request the deletion of a deployment without waiting for it.
+
+        The instance delete is sent to the provider right away while the DNS
+        records of the deployment's hostname are removed concurrently. The
+        caller is expected to persist the returned state and confirm the
+        deletion by calling ``check_delete`` every
+        ``delete_state['countdown']`` seconds until it returns ``True``.
+
+        See ``delete`` for the arguments.
+
+        :rtype: ``dict``
+        :return: A JSON-serializable dict with the state of the deletion or
+                 ``None`` if the deployment has no instance to delete.
+        """
+        instance_id = self._get_deployment_iid(deployment)
+        if not instance_id:
+            return None
+        hostname_config = deployment.get('launch_result', {}).get(
+            'cloudLaunch', {}).get('hostNameConfig', {})
+        log.debug("Deleting deployment instance %s", instance_id)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            dns_cleanup = executor.submit(self._cleanup_hostname, provider,
+                                          hostname_config)
+            inst = provider.compute.instances.get(instance_id)
+            if inst:
+                inst.delete()
+            try:
+                dns_cleanup.result()
+            except Exception:
+                log.exception("Could not cleanup DNS")
+        return {'instance_id': instance_id,
+                'attempts': 1,
+                'requested': time.time(),
+                'countdown': DELETE_POLL_INTERVAL}
+
+    def check_delete(self, provider, delete_state):
+        """
+        Check, without waiting, whether a deletion is done.
+
+        The instance's state is read from the batched listings of the
+        instance state poller. While the instance still exists, its deletion
+        is requested again every ``DELETE_RETRY_INTERVAL`` seconds, up to
+        ``DELETE_MAX_ATTEMPTS`` times.
+
+        @type  delete_state: ``dict``
+        @param delete_state: The state returned by ``start_delete``, which is
+                             updated in place.
+
+        :rtype: ``bool``
+        :return: ``True`` once the instance has been deleted.
+        """
+        instance_id = delete_state['instance_id']
+        state = instance_poller.get_poller().get_state(provider, instance_id)
+        if state in (InstanceState.DELETED, InstanceState.UNKNOWN):
+            return True
+        if time.time() - delete_state['requested'] > DELETE_RETRY_INTERVAL:
+            if delete_state['attempts'] >= DELETE_MAX_ATTEMPTS:
+                raise InstanceNotDeleted(
+                    f"Instance {instance_id} should have been deleted but "
+                    "still exists.")
+            log.debug("Node not deleted, retrying...")
+            inst = provider.compute.instances.get(instance_id)
+            if not inst:
+                return True
+            inst.delete()
+            delete_state['attempts'] += 1
+            delete_state['requested'] = time.time()
+        return False
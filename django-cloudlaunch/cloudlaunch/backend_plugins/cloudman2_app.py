@@ -13,6 +13,7 @@ import tenacity
 
 from cloudbridge.base.helpers import cleanup_action
 
+from cloudlaunch import locks
 from cloudlaunch.configurers import AnsibleAppConfigurer
 
 from .simple_web_app import SimpleWebAppPlugin
@@ -50,24 +51,25 @@ class AWSKubeIAMPolicyHandler(object):
         # created the policy. Yet, check for the EntityAlreadyExistsException
         # anyway to avoid race conditions.
         policy_arn = None
-        try:
-            sts = self.provider.session.client('sts')
-            account_id = sts.get_caller_identity()['Account']
-            policy_arn = f'arn:aws:iam::{account_id}:policy/{policy_name}'
-            response = self.iam_client.get_policy(PolicyArn=policy_arn)
-            return response['Policy']['Arn']
-        except self.iam_client.exceptions.NoSuchEntityException:
+        with locks.lock(self.provider, 'iam_policy:%s' % policy_name):
             try:
-                response = self.iam_client.create_policy(
-                    PolicyName=policy_name,
-                    PolicyDocument=policy_doc
-                )
-                policy_arn = response.get('Policy').get('Arn')
-                waiter = self.iam_client.get_waiter('policy_exists')
-                waiter.wait(PolicyArn=policy_arn)
-                return policy_arn
-            except self.iam_client.exceptions.EntityAlreadyExistsException:
-                return policy_arn
+                sts = self.provider.session.client('sts')
+                account_id = sts.get_caller_identity()['Account']
+                policy_arn = f'arn:aws:iam::{account_id}:policy/{policy_name}'
+                response = self.iam_client.get_policy(PolicyArn=policy_arn)
+                return response['Policy']['Arn']
+            except self.iam_client.exceptions.NoSuchEntityException:
+                try:
+                    response = self.iam_client.create_policy(
+                        PolicyName=policy_name,
+                        PolicyDocument=policy_doc
+                    )
+                    policy_arn = response.get('Policy').get('Arn')
+                    waiter = self.iam_client.get_waiter('policy_exists')
+                    waiter.wait(PolicyArn=policy_arn)
+                    return policy_arn
+                except self.iam_client.exceptions.EntityAlreadyExistsException:
+                    return policy_arn
 
     def _delete_iam_policy(self, policy_arn):
         self.iam_client.delete_policy(PolicyArn=policy_arn)
@@ -84,20 +86,21 @@ class AWSKubeIAMPolicyHandler(object):
         return self._get_or_create_iam_policy(policy_name, policy_doc)
 
     def _get_or_create_iam_role(self, role_name, trust_policy):
-        try:
-            response = self.iam_client.get_role(RoleName=role_name)
-            return response['Role']['RoleName']
-        except self.iam_client.exceptions.NoSuchEntityException:
+        with locks.lock(self.provider, 'iam_role:%s' % role_name):
             try:
-                self.iam_client.create_role(
-                    RoleName=role_name,
-                    AssumeRolePolicyDocument=trust_policy,
-                    Description="CloudMan2 IAM role for rancher/kubernetes")
-                waiter = self.iam_client.get_waiter('role_exists')
-                waiter.wait(RoleName=role_name)
-                return role_name
-            except self.iam_client.exceptions.EntityAlreadyExistsException:
-                return role_name
+                response = self.iam_client.get_role(RoleName=role_name)
+                return response['Role']['RoleName']
+            except self.iam_client.exceptions.NoSuchEntityException:
+                try:
+                    self.iam_client.create_role(
+                        RoleName=role_name,
+                        AssumeRolePolicyDocument=trust_policy,
+                        Description="CloudMan2 IAM role for rancher/kubernetes")
+                    waiter = self.iam_client.get_waiter('role_exists')
+                    waiter.wait(RoleName=role_name)
+                    return role_name
+                except self.iam_client.exceptions.EntityAlreadyExistsException:
+                    return role_name
 
     def _delete_iam_role(self, role_name):
         self.iam_client.delete_role(RoleName=role_name)
@@ -127,23 +130,24 @@ class AWSKubeIAMPolicyHandler(object):
         )
 
     def _get_or_create_instance_profile(self, profile_name):
-        try:
-            self.iam_client.get_instance_profile(
-                InstanceProfileName=profile_name)
-            return profile_name
-        except self.iam_client.exceptions.NoSuchEntityException:
+        with locks.lock(self.provider, 'instance_profile:%s' % profile_name):
             try:
-                self.iam_client.create_instance_profile(
+                self.iam_client.get_instance_profile(
                     InstanceProfileName=profile_name)
-                waiter = self.iam_client.get_waiter('instance_profile_exists')
-                waiter.wait(InstanceProfileName=profile_name)
-                # Despite the waiter, aws run_instances sometimes take a while
-                # to recognize that the profile exists, so sleep manually as a
-                # workaround
-                time.sleep(5)
-                return profile_name
-            except self.iam_client.exceptions.EntityAlreadyExistsException:
                 return profile_name
+            except self.iam_client.exceptions.NoSuchEntityException:
+                try:
+                    self.iam_client.create_instance_profile(
+                        InstanceProfileName=profile_name)
+                    waiter = self.iam_client.get_waiter('instance_profile_exists')
+                    waiter.wait(InstanceProfileName=profile_name)
+                    # Despite the waiter, aws run_instances sometimes take a while
+                    # to recognize that the profile exists, so sleep manually as a
+                    # workaround
+                    time.sleep(5)
+                    return profile_name
+                except self.iam_client.exceptions.EntityAlreadyExistsException:
+                    return profile_name
 
     def _delete_instance_profile(self, profile_name):
         self.iam_client.delete_instance_profile(
@@ -255,7 +259,7 @@ class CloudMan2AppPlugin(SimpleWebAppPlugin):
         """ This function is used to enable subclassses to override behaviour"""
         return get_iam_handler_for(provider.PROVIDER_ID)
 
-    def _provision_host(self, name, task, app_config, provider_config):
+    def _launch_instance(self, name, task, app_config, provider_config):
         provider = provider_config.get('cloud_provider')
         handler_class = self._get_iam_handler(provider)
         if handler_class:
@@ -263,7 +267,7 @@ class CloudMan2AppPlugin(SimpleWebAppPlugin):
             handler = handler_class(provider, name, app_config)
             provider_config['extra_provider_args'] = \
                 handler.create_iam_policy()
-        return super()._provision_host(name, task, app_config, provider_config)
+        return super()._launch_instance(name, task, app_config, provider_config)
 
     def _configure_host(self, name, task, app_config, provider_config):
         result = super()._configure_host(name, task, app_config, provider_config)
@@ -272,14 +276,12 @@ class CloudMan2AppPlugin(SimpleWebAppPlugin):
         result['cloudLaunch'] = {'applicationURL':
                                  'https://{0}/'.format(host),
                                  'pulsar_token': pulsar_token}
-        task.update_state(
-            state='PROGRESSING',
-            meta={'action': "Waiting for CloudMan to become available at %s"
-                            % result['cloudLaunch']['applicationURL']})
+        return result
+
+    def _get_http_check(self, result):
         login_url = urljoin(result['cloudLaunch']['applicationURL'],
                             'cloudman/oidc/authenticate')
-        self.wait_for_http(login_url, ok_status_codes=[302])
-        return result
+        return login_url, [302]
 
     def _get_configurer(self, app_config):
         # CloudMan2 can only be configured with ansible
@@ -121,8 +121,8 @@ class CloudManAppPlugin(SimpleWebAppPlugin):
         app_config['config_cloudman']['clusterPassword'] = '********'
         return app_config
 
-    def deploy(self, name, task, app_config, provider_config):
-        """See the parent class in ``app_plugin.py`` for the docstring."""
+    def _prepare_launch(self, name, task, app_config, provider_config):
+        """Format the CloudMan user data and apply any saved cluster info."""
         user_data = provider_config.get('cloud_user_data')
         ud = yaml.safe_dump(user_data, default_flow_style=False,
                             allow_unicode=False)
@@ -135,14 +135,11 @@ class CloudManAppPlugin(SimpleWebAppPlugin):
         if user_data.get('machine_image_id'):
             app_config.get('config_cloudlaunch')[
                 'customImageID'] = user_data['machine_image_id']
-        result = super(CloudManAppPlugin, self).deploy(
-            name, task, app_config, provider_config, check_http=False)
+
+    def _finalize_launch(self, result, app_config):
         result['cloudLaunch']['applicationURL'] = 'http://{0}/cloud'.format(
             result['cloudLaunch']['hostname'])
-        task.update_state(
-            state='PROGRESSING',
-            meta={'action': "Waiting for CloudMan to become ready at %s"
-                            % result['cloudLaunch']['applicationURL']})
-        log.info("CloudMan app going to wait for http")
-        self.wait_for_http(result['cloudLaunch']['applicationURL'])
         return result
+
+    def _get_http_check(self, result):
+        return result['cloudLaunch']['applicationURL'], [401, 403]
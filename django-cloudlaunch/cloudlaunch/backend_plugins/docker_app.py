@@ -52,9 +52,7 @@ class DockerAppPlugin(BaseVMAppPlugin):
         user_data += " {0}".format(docker_config.get('repo_name'))
         return user_data
 
-    def deploy(self, name, task, app_config, provider_config):
-        result = super(DockerAppPlugin, self).deploy(
-            name, task, app_config, provider_config)
+    def _finalize_launch(self, result, app_config):
         result['cloudLaunch']['applicationURL'] = 'http://{0}'.format(
             result['cloudLaunch']['hostname'])
         return result
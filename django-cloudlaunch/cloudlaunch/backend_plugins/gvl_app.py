@@ -31,11 +31,8 @@ class GVLAppPlugin(SimpleWebAppPlugin):
         sanitised_config['config_gvl'] = CloudManAppPlugin().sanitise_app_config(gvl_config)
         return sanitised_config
 
-    def deploy(self, name, task, app_config, provider_config):
+    def _prepare_launch(self, name, task, app_config, provider_config):
         user_data = provider_config.get('cloud_user_data')
         ud = yaml.safe_dump(user_data, default_flow_style=False,
                             allow_unicode=False)
         provider_config['cloud_user_data'] = ud
-        result = super(GVLAppPlugin, self).deploy(
-            name, task, app_config, provider_config)
-        return result
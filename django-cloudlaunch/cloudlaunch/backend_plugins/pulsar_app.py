@@ -7,16 +7,16 @@ from .base_vm_app import BaseVMAppPlugin
 
 class PulsarAppPlugin(BaseVMAppPlugin):
 
-    def deploy(self, name, task, app_config, provider_config):
+    def _prepare_launch(self, name, task, app_config, provider_config):
         token = secrets.token_urlsafe()
         if not app_config.get('config_pulsar'):
             app_config['config_pulsar'] = {}
         app_config['config_pulsar']['auth_token'] = token
-        result = super(PulsarAppPlugin, self).deploy(
-            name, task, app_config, provider_config)
+
+    def _finalize_launch(self, result, app_config):
         result['pulsar'] = {
             'api_url': 'http://{0}:8913'.format(result['cloudLaunch']['hostname']),
-            'auth_token': token}
+            'auth_token': app_config['config_pulsar']['auth_token']}
         return result
 
     def _get_configurer(self, app_config):
@@ -0,0 +1,233 @@
+"""Circuit breakers failing calls to unavailable cloud endpoints fast."""
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+from cloudbridge.interfaces.exceptions import ProviderConnectionException
+from pyeventsystem.middleware import intercept
+
+log = get_task_logger('cloudlaunch')
+
+# Names of the exception classes raised when an endpoint can't be reached,
+# e.g., botocore's EndpointConnectionError or requests' ConnectTimeout
+UNAVAILABILITY_ERROR_NAMES = ('ConnectionError', 'ConnectTimeout',
+                              'ConnectTimeoutError', 'ReadTimeout',
+                              'ReadTimeoutError', 'ServiceUnavailable')
+
+CLOSED = 'CLOSED'
+OPEN = 'OPEN'
+HALF_OPEN = 'HALF_OPEN'
+
+
+class CloudUnavailable(Exception):
+    pass
+
+
+def get_endpoint_key(provider):
+    """
+    Identify the cloud endpoint a provider connects to.
+
+    Providers for different accounts of a cloud region share the endpoint.
+
+    :rtype: ``str``
+    """
+    urls = {key: value for key, value in dict(provider.config).items()
+            if key.endswith('url') and value}
+    return json.dumps([provider.PROVIDER_ID, provider.region_name, urls],
+                      sort_keys=True, default=str)
+
+
+def is_unavailability_error(error):
+    """
+    Check whether an exception, or one it was raised from, signals that a
+    cloud endpoint is unavailable (can't be reached, times out or returns a
+    server error) rather than that a call was invalid.
+    """
+    while error:
+        if (isinstance(error, (ConnectionError, TimeoutError,
+                               ProviderConnectionException)) or
+                any(name in type(error).__name__
+                    for name in UNAVAILABILITY_ERROR_NAMES)):
+            return True
+        response = getattr(error, 'response', None)
+        status = (response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+                  if isinstance(response, dict) else None)
+        status = (status or getattr(error, 'status_code', None) or
+                  getattr(error, 'http_status', None) or
+                  getattr(getattr(error, 'resp', None), 'status', None))
+        try:
+            if int(status) >= 500:
+                return True
+        except (TypeError, ValueError):
+            pass
+        error = error.__cause__
+    return False
+
+
+def _get_cloud_unavailable(error):
+    """Find a ``CloudUnavailable`` error an exception was raised from."""
+    while error:
+        if isinstance(error, CloudUnavailable):
+            return error
+        error = error.__cause__
+    return None
+
+
+class _Circuit(object):
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.probing = False
+
+
+class CircuitBreaker(object):
+    """
+    Track the availability of cloud endpoints and fail calls to unavailable
+    ones fast.
+
+    The circuit of an endpoint opens after ``threshold`` consecutive calls
+    failed because the endpoint was unavailable (see
+    ``is_unavailability_error``). While open, calls fail immediately with
+    ``CloudUnavailable``. After ``reset_timeout`` seconds, the circuit lets a
+    single probe call through (it is half-open): if the call succeeds, the
+    circuit closes again, otherwise it reopens.
+
+    Circuits are tracked per process.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def before_call(self, key):
+        """
+        Check whether a call to the endpoint may go ahead.
+
+        :rtype: ``bool``
+        :return: Whether the call is the probe of a half-open circuit.
+
+        :raise CloudUnavailable: If the circuit is open.
+        """
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state == CLOSED:
+                return False
+            retry_in = circuit.opened + self.reset_timeout - time.time()
+            if (circuit.state == OPEN and retry_in <= 0 and
+                    not circuit.probing):
+                circuit.state = HALF_OPEN
+                circuit.probing = True
+                return True
+        raise CloudUnavailable(
+            "The cloud is unavailable: its endpoint failed {0} consecutive "
+            "calls. Calls are tried again in {1:.0f} seconds.".format(
+                self.threshold, max(0, retry_in)))
+
+    def record_success(self, key):
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state != CLOSED:
+                log.info("Cloud endpoint %s recovered; closing its circuit",
+                         key)
+            circuit.state = CLOSED
+            circuit.failures = 0
+            circuit.probing = False
+
+    def record_failure(self, key):
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.failures += 1
+            circuit.probing = False
+            if (circuit.state == HALF_OPEN or
+                    circuit.failures >= self.threshold):
+                if circuit.state == CLOSED:
+                    log.warning("Cloud endpoint %s is unavailable; opening "
+                                "its circuit", key)
+                circuit.state = OPEN
+                circuit.opened = time.time()
+
+    def release_probe(self, key):
+        """Let another call probe a half-open circuit."""
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state == HALF_OPEN:
+                circuit.state = OPEN
+                circuit.probing = False
+
+
+class CircuitBreakerMiddleware(object):
+    """
+    CloudBridge middleware guarding a provider's calls with a circuit
+    breaker.
+
+    Calls that fail for reasons other than the endpoint's availability
+    (e.g., a missing resource) count as successful calls.
+    """
+
+    def __init__(self, breaker, endpoint_key):
+        self.breaker = breaker
+        self.endpoint_key = endpoint_key
+
+    # Run before CloudBridge's ExceptionWrappingMiddleware (priority 1050) so
+    # that CloudUnavailable is raised as is
+    @intercept(event_pattern="*", priority=1000)
+    def guard(self, event_args, *args, **kwargs):
+        next_handler = event_args.pop("next_handler")
+        if not next_handler:
+            return
+        probe = self.breaker.before_call(self.endpoint_key)
+        try:
+            result = next_handler.invoke(event_args, *args, **kwargs)
+        except Exception as e:
+            unavailable = _get_cloud_unavailable(e)
+            if unavailable:
+                # Failed fast by the circuit of a call made by this one
+                if probe:
+                    self.breaker.release_probe(self.endpoint_key)
+                raise unavailable
+            if is_unavailability_error(e):
+                self.breaker.record_failure(self.endpoint_key)
+            else:
+                self.breaker.record_success(self.endpoint_key)
+            raise
+        self.breaker.record_success(self.endpoint_key)
+        return result
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker():
+    """
+    Get the process wide circuit breaker configured with the
+    ``CLOUDLAUNCH_CIRCUIT_BREAKER_*`` settings.
+
+    :rtype: :class:`CircuitBreaker`
+    """
+    global _breaker
+    with _breaker_lock:
+        if not _breaker:
+            _breaker = CircuitBreaker(
+                threshold=settings.CLOUDLAUNCH_CIRCUIT_BREAKER_THRESHOLD,
+                reset_timeout=settings.CLOUDLAUNCH_CIRCUIT_BREAKER_RESET)
+    return _breaker
+
+
+def add_circuit_breaker(provider):
+    """
+    Fail a provider's calls fast while its cloud endpoint is unavailable.
+
+    :rtype: :class:`CloudBridge.CloudProvider`
+    :return: The supplied provider.
+    """
+    provider.middleware.add(CircuitBreakerMiddleware(
+        get_breaker(), get_endpoint_key(provider)))
+    return provider
@@ -0,0 +1,151 @@
+"""Caching of cloud resource lookups shared by launches."""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+
+log = get_task_logger('cloudlaunch')
+
+
+def get_account_key(provider):
+    """
+    Identify the cloud account and region a provider is connected to.
+
+    The key is a hash of the provider's configuration, which includes the
+    credentials and region, so no credentials are kept in cache keys.
+
+    :rtype: ``str``
+    :return: A key shared by all providers for the same account and region.
+    """
+    config = json.dumps(dict(provider.config), sort_keys=True, default=str)
+    return hashlib.sha256("{0}:{1}".format(
+        provider.PROVIDER_ID, config).encode('utf-8')).hexdigest()
+
+
+class CloudResourceCache(object):
+    """
+    A TTL cache of cloud resource lookups, per cloud account and region.
+
+    Entries are keyed by the account of the provider they were looked up
+    with (see ``get_account_key``), a resource kind (e.g., ``image``) and a
+    kind specific key (e.g., the image ID). Cached resources remain bound to
+    the provider they were looked up with; as providers for the same account
+    are interchangeable, later launches can use them as their own.
+
+    Lookups that find nothing are not cached so a missing resource is looked
+    up again (and possibly created) on the next launch. Callers should
+    ``invalidate`` the entries of resources that turn out to be missing or
+    inaccessible.
+
+    Cached resources hold the connections of their provider, which must not
+    be shared between processes, so a cache inherited by a forked process
+    (e.g., a Celery worker) is discarded.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._entries = {}
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def get(self, provider, kind, key):
+        """
+        Get a cached resource.
+
+        :rtype: ``object``
+        :return: The cached resource or ``None`` if it is not cached or its
+                 entry has expired.
+        """
+        entry_key = (get_account_key(provider), kind, key)
+        with self._lock:
+            self._check_pid()
+            entry = self._entries.get(entry_key)
+            if not entry:
+                return None
+            if entry[0] < time.time():
+                del self._entries[entry_key]
+                return None
+            return entry[1]
+
+    def put(self, provider, kind, key, resource):
+        """Cache a resource that has been looked up or created."""
+        if not self.ttl or resource is None:
+            return
+        entry_key = (get_account_key(provider), kind, key)
+        with self._lock:
+            self._check_pid()
+            self._entries[entry_key] = (time.time() + self.ttl, resource)
+
+    def get_or_lookup(self, provider, kind, key, lookup):
+        """
+        Get a cached resource or look it up and cache it.
+
+        :type lookup: ``callable``
+        :param lookup: Called, without arguments, to look the resource up if
+                       it is not cached. Should return ``None`` if the
+                       resource does not exist.
+
+        :rtype: ``object``
+        :return: The resource or ``None`` if it does not exist.
+        """
+        resource = self.get(provider, kind, key)
+        if resource is None:
+            resource = lookup()
+            self.put(provider, kind, key, resource)
+        return resource
+
+    def invalidate(self, provider, kind=None, key=None):
+        """
+        Remove cached resources of the provider's account.
+
+        Removes the entry for ``key`` of ``kind`` if both are supplied, all
+        the entries of ``kind`` if only ``kind`` is supplied and otherwise
+        all the entries of the account.
+        """
+        account_key = get_account_key(provider)
+        with self._lock:
+            self._check_pid()
+            for entry_key in list(self._entries):
+                if (entry_key[0] == account_key and
+                        kind in (None, entry_key[1]) and
+                        (key is None or key == entry_key[2])):
+                    del self._entries[entry_key]
+        log.debug("Invalidated cached %s resources %s", kind or 'all', key)
+
+    def clear(self):
+        """Remove all the cached resources."""
+        with self._lock:
+            self._reset()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Get the process wide cache of cloud resource lookups.
+
+    Entries expire after ``CLOUDLAUNCH_CLOUD_CACHE_TTL`` seconds; a TTL of
+    0 disables caching.
+
+    :rtype: :class:`CloudResourceCache`
+    """
+    global _cache
+    with _cache_lock:
+        if not _cache:
+            _cache = CloudResourceCache(
+                ttl=settings.CLOUDLAUNCH_CLOUD_CACHE_TTL)
+    return _cache
@@ -1,16 +1,34 @@
 """Application configurers."""
 import abc
+import configparser
+import copy
+import fcntl
+import gzip
+import hashlib
+import itertools
+import json
 import logging
 import os
+import re
+import shlex
 import shutil
+import signal
 import socket
 import subprocess
-from io import StringIO
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from collections import deque
+from contextlib import contextmanager
 from string import Template
 import yaml
 
 from django.conf import settings
 
+from git import GitCommandError
 from git import Repo
 
 import paramiko
@@ -22,18 +40,63 @@ import tenacity
 
 import requests
 
+from cloudlaunch import ssh_keys
+
 log = logging.getLogger(__name__)
 
+# Ansible plugins shipped with CloudLaunch
+ANSIBLE_PLUGINS_DIR = os.path.join(os.path.dirname(__file__),
+                                   'ansible_plugins')
+# Directory for the sockets of persistent Ansible ssh connections
+ANSIBLE_CONTROL_PATH_DIR = os.path.join(tempfile.gettempdir(), 'cl-cp')
+# Seconds to wait for a host to accept an ssh login, in total
+SSH_CHECK_TIMEOUT = 180
+
+# ``${hosts}`` expands to a line per host, with its connection details and
+# host vars, followed by a section per inventory group
 DEFAULT_INVENTORY_TEMPLATE = """
-${host}
+${hosts}
 
 [all:vars]
 ansible_ssh_port=22
-ansible_user='${user}'
-ansible_ssh_private_key_file=pk
-ansible_ssh_extra_args='-o StrictHostKeyChecking=no'
+ansible_ssh_extra_args='-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null'
 """.strip()
 
+# Files written to hosts configured by cloud-init during boot
+CLOUDINIT_SCRIPT_PATH = '/var/lib/cloudlaunch/configure.sh'
+CLOUDINIT_STATUS_PATH = '/var/lib/cloudlaunch/configure.status'
+CLOUDINIT_LOG_PATH = '/var/log/cloudlaunch-configure.log'
+CLOUDINIT_PHONE_HOME_PATH = '/var/lib/cloudlaunch/phone_home.py'
+# Reports the outcome of the configuration script to the URL given as the
+# only argument. Runs with the python interpreter cloud-init itself uses.
+CLOUDINIT_PHONE_HOME_SCRIPT = """\
+import json
+import sys
+import time
+import urllib.request
+
+try:
+    with open('{status_path}') as f:
+        status = int(f.read().strip())
+except (OSError, ValueError):
+    status = 1
+try:
+    with open('{log_path}', errors='replace') as f:
+        output = ''.join(f.readlines()[-50:])
+except OSError:
+    output = ''
+data = json.dumps({{'status': status, 'output': output}}).encode('utf-8')
+for attempt in range(10):
+    try:
+        urllib.request.urlopen(urllib.request.Request(
+            sys.argv[1], data=data, method='POST',
+            headers={{'Content-Type': 'application/json'}}), timeout=30)
+        break
+    except Exception as e:
+        print("CloudLaunch phone home failed: {{0}}".format(e), file=sys.stderr)
+        time.sleep(10)
+""".format(status_path=CLOUDINIT_STATUS_PATH, log_path=CLOUDINIT_LOG_PATH)
+
 
 def create_configurer(app_config):
     """Create a configurer based on the 'runner' in app_config."""
@@ -43,10 +106,100 @@ def create_configurer(app_config):
         return AnsibleAppConfigurer()
     elif runner == "script":
         return ScriptAppConfigurer()
+    elif runner == "cloudinit":
+        return CloudInitAppConfigurer()
     else:
         raise ValueError("Unsupported value of 'runner': {}".format(runner))
 
 
+class ConfigurerOutput(object):
+    """
+    Bounded capture of the output of the commands run by a configurer.
+
+    Only the most recent ``max_lines`` lines are kept in memory. All lines
+    are also appended to an optional, gzip compressed log file and the most
+    recent ones are periodically passed to an optional progress callback.
+    The output may be written to from multiple threads.
+    """
+
+    def __init__(self, log_path=None, on_progress=None, max_lines=100,
+                 progress_lines=10, progress_interval=2):
+        """
+        :type log_path: ``str``
+        :param log_path: Path of the gzip compressed log file to append to.
+
+        :type on_progress: ``callable``
+        :param on_progress: Called with the list of most recent lines at
+                            most every ``progress_interval`` seconds while
+                            output is being written.
+        """
+        self.lines = deque(maxlen=max_lines)
+        self.on_progress = on_progress
+        self.progress_lines = progress_lines
+        self.progress_interval = progress_interval
+        self._last_progress = 0
+        self._lock = threading.Lock()
+        self._log = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            self._log = gzip.open(log_path, 'at')
+
+    def write(self, line, source=None):
+        """
+        Record a line of output.
+
+        :type source: ``str``
+        :param source: An optional label for the command that produced the
+                       line, prefixed to it.
+        """
+        line = line.rstrip('\n')
+        if source:
+            line = '[{0}] {1}'.format(source, line)
+        with self._lock:
+            self.lines.append(line)
+            if self._log:
+                self._log.write(line + '\n')
+            if (self.on_progress and time.time() - self._last_progress >
+                    self.progress_interval):
+                self._report_progress()
+
+    def tail(self, count=10):
+        """Return the ``count`` most recent lines."""
+        with self._lock:
+            return list(self.lines)[-count:]
+
+    def _report_progress(self):
+        self._last_progress = time.time()
+        try:
+            self.on_progress(list(self.lines)[-self.progress_lines:])
+        except Exception as e:
+            log.warning("Error reporting configurer progress: %s", e)
+
+    def close(self):
+        """Report the final progress and close the log file."""
+        with self._lock:
+            if self.on_progress and self.lines:
+                self._report_progress()
+            if self._log:
+                self._log.close()
+                self._log = None
+
+
+class PlaybookRunCancelled(Exception):
+    """Raised when a playbook run is stopped because another one failed."""
+    pass
+
+
+class PlaybookRunFailed(Exception):
+    """Raised when a playbook run fails on some or all of its hosts."""
+
+    def __init__(self, message, failed_hosts=None):
+        super().__init__(message)
+        # Inventory names of the hosts the run failed on or ``None`` if the
+        # run failed as a whole (e.g., the playbook could not be parsed)
+        self.failed_hosts = failed_hosts
+
+
 class AppConfigurer():
     """Interface class for application configurer."""
 
@@ -57,6 +210,12 @@ class AppConfigurer():
         """Throws exception if provider_config or app_config isn't valid."""
         pass
 
+    # A ``ConfigurerOutput`` capturing the output of the configuration
+    output = None
+    # Whether the host configures itself while booting, from its user data,
+    # rather than being configured by ``configure`` once it is up
+    configures_at_boot = False
+
     @abc.abstractmethod
     def configure(self, app_config, provider_config):
         """
@@ -66,9 +225,26 @@ class AppConfigurer():
         """
         pass
 
+    def _get_output(self):
+        if not self.output:
+            self.output = ConfigurerOutput()
+        return self.output
+
 
 class SSHBasedConfigurer(AppConfigurer):
 
+    # Whether the connection opened while validating is kept for
+    # ``configure``. Configurers that don't keep it hold no connection state
+    # and can validate several hosts concurrently.
+    reuses_ssh_connection = True
+    # A client for the connection opened while validating, handed over to
+    # ``configure`` (see ``_get_ssh_client``)
+    _ssh_client = None
+    # The host key seen while validating. Host keys are tracked in process
+    # rather than in ~/.ssh/known_hosts because cloud IP addresses get reused
+    # by new hosts with new keys.
+    _host_key = None
+
     def validate(self, app_config, provider_config):
         # Validate SSH connection info in provider_config
         host_config = provider_config.get('host_config', {})
@@ -82,32 +258,14 @@ class SSHBasedConfigurer(AppConfigurer):
             raise Exception("Error trying to ssh to host {}: {}".format(
                 host, rte))
 
-    def _remove_known_host(self, host):
-        """
-        Remove a host from ~/.ssh/known_hosts.
-
-        :type host: ``str``
-        :param host: Hostname or IP address of the host to remove from the
-                     known hosts file.
-
-        :rtype: ``bool``
-        :return: True if the host was successfully removed.
-        """
-        cmd = "ssh-keygen -R {0}".format(host)
-        p = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-        (out, err) = p.communicate()
-        if p.wait() == 0:
-            return True
-        return False
-
-    @tenacity.retry(stop=tenacity.stop_after_delay(180),
-                    retry=tenacity.retry_if_result(lambda result: result is False),
-                    wait=tenacity.wait_fixed(5))
     def _check_ssh(self, host, pk=None, user='ubuntu'):
         """
         Check for ssh availability on a host.
 
+        Wait for the ssh server to come up with a cheap, unauthenticated
+        probe before attempting to login. The resulting connection is kept
+        for use by ``configure``.
+
         :type host: ``str``
         :param host: Hostname or IP address of the host to check.
 
@@ -120,42 +278,110 @@ class SSHBasedConfigurer(AppConfigurer):
         :rtype: ``bool``
         :return: True if ssh connection was successful.
         """
+        # Both steps share a single deadline of ``SSH_CHECK_TIMEOUT`` seconds
+        deadline = time.time() + SSH_CHECK_TIMEOUT
+        tenacity.Retrying(
+            stop=tenacity.stop_after_delay(SSH_CHECK_TIMEOUT),
+            retry=tenacity.retry_if_result(lambda result: result is False),
+            wait=tenacity.wait_exponential(multiplier=0.5, max=10))(
+            self._wait_for_ssh_banner, host)
+        return tenacity.Retrying(
+            stop=tenacity.stop_after_delay(max(deadline - time.time(), 0)),
+            retry=tenacity.retry_if_result(lambda result: result is False),
+            wait=tenacity.wait_exponential(multiplier=1, max=10))(
+            self._login_ssh, host, pk=pk, user=user)
+
+    def _wait_for_ssh_banner(self, host, port=22):
+        """
+        Check whether an ssh server is accepting connections on a host.
+
+        :rtype: ``bool``
+        :return: True if the host responded with an ssh protocol banner.
+        """
+        try:
+            with socket.create_connection((host, port), timeout=5) as sock:
+                if sock.recv(256).startswith(b'SSH-'):
+                    return True
+                log.debug("No ssh banner from {0} yet".format(host))
+        except socket.error as e:
+            log.debug("ssh port not reachable on {0}: {1}".format(host, e))
+        return False
+
+    def _login_ssh(self, host, pk=None, user='ubuntu'):
+        """
+        Login to a host over ssh and keep the connection for ``configure``,
+        if it is reused (see ``reuses_ssh_connection``).
+
+        :rtype: ``bool``
+        :return: True if ssh connection was successful.
+        """
+        self._close_ssh_client()
         ssh = paramiko.SSHClient()
         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        pkey = self._get_private_key_from_string(pk)
         try:
             log.info("Trying to ssh {0}@{1}".format(user, host))
-            ssh.connect(host, username=user, pkey=pkey)
-            self._remove_known_host(host)
+            ssh.connect(host, username=user,
+                        pkey=self._get_private_key_from_string(pk))
+            if not self.reuses_ssh_connection:
+                ssh.close()
+                return True
+            self._ssh_client = ssh
+            self._host_key = ssh.get_transport().get_remote_server_key()
             return True
         except (BadHostKeyException, AuthenticationException,
                 SSHException, socket.error) as e:
             log.warn("ssh connection exception for {0}: {1}".format(host, e))
-        self._remove_known_host(host)
+        ssh.close()
         return False
 
+    def _get_ssh_client(self, host, pk=None, user='ubuntu'):
+        """
+        Get a connected ssh client for a host.
+
+        The connection validated by ``validate`` is handed over if it is
+        still active. Otherwise, a new connection is made, expecting the same
+        host key as seen during validation. The caller owns the returned
+        client and should close it when done.
+
+        :rtype: :class:`paramiko.SSHClient`
+        :return: A client connected to ``host``.
+        """
+        ssh, self._ssh_client = self._ssh_client, None
+        if ssh and ssh.get_transport() and ssh.get_transport().is_active():
+            return ssh
+        ssh = paramiko.SSHClient()
+        if self._host_key:
+            ssh.get_host_keys().add(host, self._host_key.get_name(),
+                                    self._host_key)
+        else:
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        log.info("Trying to ssh {0}@{1}".format(user, host))
+        ssh.connect(host, username=user,
+                    pkey=self._get_private_key_from_string(pk))
+        return ssh
+
+    def _close_ssh_client(self):
+        """Close the connection opened while validating, if any."""
+        if self._ssh_client:
+            self._ssh_client.close()
+            self._ssh_client = None
+
     def _get_private_key_from_string(self, private_key):
         pkey = None
         if private_key:
-            if 'RSA' not in private_key:
-                # Paramiko requires key type so add it
-                log.info("Augmenting private key with RSA type")
-                private_key = private_key.replace(' PRIVATE', ' RSA PRIVATE')
-            key_file_object = StringIO(private_key)
-            pkey = paramiko.RSAKey.from_private_key(key_file_object)
-            key_file_object.close()
+            pkey = ssh_keys.load_private_key(private_key)
         return pkey
 
 
 class ScriptAppConfigurer(SSHBasedConfigurer):
 
     def validate(self, app_config, provider_config):
-        super().validate(app_config, provider_config)
         config_script = app_config.get('config_appliance', {}).get(
             'config_script')
         if not config_script:
             raise Exception("config_appliance missing required parameter: "
                             "config_script")
+        super().validate(app_config, provider_config)
 
     def configure(self, app_config, provider_config):
         host_config = provider_config.get('host_config', {})
@@ -168,27 +394,43 @@ class ScriptAppConfigurer(SSHBasedConfigurer):
             'config_script')
 
         try:
-            pkey = self._get_private_key_from_string(ssh_private_key)
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            log.info("Trying to ssh {0}@{1}".format(user, host))
-            ssh.connect(host, username=user, pkey=pkey)
-            stdin, stdout, stderr = ssh.exec_command(config_script)
-            self._remove_known_host(host)
+            ssh = self._get_ssh_client(host, pk=ssh_private_key, user=user)
+        except (SSHException, socket.error) as e:
+            raise Exception("Failed to ssh to {}".format(host)) from e
+        output = self._get_output()
+        try:
+            channel = ssh.get_transport().open_session()
+            # Interleave stderr with stdout, from the start, so that all of it
+            # is captured and a full stderr can't stall stdout
+            channel.set_combine_stderr(True)
+            channel.exec_command(config_script)
+            for line in channel.makefile('r'):
+                output.write(line)
+            status = channel.recv_exit_status()
+            if status != 0:
+                raise Exception(
+                    "Configuration script failed with exit status {0}. Last "
+                    "output lines were: {1}".format(status, output.tail(10)))
+            # The full output is archived in the task log. stderr is
+            # interleaved with stdout but the key is kept for the consumers
+            # of the launch result.
             return {
-                'stdout': stdout.read(),
-                'stderr': stderr.read()
+                'stdout': '\n'.join(output.tail(output.lines.maxlen)),
+                'stderr': ''
             }
         except SSHException as sshe:
             raise Exception("Failed to execute '{}' on {}".format(
                 config_script, host)) from sshe
+        finally:
+            ssh.close()
 
 
 class AnsibleAppConfigurer(SSHBasedConfigurer):
 
-    def validate(self, app_config, provider_config):
-        super().validate(app_config, provider_config)
+    # Ansible makes its own connections to the hosts
+    reuses_ssh_connection = False
 
+    def validate(self, app_config, provider_config):
         # validate required app_config values
         playbooks = app_config.get('config_appliance', {}).get('playbooks')
         # backward compatibility
@@ -197,15 +439,26 @@ class AnsibleAppConfigurer(SSHBasedConfigurer):
             raise Exception("config_appliance missing required parameter: "
                             "playbooks")
 
+        super().validate(app_config, provider_config)
+
     def configure(self, app_config, provider_config, playbook_vars=None):
-        host_config = provider_config.get('host_config', {})
-        host = host_config.get('host_address')
-        user = host_config.get('ssh_user')
-        ssh_private_key = host_config.get('ssh_private_key')
-        if 'RSA' not in ssh_private_key:
-            ssh_private_key = ssh_private_key.replace(
-                ' PRIVATE', ' RSA PRIVATE')
-            log.debug("Augmented ssh key with RSA type: %s" % ssh_private_key)
+        """
+        Configure one or more hosts by running the app's playbooks on them.
+
+        The hosts are given by the list of host configs in
+        ``provider_config['host_configs']`` or, for a single host, by
+        ``provider_config['host_config']``. Each playbook is run once for all
+        the hosts, which Ansible configures in parallel. Besides the
+        connection details, a host config may contain a ``name`` for the host
+        in the inventory (defaulting to its address), a list of inventory
+        ``groups`` for the host and a ``dict`` of host ``vars``.
+
+        If a playbook fails on some of the hosts, a ``PlaybookRunFailed``
+        exception listing them is raised once the other hosts have been
+        configured.
+        """
+        hosts = (provider_config.get('host_configs') or
+                 [provider_config.get('host_config', {})])
 
         playbooks = app_config.get('config_appliance', {}).get('playbooks', [])
         # backward compatibility
@@ -220,20 +473,96 @@ class AnsibleAppConfigurer(SSHBasedConfigurer):
                 'url': playbook_url,
                 'inventory_template': inventory
             }]
-        for playbook in sorted(playbooks, key=lambda p: int(p.get('ordinal', 0))):
-            playbook_url = playbook.get('url')
-            inventory = playbook.get('inventory_template') or DEFAULT_INVENTORY_TEMPLATE
-            self._run_playbook(playbook_url, inventory, host, ssh_private_key, user,
-                               playbook_vars)
+        # The playbooks of this run share the facts gathered for the hosts.
+        # Other runs, including ones for a host with the same address, keep
+        # theirs apart.
+        fact_cache_dir = self._make_fact_cache_dir()
+        try:
+            # Playbooks run in order of their ordinal; ones sharing an
+            # ordinal are independent of each other and run concurrently
+            for _, group in itertools.groupby(
+                    sorted(playbooks, key=lambda p: int(p.get('ordinal', 0))),
+                    key=lambda p: int(p.get('ordinal', 0))):
+                group = list(group)
+                if len(group) == 1:
+                    playbook = group[0]
+                    playbook_url = playbook.get('url')
+                    inventory = playbook.get('inventory_template') or DEFAULT_INVENTORY_TEMPLATE
+                    self._run_playbook(playbook_url, inventory, hosts,
+                                       playbook_vars, ref=playbook.get('ref'),
+                                       fact_cache_dir=fact_cache_dir)
+                else:
+                    self._run_playbooks_concurrently(
+                        group, hosts, playbook_vars,
+                        fact_cache_dir=fact_cache_dir)
+        finally:
+            shutil.rmtree(fact_cache_dir, ignore_errors=True)
         return {}
 
-    def _run_playbook(self, playbook, inventory, host, pk, user='ubuntu',
-                      playbook_vars=None):
+    def _run_playbooks_concurrently(self, playbooks, hosts,
+                                    playbook_vars=None, fact_cache_dir=None):
+        """
+        Run independent playbooks against the same hosts at the same time.
+
+        Each playbook runs in its own working directory. As soon as one of
+        the playbooks fails on all of the hosts, the others are cancelled. A
+        ``PlaybookRunFailed`` exception combining the errors of all failed
+        playbooks is raised if any playbook failed.
+
+        See ``_run_playbook`` for the description of the arguments.
+
+        :type playbooks: ``list`` of ``dict``
+        :param playbooks: The ``config_appliance`` entries of the playbooks.
         """
-        Run an Ansible playbook to configure a host.
+        cancel_event = threading.Event()
+        errors = []
+        failed_hosts = set()
+        target = self._get_hosts_description(hosts)
+        log.info("Running %s playbooks concurrently on %s", len(playbooks),
+                 target)
+        with ThreadPoolExecutor(max_workers=len(playbooks)) as executor:
+            futures = {
+                executor.submit(
+                    self._run_playbook, playbook.get('url'),
+                    playbook.get('inventory_template') or DEFAULT_INVENTORY_TEMPLATE,
+                    hosts, playbook_vars, ref=playbook.get('ref'),
+                    cancel_event=cancel_event,
+                    fact_cache_dir=fact_cache_dir): playbook.get('url')
+                for playbook in playbooks}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    log.info("Playbook %s completed on %s", futures[future],
+                             target)
+                except PlaybookRunCancelled:
+                    log.info("Playbook %s cancelled on %s", futures[future],
+                             target)
+                    # A cancelled playbook leaves all hosts part configured
+                    failed_hosts = None
+                except Exception as e:
+                    errors.append("{0}: {1}".format(futures[future], e))
+                    if (getattr(e, 'failed_hosts', None) and
+                            len(e.failed_hosts) < len(hosts)):
+                        if failed_hosts is not None:
+                            failed_hosts.update(e.failed_hosts)
+                    else:
+                        cancel_event.set()
+                        failed_hosts = None
+        if errors:
+            raise PlaybookRunFailed(
+                "Running playbooks on {0} failed. {1}".format(
+                    target, " ".join(errors)),
+                sorted(failed_hosts) if failed_hosts else None)
 
-        First clone a playbook from the supplied repo if not already
-        available, configure the Ansible inventory, and run the playbook.
+    def _run_playbook(self, playbook, inventory, hosts, playbook_vars=None,
+                      ref=None, cancel_event=None, fact_cache_dir=None):
+        """
+        Run an Ansible playbook to configure one or more hosts.
+
+        First export the playbook from a local mirror of the supplied repo
+        (see ``_get_playbook_mirror``) into a working directory for this run,
+        configure the Ansible inventory, and run the playbook once for all
+        the hosts.
 
         The method assumes ``ansible-playbook`` system command is available.
 
@@ -243,53 +572,54 @@ class AnsibleAppConfigurer(SSHBasedConfigurer):
         :type inventory: ``str``
         :param inventory: A string ``Template``-like file
                           that will be used for running the playbook. The
-                          file should have defined variables for ``host`` and
-                          ``user``.
+                          file should have defined variables for ``hosts``
+                          or, for a single host, for ``host`` and ``user``.
+                          See ``_write_inventory``.
+
+        :type hosts: ``list`` of ``dict``
+        :param hosts: The host configs of the playbook targets.
 
         :type playbook_vars: ``list`` of tuples
         :param playbook_vars: A list of key/value tuples with variables to pass
                               to the playbook via command line arguments
                               (i.e., --extra-vars key=value).
 
-        :type host: ``str``
-        :param host: Hostname or IP of a machine as the playbook target.
+        :type ref: ``str``
+        :param ref: A branch, tag or commit of the playbook repository to run.
+                    Defaults to the repository's default branch.
 
-        :type pk: ``str``
-        :param pk: Private portion of an ssh key.
+        :type cancel_event: :class:`threading.Event`
+        :param cancel_event: If supplied, the run is stopped, raising
+                             ``PlaybookRunCancelled``, once the event is set.
 
-        :type user: ``str``
-        :param user: Target host system username with which to login.
+        :type fact_cache_dir: ``str``
+        :param fact_cache_dir: Directory caching the facts gathered for the
+                               hosts, shared with the other playbooks of the
+                               same configure run. Defaults to a directory
+                               of this run only.
         """
-        # Clone the repo in its own dir if multiple tasks run simultaneously
-        # The path must be to a folder that doesn't already contain a git repo,
-        # including any parent folders
-        # TODO: generalize this temporary directory
-        repo_path = '/tmp/cloudlaunch_plugin_runners/rancher_ansible_%s' % host
-        try:
-            log.info("Delete plugin runner folder %s if not empty", repo_path)
-            shutil.rmtree(repo_path)
-        except FileNotFoundError:
-            pass
+        host = hosts[0].get('host_address')
+        # Export the playbook in its own dir as multiple runs, including ones
+        # for the same host, may happen simultaneously. The path must be to a
+        # folder that doesn't already contain a git repo, including any parent
+        # folders
+        os.makedirs(settings.CLOUDLAUNCH_PLUGIN_RUNNERS_DIR, exist_ok=True)
+        repo_path = tempfile.mkdtemp(prefix='rancher_ansible_%s_' % host,
+                                     dir=settings.CLOUDLAUNCH_PLUGIN_RUNNERS_DIR)
         try:
             # Ensure the playbook is available
-            log.info("Cloning Ansible playbook %s to %s", playbook, repo_path)
-            Repo.clone_from(playbook, to_path=repo_path)
-            # Create a private ssh key file
-            pkf = os.path.join(repo_path, 'pk')
-            with os.fdopen(os.open(pkf, os.O_WRONLY | os.O_CREAT, 0o600),
-                           'w') as f:
-                f.writelines(pk)
-            # Create an inventory file
-            inv = Template(inventory)
-            inventory_path = os.path.join(repo_path, 'inventory.ini')
-            with open(inventory_path, 'w') as f:
-                log.info("Creating inventory file %s", inventory_path)
-                f.writelines(inv.substitute({'host': host, 'user': user}))
+            log.info("Exporting Ansible playbook %s (%s) to %s", playbook,
+                     ref or 'HEAD', repo_path)
+            self._export_playbook(playbook, ref, repo_path)
+            self._write_inventory(repo_path, inventory, hosts)
             # Write the ansible values file
             values_file_path = os.path.join(repo_path, 'values.yml')
             with open(values_file_path, 'w') as f:
                 log.info("Creating ansible values file %s", values_file_path)
                 yaml.dump(playbook_vars or {}, f, default_flow_style=False)
+            self._write_ansible_cfg(
+                repo_path,
+                fact_cache_dir or os.path.join(repo_path, '.fact_cache'))
             # Run the playbook
             cmd = ["ansible-playbook", "-i", "inventory.ini", "playbook.yml"]
             if playbook_vars:
@@ -297,32 +627,422 @@ class AnsibleAppConfigurer(SSHBasedConfigurer):
             # TODO: Sanitize before printing
             log.debug("Running Ansible with values:\n%s",
                       yaml.dump(playbook_vars or {}, default_flow_style=False))
-            output_buffer = self._run_ansible_process(cmd, repo_path)
+            output_buffer = self._run_resumable_playbook(cmd, repo_path,
+                                                         cancel_event)
         finally:
             if not settings.DEBUG:
                 log.info("Deleting ansible playbook %s", repo_path)
                 shutil.rmtree(repo_path)
         return 0, output_buffer
 
-    @tenacity.retry(stop=tenacity.stop_after_attempt(3),
-                    wait=tenacity.wait_exponential(multiplier=1, min=4, max=256),
+    def _write_inventory(self, repo_path, inventory, hosts):
+        """
+        Write the inventory file, and the private ssh keys it refers to.
+
+        The inventory ``Template`` is rendered with ``hosts``, a line per
+        host with its connection details and host vars followed by a section
+        per inventory group, and, for templates written for a single host,
+        with ``host`` and ``user``, the address and ssh user of the first
+        host. The ssh private keys are written to ``pk`` and, for any hosts
+        with a different key, ``pk_1``, ``pk_2`` and so on.
+        """
+        inv = Template(inventory)
+        if len(hosts) > 1 and not self._template_uses(inv, 'hosts'):
+            raise Exception("The inventory template does not support "
+                            "multiple hosts; it must use ${hosts}")
+        key_files = {}
+        host_lines = []
+        groups = {}
+        for host_config in hosts:
+            pk = ssh_keys.normalize_private_key(
+                host_config.get('ssh_private_key'))
+            if pk not in key_files:
+                key_files[pk] = 'pk_%s' % len(key_files) if key_files else 'pk'
+                # Create a private ssh key file
+                pkf = os.path.join(repo_path, key_files[pk])
+                with os.fdopen(os.open(pkf, os.O_WRONLY | os.O_CREAT, 0o600),
+                               'w') as f:
+                    f.writelines(pk)
+            name = host_config.get('name') or host_config.get('host_address')
+            host_vars = {
+                'ansible_host': host_config.get('host_address'),
+                'ansible_user': host_config.get('ssh_user'),
+                'ansible_ssh_private_key_file': key_files[pk],
+                **host_config.get('vars', {})
+            }
+            host_lines.append(' '.join([name] + [
+                '{0}={1}'.format(key, shlex.quote(str(value)))
+                for key, value in host_vars.items() if value is not None]))
+            for group in host_config.get('groups', []):
+                groups.setdefault(group, []).append(name)
+        for group, names in groups.items():
+            host_lines += ['', '[{0}]'.format(group)] + names
+        inventory_path = os.path.join(repo_path, 'inventory.ini')
+        with open(inventory_path, 'w') as f:
+            log.info("Creating inventory file %s", inventory_path)
+            f.writelines(inv.substitute({
+                'hosts': '\n'.join(host_lines),
+                'host': hosts[0].get('host_address'),
+                'user': hosts[0].get('ssh_user')}))
+
+    @staticmethod
+    def _template_uses(template, identifier):
+        """Check whether a ``Template`` has a placeholder for ``identifier``."""
+        return any(identifier in (match.group('named'), match.group('braced'))
+                   for match in template.pattern.finditer(template.template))
+
+    @staticmethod
+    def _get_hosts_description(hosts):
+        return ', '.join(host_config.get('name') or
+                         host_config.get('host_address')
+                         for host_config in hosts)
+
+    @staticmethod
+    def _make_fact_cache_dir():
+        """Create a fact cache directory for a configure run."""
+        facts_dir = os.path.join(settings.CLOUDLAUNCH_PLUGIN_RUNNERS_DIR,
+                                 'facts')
+        os.makedirs(facts_dir, exist_ok=True)
+        return tempfile.mkdtemp(dir=facts_dir)
+
+    def _write_ansible_cfg(self, repo_path, fact_cache_dir):
+        """
+        Write the Ansible configuration for a playbook run.
+
+        The configuration cuts the per task overhead of a run: modules are
+        piped over ssh instead of being copied to the host, ssh connections
+        are kept open and shared across tasks (and concurrent runs), and the
+        gathered facts are cached in ``fact_cache_dir`` for the other
+        playbooks of the same configure run.
+
+        If the playbook repository comes with its own ``ansible.cfg``, the
+        options it sets take precedence.
+        """
+        cfg_path = os.path.join(repo_path, 'ansible.cfg')
+        # Disable interpolation to keep Ansible's %-escapes as they are
+        cfg = configparser.ConfigParser(interpolation=None)
+        cfg.read(cfg_path)
+        defaults = {
+            'defaults': {
+                'host_key_checking': 'False',
+                'retry_files_enabled': 'False',
+                'forks': str(settings.CLOUDLAUNCH_ANSIBLE_FORKS),
+                'gathering': 'smart',
+                'fact_caching': 'jsonfile',
+                'fact_caching_connection': fact_cache_dir,
+                'fact_caching_timeout': '7200'
+            },
+            'ssh_connection': {
+                'pipelining': 'True',
+                'ssh_args': '-C -o ControlMaster=auto -o ControlPersist=60s '
+                            '-o UserKnownHostsFile=/dev/null',
+                # Keep the path short; it must fit a unix socket name
+                'control_path_dir': ANSIBLE_CONTROL_PATH_DIR,
+                'control_path': '%(directory)s/%%C'
+            }
+        }
+        for section, options in defaults.items():
+            if not cfg.has_section(section):
+                cfg.add_section(section)
+            for option, value in options.items():
+                if not cfg.has_option(section, option):
+                    cfg.set(section, option, value)
+        # Cloud IP addresses get reused by new hosts with new keys so host
+        # keys are never recorded, whatever the repository's ssh_args
+        ssh_args = cfg.get('ssh_connection', 'ssh_args')
+        if 'UserKnownHostsFile' not in ssh_args:
+            cfg.set('ssh_connection', 'ssh_args',
+                    ssh_args + ' -o UserKnownHostsFile=/dev/null')
+        with open(cfg_path, 'w') as f:
+            log.info("Creating ansible config file %s", cfg_path)
+            cfg.write(f)
+
+    def _get_playbook_mirror(self, url, ref=None):
+        """
+        Get an up to date, local bare mirror of a playbook repository.
+
+        Mirrors are shared by all runs of a repository and kept in
+        ``CLOUDLAUNCH_PLAYBOOK_CACHE_DIR``, keyed by the repository URL. A
+        mirror is fetched from the remote when it's older than
+        ``CLOUDLAUNCH_PLAYBOOK_CACHE_TTL`` seconds, unless ``ref`` pins a
+        commit that's already in the mirror, or when ``ref`` isn't in it.
+
+        The caller must hold the mirror's lock (see ``_lock_playbook_mirror``).
+
+        :rtype: :class:`git.Repo`
+        :return: The mirror repository.
+        """
+        mirror_path = self._get_playbook_mirror_path(url)
+        if not os.path.exists(mirror_path):
+            log.info("Mirroring Ansible playbook %s to %s", url, mirror_path)
+            tmp_path = tempfile.mkdtemp(prefix='tmp_',
+                                        dir=os.path.dirname(mirror_path))
+            try:
+                Repo.clone_from(url, to_path=tmp_path, mirror=True)
+                os.rename(tmp_path, mirror_path)
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            return Repo(mirror_path)
+        mirror = Repo(mirror_path)
+        pinned = ref and re.match(r'^[0-9a-f]{40}$', ref)
+        age = time.time() - os.path.getmtime(mirror_path)
+        if ((age > settings.CLOUDLAUNCH_PLAYBOOK_CACHE_TTL and not
+                (pinned and self._has_ref(mirror, ref))) or
+                (ref and not self._has_ref(mirror, ref))):
+            log.info("Fetching Ansible playbook %s into %s", url, mirror_path)
+            mirror.git.remote('update', '--prune')
+            os.utime(mirror_path)
+        return mirror
+
+    @staticmethod
+    def _has_ref(repo, ref):
+        try:
+            repo.git.rev_parse('--verify', '--quiet', ref + '^{commit}')
+            return True
+        except GitCommandError:
+            return False
+
+    @staticmethod
+    def _get_playbook_mirror_path(url):
+        return os.path.join(
+            settings.CLOUDLAUNCH_PLAYBOOK_CACHE_DIR,
+            hashlib.sha1(url.encode('utf-8')).hexdigest() + '.git')
+
+    @contextmanager
+    def _lock_playbook_mirror(self, url):
+        """Serialize access to a playbook mirror across processes."""
+        os.makedirs(settings.CLOUDLAUNCH_PLAYBOOK_CACHE_DIR, exist_ok=True)
+        with open(self._get_playbook_mirror_path(url) + '.lock', 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _export_playbook(self, url, ref, path):
+        """
+        Export the files of a playbook repository at ``ref`` into ``path``.
+
+        The export is a plain copy of the files, without any git metadata,
+        taken from the local mirror of the repository.
+        """
+        with self._lock_playbook_mirror(url):
+            mirror = self._get_playbook_mirror(url, ref)
+            archive = tempfile.TemporaryFile()
+            mirror.archive(archive, treeish=ref or 'HEAD', format='tar')
+        with archive:
+            archive.seek(0)
+            with tarfile.open(fileobj=archive) as tar:
+                tar.extractall(path)
+
+    def _run_resumable_playbook(self, cmd, repo_path, cancel_event=None):
+        """
+        Run a playbook, resuming it from the failed task if it fails.
+
+        A failed run is retried up to two times. Rather than replaying the
+        whole playbook, the first retry starts at the task that failed (using
+        ``--start-at-task``), as recorded by the ``cloudlaunch_timings``
+        callback plugin. Since the tasks before it are skipped, any variables
+        they register are missing from the resumed run so, if resuming fails
+        or isn't possible (e.g., a handler failed), the next retry replays
+        the whole playbook. Retries are limited (using ``--limit``) to the
+        hosts the previous attempt failed on, if known.
+
+        The duration of each task of each attempt is recorded to the
+        configurer output for diagnosis.
+
+        :rtype: ``str``
+        :return: The last lines of output of the successful attempt.
+        """
+        timings_path = os.path.join(repo_path, 'timings.json')
+        env = dict(os.environ,
+                   ANSIBLE_CALLBACK_PLUGINS=os.path.join(
+                       ANSIBLE_PLUGINS_DIR, 'callback'),
+                   ANSIBLE_CALLBACK_WHITELIST=','.join(filter(None, [
+                       os.environ.get('ANSIBLE_CALLBACK_WHITELIST'),
+                       'cloudlaunch_timings'])),
+                   CLOUDLAUNCH_TIMINGS_FILE=timings_path)
+        attempt_cmd = cmd
+        timings = {}
+        failed_hosts = None
+        try:
+            for attempt in tenacity.Retrying(
+                    stop=tenacity.stop_after_attempt(3),
+                    wait=tenacity.wait_exponential(multiplier=1, min=4, max=30),
                     reraise=True,
-                    after=lambda *args, **kwargs: log.debug("Error running ansible, rerunning playbook..."))
-    def _run_ansible_process(self, cmd, repo_path):
+                    retry=tenacity.retry_if_not_exception_type(
+                        PlaybookRunCancelled)):
+                with attempt:
+                    if attempt.retry_state.attempt_number > 1:
+                        attempt_cmd = self._get_retry_cmd(
+                            cmd, attempt_cmd, timings, failed_hosts)
+                    try:
+                        return self._run_ansible_process(
+                            attempt_cmd, repo_path, cancel_event, env)
+                    finally:
+                        timings = self._pop_timings(timings_path, repo_path)
+                        failed_hosts = (self._get_failed_hosts(timings) or
+                                        failed_hosts)
+        except PlaybookRunCancelled:
+            raise
+        except Exception as e:
+            raise PlaybookRunFailed(str(e), failed_hosts) from e
+
+    @staticmethod
+    def _get_retry_cmd(cmd, previous_cmd, timings, failed_hosts=None):
+        """Get the command retrying a failed run of the Ansible ``cmd``."""
+        retry_cmd = cmd
+        if failed_hosts:
+            log.debug("Limiting the ansible retry to hosts %s", failed_hosts)
+            retry_cmd = cmd + ['--limit', ','.join(failed_hosts)]
+        failed_task = timings.get('failed_task')
+        if (previous_cmd is cmd and failed_task and
+                not failed_task.get('handler')):
+            log.debug("Error running ansible, resuming playbook at task "
+                      "'%s'...", failed_task['name'])
+            return retry_cmd + ['--start-at-task', failed_task['name']]
+        log.debug("Error running ansible, rerunning playbook...")
+        return retry_cmd
+
+    @staticmethod
+    def _get_failed_hosts(timings):
+        """Get the names of the hosts an Ansible run recorded failures on."""
+        return sorted({t['host'] for t in timings.get('tasks', [])
+                       if t['status'] in ('failed', 'unreachable')})
+
+    def _pop_timings(self, timings_path, repo_path):
+        """
+        Read and remove the task timings recorded by the last Ansible run.
+
+        A summary of the run, with its slowest tasks, is written to the
+        configurer output.
+
+        :rtype: ``dict``
+        :return: The recorded timings (see the ``cloudlaunch_timings``
+                 callback plugin) or an empty ``dict``.
+        """
+        try:
+            with open(timings_path) as f:
+                timings = json.load(f)
+            os.remove(timings_path)
+        except (OSError, ValueError):
+            return {}
+        tasks = timings.get('tasks', [])
+        output = self._get_output()
+        source = os.path.basename(repo_path)
+        output.write("Ran {0} tasks in {1:.1f}s. Slowest tasks:".format(
+            len(tasks), sum(t['duration'] for t in tasks)), source)
+        for t in sorted(tasks, key=lambda t: t['duration'], reverse=True)[:5]:
+            output.write("  {0:.1f}s {1} ({2}, {3})".format(
+                t['duration'], t['name'], t['host'], t['status']), source)
+        return timings
+
+    def _run_ansible_process(self, cmd, repo_path, cancel_event=None,
+                             env=None):
         log.debug("Running Ansible with command: %s", " ".join(cmd))
-        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                              universal_newlines=True, cwd=repo_path) as process:
-            output_buffer = ""
-            while process.poll() is None:
-                output = process.stdout.readline()
-                output_buffer += output
-                if output:
-                    log.info(output)
-            # Read any remaining output
-            output_buffer += process.stdout.readline()
-            if process.poll() != 0:
+        if cancel_event and cancel_event.is_set():
+            raise PlaybookRunCancelled()
+        # A cancellable run gets its own process group so that cancelling it
+        # also stops the processes Ansible spawns
+        # stderr is interleaved with stdout so a full stderr can't stall it
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              universal_newlines=True, cwd=repo_path, env=env,
+                              start_new_session=bool(cancel_event)) as process:
+            if cancel_event:
+                threading.Thread(target=self._terminate_on_cancel,
+                                 args=(process, cancel_event),
+                                 daemon=True).start()
+            output = self._get_output()
+            source = os.path.basename(repo_path)
+            # The last lines of this run, for reporting errors
+            last_lines = deque(maxlen=10)
+            for line in process.stdout:
+                line = line.rstrip('\n')
+                last_lines.append(line)
+                output.write(line, source)
+                if line:
+                    log.info(line)
+            process.wait()
+            if cancel_event and cancel_event.is_set() and process.returncode != 0:
+                raise PlaybookRunCancelled()
+            if process.returncode != 0:
                 raise Exception("An error occurred while running the ansible playbook to"
                                 " configure instance. Check the logs. Last output lines"
-                                " were: {0}".format(output_buffer.split("\n")[-10:]))
-            log.info("Playbook status: %s", process.poll())
-        return output_buffer
+                                " were: {0}".format(list(last_lines)))
+            log.info("Playbook status: %s", process.returncode)
+        return "\n".join(last_lines)
+
+    @staticmethod
+    def _terminate_on_cancel(process, cancel_event):
+        """Terminate an Ansible process once ``cancel_event`` is set."""
+        while process.poll() is None:
+            if cancel_event.wait(1):
+                log.info("Cancelling Ansible process %s", process.pid)
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                return
+
+
+class CloudInitAppConfigurer(AppConfigurer):
+    """
+    Configure an app while its host boots, through cloud-init.
+
+    No ssh session is needed: the appliance configuration, made of any
+    ``cloud_config`` modules and/or a ``config_script``, is rendered into the
+    instance user data by ``render_cloud_config``. Once the script has run,
+    the host posts its exit status and last lines of output to a phone-home
+    URL.
+    """
+
+    configures_at_boot = True
+
+    def validate(self, app_config, provider_config):
+        config_appliance = app_config.get('config_appliance', {})
+        if not (config_appliance.get('config_script') or
+                config_appliance.get('cloud_config')):
+            raise Exception("config_appliance missing required parameter: "
+                            "config_script or cloud_config")
+
+    def configure(self, app_config, provider_config):
+        # The host configures itself during boot. Only staged launches wait
+        # for its phone-home report (see BaseVMAppPlugin.run_launch_stage).
+        return {}
+
+    def render_cloud_config(self, app_config, phone_home_url):
+        """
+        Render the appliance configuration as cloud-init cloud-config.
+
+        The ``runCmd`` commands and the ``config_script`` are run, in that
+        order, after any commands of the ``cloud_config``. The exit status
+        and output of the script are then posted, as JSON, to
+        ``phone_home_url``.
+
+        :type phone_home_url: ``str``
+        :param phone_home_url: The URL the host reports back to.
+
+        :rtype: ``dict``
+        :return: The cloud-config to include in the instance user data.
+        """
+        self.validate(app_config, {})
+        config_appliance = app_config.get('config_appliance', {})
+        cloud_config = config_appliance.get('cloud_config') or {}
+        if isinstance(cloud_config, str):
+            cloud_config = yaml.safe_load(cloud_config) or {}
+        cloud_config = copy.deepcopy(cloud_config)
+        cloud_config.setdefault('write_files', []).extend([
+            {'path': CLOUDINIT_SCRIPT_PATH,
+             'permissions': '0700',
+             'content': config_appliance.get('config_script') or 'true\n'},
+            {'path': CLOUDINIT_PHONE_HOME_PATH,
+             'permissions': '0600',
+             'content': CLOUDINIT_PHONE_HOME_SCRIPT}])
+        runcmd = cloud_config.setdefault('runcmd', [])
+        runcmd.extend(config_appliance.get('runCmd') or [])
+        runcmd.extend([
+            ['sh', '-c', '{0} > {1} 2>&1; echo $? > {2}'.format(
+                CLOUDINIT_SCRIPT_PATH, CLOUDINIT_LOG_PATH,
+                CLOUDINIT_STATUS_PATH)],
+            ['python3', CLOUDINIT_PHONE_HOME_PATH, phone_home_url]])
+        return cloud_config
@@ -0,0 +1,114 @@
+"""Concurrent, asyncio based readiness checks for launched web apps."""
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from celery.utils.log import get_task_logger
+
+log = get_task_logger('cloudlaunch')
+
+# Status codes, besides 2xx and 3xx, accepted when none are specified
+DEFAULT_OK_STATUS_CODES = [401, 403]
+
+
+def is_ok_status(status, ok_status_codes=None):
+    """
+    Check whether an HTTP status code signals that an app is up.
+
+    Any 2xx or 3xx code is accepted, along with the supplied error codes.
+
+    :type ok_status_codes: ``list`` of int
+    :param ok_status_codes: Additional status codes that are considered OK.
+                            Defaults to ``DEFAULT_OK_STATUS_CODES``.
+    """
+    if ok_status_codes is None:
+        ok_status_codes = DEFAULT_OK_STATUS_CODES
+    return status < 400 or status in ok_status_codes
+
+
+class HttpReadinessProber(object):
+    """
+    Watch any number of app URLs until each one responds with an OK status.
+
+    All probes share a single pooled HTTP client and run concurrently on an
+    asyncio event loop. The delay between probes of a URL grows exponentially
+    from ``initial_delay`` up to ``max_delay`` seconds, with full jitter so
+    that probes of apps launched together do not stay in lockstep.
+    """
+
+    def __init__(self, max_connections=100, request_timeout=10,
+                 initial_delay=1, max_delay=30):
+        self.max_connections = max_connections
+        self.request_timeout = request_timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+
+    def create_session(self):
+        """Create the pooled HTTP client to be shared by probes."""
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections,
+                                           ssl=False),
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+
+    def next_delay(self, attempt):
+        """Return the (jittered) delay before the given probe attempt."""
+        return random.uniform(
+            0, min(self.max_delay, self.initial_delay * 2 ** attempt))
+
+    async def probe(self, session, url, ok_status_codes=None):
+        """
+        Check once whether the app is responding at ``url``.
+
+        :rtype: ``bool``
+        :return: ``True`` if the app responded with an OK status code.
+        """
+        try:
+            async with session.head(url, allow_redirects=False) as resp:
+                return is_ok_status(resp.status, ok_status_codes)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            log.debug("Probe of %s failed: %s", url, exc)
+            return False
+
+    async def wait_for(self, session, url, ok_status_codes=None,
+                       timeout=1000):
+        """
+        Probe ``url`` with backoff until it is ready or ``timeout`` expires.
+
+        :rtype: ``bool``
+        :return: ``True`` if the app became ready, ``False`` on timeout.
+        """
+        deadline = time.time() + timeout
+        attempt = 0
+        while True:
+            if await self.probe(session, url, ok_status_codes):
+                return True
+            delay = self.next_delay(attempt)
+            if time.time() + delay > deadline:
+                return False
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def watch(self, session, check, on_done):
+        """
+        Wait for a single check and report its outcome.
+
+        :type check: ``dict``
+        :param check: A dict with ``url`` and, optionally, ``ok_status_codes``
+                      and ``timeout`` keys. It is passed back to ``on_done``.
+
+        :type on_done: coroutine function
+        :param on_done: Called as ``on_done(check, ready)`` once the app is
+                        ready (``ready`` is ``True``) or the check timed out.
+        """
+        ready = await self.wait_for(session, check['url'],
+                                    check.get('ok_status_codes'),
+                                    check.get('timeout', 1000))
+        await on_done(check, ready)
+
+    async def wait_for_all(self, checks, on_done):
+        """Watch all the supplied checks concurrently until each is done."""
+        async with self.create_session() as session:
+            await asyncio.gather(
+                *[self.watch(session, check, on_done) for check in checks])
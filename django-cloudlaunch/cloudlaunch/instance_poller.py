@@ -0,0 +1,240 @@
+"""Polling of the state of launched instances, batched per cloud account."""
+import threading
+import time
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+from cloudbridge.interfaces import InstanceState
+from cloudbridge.interfaces.exceptions import WaitStateException
+
+from cloudlaunch import cloud_cache
+
+log = get_task_logger('cloudlaunch')
+
+# Field of a listing holding the time it was made, next to the instance ids
+LISTED_FIELD = '_listed'
+
+
+class LocalInstanceStateBackend(object):
+    """
+    Listings kept in this process.
+
+    Only shares listings between the threads of a single process, so this
+    backend is meant for tests and single process deployments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claims = {}
+        self._listings = {}
+
+    def claim(self, key, ttl):
+        """
+        Claim the next listing of an account for ``ttl`` seconds.
+
+        :rtype: ``bool``
+        :return: ``True`` if the caller should make the listing; ``False`` if
+                 another caller claimed it within the last ``ttl`` seconds.
+        """
+        with self._lock:
+            now = time.time()
+            if self._claims.get(key, 0) > now:
+                return False
+            self._claims[key] = now + ttl
+            return True
+
+    def store(self, key, states, listed, ttl):
+        """Replace the listing of an account, kept for ``ttl`` seconds."""
+        with self._lock:
+            self._listings[key] = (time.time() + ttl, listed, dict(states))
+
+    def get(self, key, instance_id):
+        """
+        Get the state of an instance from the latest listing of its account.
+
+        :rtype: ``tuple``
+        :return: The time the listing was made and the listed state of the
+                 instance, each ``None`` if there is no listing or the
+                 instance wasn't listed.
+        """
+        with self._lock:
+            expires, listed, states = self._listings.get(key, (0, None, {}))
+        if expires < time.time():
+            return None, None
+        return listed, states.get(instance_id)
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+            self._listings.clear()
+
+
+class RedisInstanceStateBackend(object):
+    """Listings kept in Redis hashes and shared by all the workers."""
+
+    def __init__(self, url):
+        # Only required with this backend
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def claim(self, key, ttl):
+        return bool(self._client.set(key + ':claim', 1, nx=True,
+                                     px=int(ttl * 1000)))
+
+    def store(self, key, states, listed, ttl):
+        pipe = self._client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=dict(states, **{LISTED_FIELD: listed}))
+        pipe.expire(key, int(ttl))
+        pipe.execute()
+
+    def get(self, key, instance_id):
+        listed, state = self._client.hmget(key, LISTED_FIELD, instance_id)
+        return (float(listed) if listed is not None else None,
+                state.decode('utf-8') if state is not None else None)
+
+    def clear(self):
+        for key in self._client.scan_iter('cloudlaunch:instances:*'):
+            self._client.delete(key)
+
+
+class InstanceStatePoller(object):
+    """
+    Poll the state of instances with one list call per account and region.
+
+    Instead of each launch or deletion polling its own instance, the
+    instances of an account are listed at most once per ``interval`` by
+    whichever worker first needs a newer listing, and the states of the
+    listed instances are shared with all the workers through the backend.
+    The number of polling calls thus grows with the number of accounts
+    rather than with the number of waits or worker processes.
+
+    Instances missing from a listing, e.g., because the listing of a just
+    launched instance lags behind its creation, are looked up on their own,
+    as are all instances if the backend fails.
+    """
+
+    def __init__(self, backend, interval=5):
+        self.backend = backend
+        self.interval = interval
+
+    @staticmethod
+    def _get_key(provider):
+        return "cloudlaunch:instances:{0}".format(
+            cloud_cache.get_account_key(provider))
+
+    def _get_listed_state(self, provider, instance_id):
+        key = self._get_key(provider)
+        listed, state = self.backend.get(key, instance_id)
+        if ((listed is None or time.time() - listed > self.interval) and
+                self.backend.claim(key, self.interval)):
+            log.debug("Listing the instances of account %s",
+                      provider.PROVIDER_ID)
+            states = {inst.id: inst.state
+                      for inst in provider.compute.instances}
+            # Keep the listing for a while so that waits keep being served
+            # from it should the next listing be late
+            self.backend.store(key, states, time.time(), self.interval * 10)
+            state = states.get(instance_id)
+        return state
+
+    def get_state(self, provider, instance_id):
+        """
+        Get the state of an instance as of the latest listing of its account.
+
+        :rtype: ``str``
+        :return: The ``InstanceState`` of the instance; ``UNKNOWN`` if it
+                 does not exist.
+        """
+        try:
+            state = self._get_listed_state(provider, instance_id)
+        except Exception:
+            log.exception("Could not read the instance listing of account "
+                          "%s; looking up instance %s on its own",
+                          provider.PROVIDER_ID, instance_id)
+            state = None
+        if state is None:
+            inst = provider.compute.instances.get(instance_id)
+            state = inst.state if inst else InstanceState.UNKNOWN
+        return state
+
+    def wait_for(self, provider, instance_id, target_states,
+                 terminal_states=None, timeout=None):
+        """
+        Wait until an instance reaches one of the target states.
+
+        A nonexistent instance is considered to be in the ``UNKNOWN`` state.
+        Mirrors the CloudBridge ``wait_for`` method of instances.
+
+        :type timeout: ``int``
+        :param timeout: Seconds to wait for. Defaults to the provider's
+                        default wait timeout.
+        """
+        if timeout is None:
+            timeout = provider.config.default_wait_timeout
+        end_time = time.time() + timeout
+        while True:
+            state = self.get_state(provider, instance_id)
+            if state in target_states:
+                return True
+            if state in (terminal_states or []):
+                raise WaitStateException(
+                    "Instance {0} is in state: {1} which is a terminal state "
+                    "and cannot be waited on.".format(instance_id, state))
+            if time.time() > end_time:
+                raise WaitStateException(
+                    "Waited too long for instance {0} to become {1}. Instance "
+                    "is in state: {2}".format(instance_id, target_states,
+                                              state))
+            time.sleep(self.interval)
+
+    def wait_till_ready(self, provider, instance_id, timeout=None):
+        """Wait until an instance is running; see ``wait_for``."""
+        return self.wait_for(
+            provider, instance_id, [InstanceState.RUNNING],
+            terminal_states=[InstanceState.DELETED, InstanceState.ERROR],
+            timeout=timeout)
+
+    def clear(self):
+        """Discard the latest listings of all accounts."""
+        self.backend.clear()
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller():
+    """
+    Get the instance state poller.
+
+    Instances are listed at most every ``CLOUDLAUNCH_INSTANCE_POLL_INTERVAL``
+    seconds per account. ``CLOUDLAUNCH_INSTANCE_STATE_BACKEND`` is either
+    ``redis`` (listings shared at ``CLOUDLAUNCH_INSTANCE_STATE_REDIS_URL``)
+    or ``local`` (in-process listings). If the Redis backend can't be set
+    up, e.g., because the ``redis`` package is missing, listings are kept
+    per process instead.
+
+    :rtype: :class:`InstanceStatePoller`
+    """
+    global _poller
+    with _poller_lock:
+        if not _poller:
+            backend = settings.CLOUDLAUNCH_INSTANCE_STATE_BACKEND
+            if backend == 'redis':
+                try:
+                    backend = RedisInstanceStateBackend(
+                        settings.CLOUDLAUNCH_INSTANCE_STATE_REDIS_URL)
+                except Exception:
+                    log.exception("Could not set up the Redis instance state "
+                                  "backend; listing instances per process")
+                    backend = LocalInstanceStateBackend()
+            elif backend == 'local':
+                backend = LocalInstanceStateBackend()
+            else:
+                raise ValueError(
+                    "Unsupported instance state backend: {}".format(backend))
+            _poller = InstanceStatePoller(
+                backend, interval=settings.CLOUDLAUNCH_INSTANCE_POLL_INTERVAL)
+    return _poller
@@ -0,0 +1,204 @@
+"""Locks serializing the creation of cloud resources shared by launches."""
+import hashlib
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from celery.utils.log import get_task_logger
+
+from cloudlaunch import cloud_cache
+
+log = get_task_logger('cloudlaunch')
+
+# Seconds between attempts to acquire a held lock
+LOCK_POLL_INTERVAL = 0.1
+
+# Release a Redis lock only if it is still held with the acquiring token
+REDIS_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class LocalLockBackend(object):
+    """
+    Locks held within this process.
+
+    Only serializes the launches run by the threads of a single process, so
+    this backend is meant for tests and single process deployments.
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def acquire(self, key, lease, timeout):
+        with self._locks_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        if not lock.acquire(timeout=timeout):
+            return None
+        return lock
+
+    def release(self, key, token):
+        token.release()
+
+
+class DatabaseLockBackend(object):
+    """
+    PostgreSQL advisory locks, held by the database connection of a thread.
+
+    Advisory locks have no lease, so the lease of ``acquire`` is ignored; a
+    lock is released when its holder releases it or its connection closes,
+    e.g., because the worker holding it died. Other databases don't provide
+    advisory locks so, with them, locks fall back to a ``LocalLockBackend``,
+    which doesn't serialize launches run by different worker processes. A
+    warning is logged the first time that happens.
+    """
+
+    def __init__(self):
+        self._local = LocalLockBackend()
+        self._warned = False
+
+    def _is_supported(self):
+        if connection.vendor == 'postgresql':
+            return True
+        if not self._warned:
+            self._warned = True
+            log.warning("The %s database doesn't provide advisory locks; "
+                        "falling back to locks held within each process, "
+                        "which don't serialize launches run by different "
+                        "worker processes. Use PostgreSQL or set "
+                        "CLOUDLAUNCH_LOCK_BACKEND to 'redis'.",
+                        connection.vendor)
+        return False
+
+    @staticmethod
+    def _get_lock_id(key):
+        # Advisory lock ids are signed 64 bit integers
+        return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8],
+                              'big', signed=True)
+
+    def acquire(self, key, lease, timeout):
+        if not self._is_supported():
+            return self._local.acquire(key, lease, timeout)
+        lock_id = self._get_lock_id(key)
+        deadline = time.time() + timeout
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+                if cursor.fetchone()[0]:
+                    return lock_id
+                if time.time() > deadline:
+                    return None
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def release(self, key, token):
+        if not self._is_supported():
+            return self._local.release(key, token)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [token])
+
+
+class RedisLockBackend(object):
+    """
+    Redis keys set for the duration of a lease.
+
+    A lock not released by its holder, e.g., because the worker holding it
+    died, expires at the end of its lease.
+    """
+
+    def __init__(self, url):
+        # Only required with this backend
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def acquire(self, key, lease, timeout):
+        token = uuid.uuid4().hex
+        deadline = time.time() + timeout
+        while not self._client.set(key, token, nx=True,
+                                   px=int(lease * 1000)):
+            if time.time() > deadline:
+                return None
+            time.sleep(LOCK_POLL_INTERVAL)
+        return token
+
+    def release(self, key, token):
+        self._client.eval(REDIS_RELEASE_SCRIPT, 1, key, token)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Get the lock backend selected with ``CLOUDLAUNCH_LOCK_BACKEND``.
+
+    One of ``database`` (PostgreSQL advisory locks), ``redis`` (locks kept
+    at ``CLOUDLAUNCH_LOCK_REDIS_URL``) or ``local`` (in-process locks).
+    """
+    global _backend
+    with _backend_lock:
+        if not _backend:
+            backend = settings.CLOUDLAUNCH_LOCK_BACKEND
+            if backend == 'database':
+                _backend = DatabaseLockBackend()
+            elif backend == 'redis':
+                _backend = RedisLockBackend(
+                    settings.CLOUDLAUNCH_LOCK_REDIS_URL)
+            elif backend == 'local':
+                _backend = LocalLockBackend()
+            else:
+                raise ValueError(
+                    "Unsupported lock backend: {}".format(backend))
+    return _backend
+
+
+@contextmanager
+def lock(provider, name, lease=None, timeout=None):
+    """
+    Hold the lock for creating a resource in the provider's cloud account.
+
+    Launches getting or creating the same shared resource, such as a key
+    pair or VM firewall, should do so while holding its lock so that only
+    one of them creates it. The others wait for the lock and then find the
+    created resource.
+
+    :type provider: :class:`CloudBridge.CloudProvider`
+    :param provider: The provider for the account the resource belongs to.
+
+    :type name: ``str``
+    :param name: Identifies the resource within the account, e.g.,
+                 ``key_pair:cloudlaunch-key-pair``.
+
+    :type lease: ``int``
+    :param lease: Seconds after which a lock that wasn't released expires,
+                  with the ``redis`` backend only. Defaults to
+                  ``CLOUDLAUNCH_LOCK_LEASE``.
+
+    :type timeout: ``int``
+    :param timeout: Seconds to wait for the lock before raising
+                    ``LockTimeout``. Defaults to ``CLOUDLAUNCH_LOCK_TIMEOUT``.
+    """
+    lease = lease or settings.CLOUDLAUNCH_LOCK_LEASE
+    timeout = timeout or settings.CLOUDLAUNCH_LOCK_TIMEOUT
+    key = "cloudlaunch:lock:{0}:{1}".format(
+        cloud_cache.get_account_key(provider), name)
+    backend = get_backend()
+    token = backend.acquire(key, lease, timeout)
+    if token is None:
+        raise LockTimeout("Timed out waiting for the lock on {0}".format(name))
+    try:
+        yield
+    finally:
+        backend.release(key, token)
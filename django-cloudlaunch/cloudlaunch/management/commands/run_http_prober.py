@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+
+from celery.utils.log import get_task_logger
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cloudlaunch import models
+from cloudlaunch import tasks
+from cloudlaunch.http_prober import HttpReadinessProber
+
+log = get_task_logger('cloudlaunch')
+
+
+class Command(BaseCommand):
+    help = 'Runs the http prober service, which concurrently watches the ' \
+           'apps of staged launches until they respond and then completes ' \
+           'their launches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scan-interval', type=int, default=5,
+            help='Seconds between scans for new pending http checks')
+        parser.add_argument(
+            '--max-connections', type=int, default=100,
+            help='Maximum number of concurrent http connections')
+        parser.add_argument(
+            '--max-delay', type=int, default=30,
+            help='Maximum number of seconds between probes of an app')
+
+    def handle(self, *args, **options):
+        prober = HttpReadinessProber(
+            max_connections=options['max_connections'],
+            max_delay=options['max_delay'])
+        asyncio.run(self.run_prober(prober, options['scan_interval']))
+
+    async def run_prober(self, prober, scan_interval):
+        # Watched checks by launch task id. Keeps a reference to each watch so
+        # it isn't garbage collected and, once the watch is done, a ``None``
+        # till the check is removed so it does not get picked up again. A
+        # watch that failed is dropped so that its check is watched again.
+        watched = {}
+
+        async def on_done(check, ready):
+            task_id = check['launch_task_id']
+            try:
+                await sync_to_async(tasks.complete_http_wait.delay)(
+                    task_id, ready)
+            except Exception:
+                log.exception("Could not complete the http wait of launch "
+                              "%s; watching it again", task_id)
+                del watched[task_id]
+                return
+            watched[task_id] = None
+
+        async with prober.create_session() as session:
+            while True:
+                checks = await sync_to_async(self.get_pending_checks)()
+                for task_id in [task_id for task_id, watch in watched.items()
+                                if (watch.done() if watch else
+                                    task_id not in checks)]:
+                    watch = watched.pop(task_id)
+                    if watch and watch.exception():
+                        log.error("Watch of launch %s failed: %s", task_id,
+                                  watch.exception())
+                for task_id, check in checks.items():
+                    if task_id not in watched:
+                        watched[task_id] = asyncio.ensure_future(
+                            prober.watch(session, check, on_done))
+                await asyncio.sleep(scan_interval)
+
+    @staticmethod
+    def get_pending_checks():
+        """Return all pending http checks, keyed by launch task id."""
+        now = timezone.now()
+        return {check.launch_task_id: {
+            'launch_task_id': check.launch_task_id,
+            'url': check.url,
+            'ok_status_codes': json.loads(check.ok_status_codes or 'null'),
+            'timeout': max((check.expires - now).total_seconds(), 0)
+        } for check in models.PendingHttpCheck.objects.all()}
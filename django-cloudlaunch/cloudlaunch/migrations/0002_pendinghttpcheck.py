@@ -0,0 +1,25 @@
+# Generated by Django 2.2.9 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudlaunch', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingHttpCheck',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added', models.DateTimeField(auto_now_add=True)),
+                ('launch_task_id', models.TextField(help_text='Celery id of the LAUNCH task waiting on this check', max_length=64, unique=True)),
+                ('url', models.TextField(max_length=2048)),
+                ('ok_status_codes', models.TextField(blank=True, max_length=1024, null=True)),
+                ('result', models.TextField(max_length=16384)),
+                ('expires', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.9 on 2026-10-19 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudlaunch', '0002_pendinghttpcheck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhoneHome',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added', models.DateTimeField(auto_now_add=True)),
+                ('launch_task_id', models.TextField(help_text='Celery id of the LAUNCH task waiting on this report', max_length=64, unique=True)),
+                ('token', models.TextField(max_length=64, unique=True)),
+                ('status', models.IntegerField(blank=True, null=True)),
+                ('output', models.TextField(blank=True, max_length=16384, null=True)),
+                ('reported', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.9 on 2026-10-19 16:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudlaunch', '0003_phonehome'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='applicationdeploymenttask',
+            name='action',
+            field=models.CharField(blank=True, choices=[('LAUNCH', 'Launch'), ('HEALTH_CHECK', 'Health check'), ('RESTART', 'Restart'), ('DELETE', 'Delete'), ('BAKE', 'Bake image')], max_length=255, null=True),
+        ),
+        migrations.CreateModel(
+            name='BakedImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added', models.DateTimeField(auto_now_add=True)),
+                ('config_hash', models.CharField(max_length=64)),
+                ('app_version_cloud_config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='baked_images', to='cloudlaunch.ApplicationVersionCloudConfig')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cloudlaunch.Image')),
+            ],
+            options={
+                'unique_together': {('app_version_cloud_config', 'config_hash')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.9 on 2026-10-19 18:05
+
+from django.db import migrations, models
+import fernet_fields.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudlaunch', '0004_bakedimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskPayload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('added', models.DateTimeField(auto_now_add=True)),
+                ('expires', models.DateTimeField(db_index=True)),
+                ('data', fernet_fields.fields.EncryptedTextField()),
+            ],
+        ),
+    ]
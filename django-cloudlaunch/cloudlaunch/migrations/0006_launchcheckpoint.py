@@ -0,0 +1,23 @@
+# Generated by Django 2.2.9 on 2026-10-19 19:20
+
+from django.db import migrations, models
+import fernet_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudlaunch', '0005_taskpayload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LaunchCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('launch_task_id', models.TextField(help_text='Celery id of the LAUNCH task of this checkpoint', max_length=64, unique=True)),
+                ('state', fernet_fields.fields.EncryptedTextField()),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 import json
 import jsonmerge
+import uuid
 import yaml
 
 from celery.result import AsyncResult
@@ -10,10 +11,15 @@ import rest_framework.authtoken.models as drf_models
 
 from djcloudbridge import models as cb_models
 
+from fernet_fields import EncryptedTextField
+
 from polymorphic.models import PolymorphicModel
 
 import djcloudbridge
 
+from . import progress
+from . import util
+
 
 class Image(cb_models.DateNameAwareModel):
     image_id = models.CharField(max_length=50, verbose_name="Image ID")
@@ -250,6 +256,30 @@ class ApplicationVersionCloudConfig(ApplicationVersionTargetConfig):
         }
 
 
+class BakedImage(models.Model):
+    """
+    An image baked from a host configured for an app version cloud config.
+
+    Keyed by a hash of the configuration inputs of the host (see
+    ``BaseVMAppPlugin._get_config_hash``) so that later launches with the
+    same configuration can boot the baked image instead of configuring a
+    host from the stock image again.
+    """
+
+    added = models.DateTimeField(auto_now_add=True)
+    app_version_cloud_config = models.ForeignKey(
+        ApplicationVersionCloudConfig, on_delete=models.CASCADE,
+        related_name="baked_images")
+    image = models.ForeignKey(Image, on_delete=models.CASCADE)
+    config_hash = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = (("app_version_cloud_config", "config_hash"),)
+
+    def __str__(self):
+        return "{0} ({1})".format(self.image, self.config_hash)
+
+
 class ApplicationDeployment(cb_models.DateNameAwareModel):
     """Application deployment details."""
 
@@ -275,11 +305,13 @@ class ApplicationDeploymentTask(models.Model):
     HEALTH_CHECK = 'HEALTH_CHECK'
     RESTART = 'RESTART'
     DELETE = 'DELETE'
+    BAKE = 'BAKE'
     ACTION_CHOICES = (
         (LAUNCH, 'Launch'),
         (HEALTH_CHECK, 'Health check'),
         (RESTART, 'Restart'),
-        (DELETE, 'Delete')
+        (DELETE, 'Delete'),
+        (BAKE, 'Bake image')
     )
 
     added = models.DateTimeField(auto_now_add=True)
@@ -337,9 +369,16 @@ class ApplicationDeploymentTask(models.Model):
         attempt it made to de-serialize the value from JSON. If that does not
         work, the raw value is returned. It is hence desirable to serialize
         the result value before saving it here.
+
+        While a task is running, its latest progress is returned if recorded
+        (see ``progress``), without reading the result backend.
         """
         r = None
         if self.celery_id:
+            latest = progress.get(self.celery_id)
+            if latest:
+                r = latest['meta']
+                return r if isinstance(r, dict) else {'result': r}
             try:
                 task = AsyncResult(self.celery_id)
                 r = task.result
@@ -378,7 +417,8 @@ class ApplicationDeploymentTask(models.Model):
         was initiated, ``result`` field is available from the task. At the
         end of the period, the Celery task is deleted and the data is migrated
         to this table. By wrapping this field as a property, we ensure proper
-        data is returned.
+        data is returned. The status of a running task is read from its
+        latest progress, if recorded (see ``progress``).
 
         Available status values include: PENDING, STARTED, RETRY, FAILURE,
         SUCCESS, and "UNKNOWN - `Exception value`".
@@ -387,6 +427,9 @@ class ApplicationDeploymentTask(models.Model):
         """
         try:
             if self.celery_id:
+                latest = progress.get(self.celery_id)
+                if latest:
+                    return latest['state']
                 task = AsyncResult(self.celery_id)
                 return task.backend.get_task_meta(task.id).get('status')
             else:  # An older task which has been migrated so return DB val
@@ -398,6 +441,108 @@ class ApplicationDeploymentTask(models.Model):
     def status(self, value):
         self._status = value
 
+    @property
+    def log_path(self):
+        """
+        Path of the archived app configuration output of this task, if any.
+
+        The output is archived under the task's Celery id while it runs and
+        moved to a path keyed by the id of this record when the task result
+        is migrated to the database.
+        """
+        return util.get_task_log_path(self.celery_id or 'task-%s' % self.id)
+
+
+class PendingHttpCheck(models.Model):
+    """
+    A launched app waiting to respond over http before its launch completes.
+
+    Staged launches hand the wait for the app over to the http prober
+    service (see the ``run_http_prober`` management command), which watches
+    all pending checks concurrently and completes each launch once its app
+    is ready or the check expires.
+    """
+
+    added = models.DateTimeField(auto_now_add=True)
+    launch_task_id = models.TextField(
+        max_length=64, unique=True,
+        help_text="Celery id of the LAUNCH task waiting on this check")
+    url = models.TextField(max_length=2048)
+    # JSON encoded list of accepted http status codes besides 2xx and 3xx
+    ok_status_codes = models.TextField(max_length=1024, blank=True,
+                                       null=True)
+    # JSON encoded result of the launch, recorded once the check is done
+    result = models.TextField(max_length=1024 * 16)
+    expires = models.DateTimeField()
+
+    def __str__(self):
+        return "{0} ({1})".format(self.url, self.launch_task_id)
+
+
+class PhoneHome(models.Model):
+    """
+    The configuration report of a host configured by cloud-init during boot.
+
+    Registered when a staged launch provisions the host and filled in by
+    the host, through the phone-home endpoint, once its configuration script
+    has run. The launch waits for the report before it completes.
+    """
+
+    added = models.DateTimeField(auto_now_add=True)
+    launch_task_id = models.TextField(
+        max_length=64, unique=True,
+        help_text="Celery id of the LAUNCH task waiting on this report")
+    token = models.TextField(max_length=64, unique=True)
+    # Exit status of the configuration script; None till the host reports
+    status = models.IntegerField(blank=True, null=True)
+    output = models.TextField(max_length=1024 * 16, blank=True, null=True)
+    reported = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "{0} ({1})".format(self.launch_task_id, self.status)
+
+
+class TaskPayload(models.Model):
+    """
+    Data passed to a Celery task by reference rather than in its message.
+
+    Holds the data tasks need that can't be looked up from other models,
+    such as the user data of a launch or credentials supplied with a
+    request, so that neither large blobs nor secrets are sent through the
+    broker. See ``cloudlaunch.payloads``.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    added = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(db_index=True)
+    # JSON, zlib compressed and base64 encoded if large
+    data = EncryptedTextField()
+
+    def __str__(self):
+        return "{0}".format(self.id)
+
+
+class LaunchCheckpoint(models.Model):
+    """
+    The progress of a launch, recorded after each of its phases.
+
+    Holds the resources a launch has created so far (e.g., the instance id,
+    IP address and hostname) so that a launch task redelivered after its
+    worker was lost resumes from its last phase instead of creating them
+    again. See ``BaseVMAppPlugin.deploy``.
+    """
+
+    updated = models.DateTimeField(auto_now=True)
+    launch_task_id = models.TextField(
+        max_length=64, unique=True,
+        help_text="Celery id of the LAUNCH task of this checkpoint")
+    # JSON encoded; includes the launch's ssh key and app config
+    state = EncryptedTextField()
+
+    def __str__(self):
+        return "{0}".format(self.launch_task_id)
+
 
 class Usage(models.Model):
     """
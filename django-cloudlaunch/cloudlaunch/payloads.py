@@ -0,0 +1,174 @@
+"""
+References to the data Celery tasks need, sent in task messages instead of
+the data itself.
+
+Tasks are passed the ids of the objects they work on and resolve them in the
+worker. Data that can't be looked up from other models, such as the user
+data of a launch or credentials supplied with a request, is stored as a
+``TaskPayload`` and passed by its id. Either way, task messages stay small
+and secrets stay out of the broker.
+"""
+import base64
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from celery.utils.log import get_task_logger
+
+from djcloudbridge import models as cb_models
+
+from . import models
+
+log = get_task_logger('cloudlaunch')
+
+# Prefix of the payloads stored compressed
+COMPRESSED_PREFIX = 'zlib:'
+
+
+def _encode(data):
+    encoded = json.dumps(data)
+    if len(encoded) > settings.CLOUDLAUNCH_PAYLOAD_COMPRESS_SIZE:
+        encoded = COMPRESSED_PREFIX + base64.b64encode(
+            zlib.compress(encoded.encode('utf-8'))).decode('ascii')
+    return encoded
+
+
+def _decode(encoded):
+    if encoded.startswith(COMPRESSED_PREFIX):
+        encoded = zlib.decompress(base64.b64decode(
+            encoded[len(COMPRESSED_PREFIX):])).decode('utf-8')
+    return json.loads(encoded)
+
+
+class _ResolvedCache(object):
+    """
+    A TTL cache of resolved references, per process.
+
+    Values are kept JSON encoded so that each caller gets its own copy.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._entries = {}
+
+    def get_or_resolve(self, key, resolve):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            entry = self._entries.get(key)
+        if not entry or entry[0] < time.time():
+            entry = (time.time() + self.ttl, json.dumps(resolve()))
+            with self._lock:
+                self._entries[key] = entry
+        return json.loads(entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Get the process wide cache of resolved references.
+
+    Entries expire after ``CLOUDLAUNCH_PAYLOAD_CACHE_TTL`` seconds so that,
+    e.g., updated credentials are picked up.
+    """
+    global _cache
+    with _cache_lock:
+        if not _cache:
+            _cache = _ResolvedCache(settings.CLOUDLAUNCH_PAYLOAD_CACHE_TTL)
+    return _cache
+
+
+def store(data):
+    """
+    Store data for a task to be passed by reference.
+
+    Payloads larger than ``CLOUDLAUNCH_PAYLOAD_COMPRESS_SIZE`` bytes are
+    compressed. Payloads are kept, encrypted, for ``CLOUDLAUNCH_PAYLOAD_TTL``
+    seconds; expired payloads are deleted as new ones are stored.
+
+    :type data: JSON-serializable object
+    :param data: The data to store.
+
+    :rtype: ``str``
+    :return: The payload id or ``None`` if ``data`` is ``None``.
+    """
+    if data is None:
+        return None
+    now = timezone.now()
+    models.TaskPayload.objects.filter(expires__lt=now).delete()
+    payload = models.TaskPayload.objects.create(
+        data=_encode(data),
+        expires=now + timedelta(seconds=settings.CLOUDLAUNCH_PAYLOAD_TTL))
+    return str(payload.id)
+
+
+def load(payload_id):
+    """
+    Load data stored with ``store``.
+
+    :rtype: JSON-serializable object
+    :return: The data or ``None`` if ``payload_id`` is ``None``.
+    """
+    if payload_id is None:
+        return None
+    return get_cache().get_or_resolve(
+        ('payload', payload_id),
+        lambda: _decode(models.TaskPayload.objects.get(id=payload_id).data))
+
+
+def get_credentials_ref(credentials):
+    """
+    Get a reference to cloud credentials to pass to a task.
+
+    Credentials stored in a user profile are referenced by their id; others,
+    such as credentials supplied in request headers, are stored as a
+    payload.
+
+    :type credentials: ``dict``
+    :param credentials: The credentials, as returned by
+                        ``djcloudbridge.view_helpers.get_credentials``.
+
+    :rtype: ``dict``
+    :return: ``{'id': credentials_id}`` or ``{'payload': payload_id}``.
+    """
+    if not credentials:
+        return None
+    if credentials.get('id'):
+        return {'id': credentials['id']}
+    return {'payload': store(credentials)}
+
+
+def resolve_credentials(credentials_ref):
+    """
+    Resolve a reference returned by ``get_credentials_ref``.
+
+    :rtype: ``dict``
+    :return: The credentials; an empty dict if there are none.
+    """
+    if not credentials_ref:
+        return {}
+    if credentials_ref.get('payload'):
+        return load(credentials_ref['payload'])
+    credentials_id = credentials_ref['id']
+    return get_cache().get_or_resolve(
+        ('credentials', credentials_id),
+        lambda: cb_models.Credentials.objects.filter(
+            id=credentials_id).select_subclasses().get().to_dict())
@@ -0,0 +1,192 @@
+"""
+Progress of running tasks, kept in a fast store next to the result backend.
+
+Plugins report progress through ``tasks.Task.update_state`` many times per
+launch. Each report is recorded here right away while the writes to the
+result backend (the database) are coalesced (see ``ProgressWriter``), so
+clients polling a task read its latest progress from here without touching
+the database. Entries are dropped once a task finishes, after which its
+state is read from the result backend.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+
+log = get_task_logger('cloudlaunch')
+
+
+class LocalProgressBackend(object):
+    """
+    Progress kept in this process.
+
+    Only the process running a task sees its progress, so this backend is
+    meant for tests and single process deployments.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+        return entry[1] if entry else None
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisProgressBackend(object):
+    """Progress kept in Redis and shared by the workers and the server."""
+
+    def __init__(self, url):
+        # Only required with this backend
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=int(ttl))
+
+    def get(self, key):
+        value = self._client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def delete(self, key):
+        self._client.delete(key)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Get the progress backend selected with ``CLOUDLAUNCH_PROGRESS_BACKEND``.
+
+    One of ``redis`` (progress kept at ``CLOUDLAUNCH_PROGRESS_REDIS_URL``),
+    ``local`` (in-process progress) or ``none``, with which progress is only
+    read from the result backend.
+    """
+    global _backend
+    with _backend_lock:
+        if not _backend:
+            backend = settings.CLOUDLAUNCH_PROGRESS_BACKEND
+            if backend == 'redis':
+                _backend = RedisProgressBackend(
+                    settings.CLOUDLAUNCH_PROGRESS_REDIS_URL)
+            elif backend == 'local':
+                _backend = LocalProgressBackend()
+            elif backend != 'none':
+                raise ValueError(
+                    "Unsupported progress backend: {}".format(backend))
+    return _backend
+
+
+def _get_key(task_id):
+    return "cloudlaunch:progress:{0}".format(task_id)
+
+
+def record(task_id, state, meta):
+    """
+    Record the latest progress of a task.
+
+    Entries expire after ``CLOUDLAUNCH_PROGRESS_TTL`` seconds in case a
+    finished task's entry isn't discarded. Errors of the backend, including
+    setting it up, are logged and ignored; the progress is still written to
+    the result backend.
+    """
+    if not task_id:
+        return
+    try:
+        backend = get_backend()
+        if backend:
+            backend.set(_get_key(task_id),
+                        json.dumps({'state': state, 'meta': meta}),
+                        settings.CLOUDLAUNCH_PROGRESS_TTL)
+    except Exception:
+        log.exception("Could not record the progress of task %s", task_id)
+
+
+def get(task_id):
+    """
+    Get the latest progress recorded for a task.
+
+    :rtype: ``dict``
+    :return: The ``state`` and ``meta`` of the task; ``None`` if none is
+             recorded, e.g., because the task has finished, in which case
+             the state should be read from the result backend.
+    """
+    if not task_id:
+        return None
+    try:
+        backend = get_backend()
+        value = backend.get(_get_key(task_id)) if backend else None
+    except Exception:
+        log.exception("Could not read the progress of task %s", task_id)
+        return None
+    return json.loads(value) if value else None
+
+
+def discard(task_id):
+    """Discard the progress of a finished task."""
+    if not task_id:
+        return
+    try:
+        backend = get_backend()
+        if backend:
+            backend.delete(_get_key(task_id))
+    except Exception:
+        log.exception("Could not discard the progress of task %s", task_id)
+
+
+class ProgressWriter(object):
+    """
+    Coalesces the progress writes of tasks to the result backend.
+
+    Every update is recorded in the progress backend right away. A task's
+    update is written to the result backend if its state changed or if
+    ``interval`` seconds have passed since the task's last write; otherwise
+    it is held back, replacing any update held back before it, until the
+    next write or ``flush``.
+    """
+
+    def __init__(self, write, interval):
+        self._write = write
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._written = {}
+        self._pending = {}
+
+    def update(self, task_id, state, meta):
+        record(task_id, state, meta)
+        now = time.time()
+        with self._lock:
+            written = self._written.get(task_id)
+            if (written and written[1] == state and
+                    now - written[0] < self.interval):
+                self._pending[task_id] = (state, meta)
+                return
+            self._pending.pop(task_id, None)
+            self._written[task_id] = (now, state)
+        self._write(task_id, state, meta)
+
+    def flush(self):
+        """Write the updates held back to the result backend."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for task_id, (state, _) in pending.items():
+                self._written[task_id] = (time.time(), state)
+        for task_id, (state, meta) in pending.items():
+            self._write(task_id, state, meta)
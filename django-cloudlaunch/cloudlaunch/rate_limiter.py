@@ -0,0 +1,307 @@
+"""Rate limiting of the API calls made to clouds, per account and endpoint."""
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+from pyeventsystem.middleware import intercept
+
+from cloudlaunch import cloud_cache
+
+log = get_task_logger('cloudlaunch')
+
+# Error codes and messages with which clouds reject throttled requests
+THROTTLING_ERROR_CODES = {'Throttling', 'ThrottlingException',
+                          'RequestLimitExceeded', 'TooManyRequestsException',
+                          'RequestThrottled', 'SlowDown', 'rateLimitExceeded',
+                          'userRateLimitExceeded'}
+THROTTLING_MESSAGE_PATTERN = re.compile(
+    r'throttl|rate limit|rate exceeded|too many requests', re.IGNORECASE)
+# Longest a caller sleeps before checking the bucket again
+MAX_ACQUIRE_SLEEP = 5
+
+# Take a token out of a bucket; see ``LocalRateLimitBackend.take``
+REDIS_TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local recovery, now = tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts', 'rate')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local current = tonumber(state[3]) or rate
+local elapsed = math.max(0, now - ts)
+current = math.min(rate, current + elapsed * rate / recovery)
+tokens = math.min(burst, tokens + elapsed * current)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / current
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now),
+           'rate', tostring(current))
+redis.call('expire', KEYS[1], math.ceil(recovery + burst / current))
+return tostring(wait)
+"""
+
+# Halve the rate of a bucket; see ``LocalRateLimitBackend.throttle``
+REDIS_THROTTLE_SCRIPT = """
+local rate, min_rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local recovery = tonumber(ARGV[3])
+local current = tonumber(redis.call('hget', KEYS[1], 'rate')) or rate
+current = math.max(min_rate, current / 2)
+redis.call('hset', KEYS[1], 'rate', tostring(current), 'tokens', '0')
+redis.call('expire', KEYS[1], math.ceil(recovery))
+return tostring(current)
+"""
+
+
+def is_throttling_error(error):
+    """
+    Check whether an exception, or one it was raised from, is a throttling
+    error returned by a cloud.
+    """
+    while error:
+        response = getattr(error, 'response', None)
+        code = (response.get('Error', {}).get('Code')
+                if isinstance(response, dict) else None)
+        status = (getattr(error, 'status_code', None) or
+                  getattr(error, 'http_status', None) or
+                  getattr(getattr(error, 'resp', None), 'status', None))
+        if (code in THROTTLING_ERROR_CODES or str(status) == '429' or
+                THROTTLING_MESSAGE_PATTERN.search(str(error))):
+            return True
+        error = error.__cause__
+    return False
+
+
+class LocalRateLimitBackend(object):
+    """
+    Token buckets kept in this process.
+
+    Only limits the calls made by a single process, so this backend is
+    meant for tests and single process deployments.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, key, rate, burst, recovery, now):
+        state = self._buckets.setdefault(
+            key, {'tokens': burst, 'ts': now, 'rate': rate})
+        elapsed = max(0, now - state['ts'])
+        state['rate'] = min(rate, state['rate'] + elapsed * rate / recovery)
+        state['tokens'] = min(burst, state['tokens'] +
+                              elapsed * state['rate'])
+        state['ts'] = now
+        return state
+
+    def take(self, key, rate, burst, recovery):
+        """
+        Take a token out of a bucket.
+
+        The bucket fills at its current rate, up to ``burst`` tokens. A
+        throttled bucket's rate recovers linearly, back to ``rate`` within
+        ``recovery`` seconds.
+
+        :rtype: ``float``
+        :return: 0 if a token was taken or the seconds until one is
+                 available.
+        """
+        with self._lock:
+            state = self._refill(key, rate, burst, recovery, time.time())
+            if state['tokens'] >= 1:
+                state['tokens'] -= 1
+                return 0
+            return (1 - state['tokens']) / state['rate']
+
+    def throttle(self, key, rate, min_rate, recovery):
+        """
+        Halve the current rate of a bucket, down to ``min_rate``, and empty
+        it.
+
+        :rtype: ``float``
+        :return: The new rate.
+        """
+        with self._lock:
+            state = self._buckets.setdefault(
+                key, {'tokens': 0, 'ts': time.time(), 'rate': rate})
+            state['rate'] = max(min_rate, state['rate'] / 2)
+            state['tokens'] = 0
+            return state['rate']
+
+
+class RedisRateLimitBackend(object):
+    """
+    Token buckets kept in Redis and shared by all the workers.
+
+    Bucket updates are atomic Lua scripts. Buckets are timed with the
+    clocks of the workers, which are expected to be roughly in sync.
+    """
+
+    def __init__(self, url):
+        # Only required with this backend
+        import redis
+        client = redis.Redis.from_url(url)
+        self._take = client.register_script(REDIS_TAKE_SCRIPT)
+        self._throttle = client.register_script(REDIS_THROTTLE_SCRIPT)
+
+    def take(self, key, rate, burst, recovery):
+        return float(self._take(keys=[key],
+                                args=[rate, burst, recovery, time.time()]))
+
+    def throttle(self, key, rate, min_rate, recovery):
+        return float(self._throttle(keys=[key],
+                                    args=[rate, min_rate, recovery]))
+
+
+class RateLimiter(object):
+    """
+    Adaptive token bucket rate limiting of the calls to cloud endpoints.
+
+    Each bucket limits the calls of a cloud account to one endpoint (e.g.,
+    ``compute.instances``) to ``rate`` calls per second, with bursts of up
+    to ``burst`` calls. When the cloud throttles a call anyway, the rate of
+    its bucket is halved, down to ``min_rate``, and then recovers over
+    ``recovery`` seconds.
+
+    Buckets are kept in a backend, which is shared by all the workers (see
+    ``RedisRateLimitBackend``). Errors of the backend don't stop calls; they
+    are let through unlimited.
+    """
+
+    def __init__(self, backend, rate=5, burst=10, min_rate=0.2, recovery=60):
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.recovery = recovery
+
+    @staticmethod
+    def _get_key(account_key, endpoint):
+        return "cloudlaunch:ratelimit:{0}:{1}".format(account_key, endpoint)
+
+    def acquire(self, account_key, endpoint):
+        """Wait until a call to the endpoint is allowed."""
+        key = self._get_key(account_key, endpoint)
+        while True:
+            try:
+                wait = self.backend.take(key, self.rate, self.burst,
+                                         self.recovery)
+            except Exception:
+                log.exception("Rate limit backend failed; not limiting the "
+                              "call to %s", endpoint)
+                return
+            if wait <= 0:
+                return
+            time.sleep(min(wait, MAX_ACQUIRE_SLEEP))
+
+    def throttled(self, account_key, endpoint):
+        """Slow the calls to an endpoint down after a throttling error."""
+        try:
+            rate = self.backend.throttle(
+                self._get_key(account_key, endpoint), self.rate,
+                self.min_rate, self.recovery)
+            log.warning("Cloud throttled a call to %s; limiting calls to "
+                        "%.2f per second", endpoint, rate)
+        except Exception:
+            log.exception("Rate limit backend failed")
+
+
+class RateLimitingMiddleware(object):
+    """
+    CloudBridge middleware limiting the rate of a provider's calls.
+
+    Calls are identified by their CloudBridge event, e.g.,
+    ``provider.compute.instances.create``, whose service part (here,
+    ``compute.instances``) is the endpoint the call is limited under. A
+    throttled call is retried, up to ``retries`` times, once the limiter
+    allows it.
+    """
+
+    def __init__(self, limiter, account_key, retries=3):
+        self.limiter = limiter
+        self.account_key = account_key
+        self.retries = retries
+
+    @staticmethod
+    def get_endpoint(event):
+        parts = (event or '').split('.')
+        return '.'.join(parts[1:-1]) or event
+
+    # Run after CloudBridge's ExceptionWrappingMiddleware (priority 1050) to
+    # see the cloud's own exceptions
+    @intercept(event_pattern="*", priority=1100)
+    def limit_rate(self, event_args, *args, **kwargs):
+        next_handler = event_args.pop("next_handler")
+        if not next_handler:
+            return
+        endpoint = self.get_endpoint(event_args.get('event'))
+        attempt = 0
+        while True:
+            self.limiter.acquire(self.account_key, endpoint)
+            try:
+                return next_handler.invoke(event_args, *args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e):
+                    raise
+                self.limiter.throttled(self.account_key, endpoint)
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """
+    Get the rate limiter configured with the ``CLOUDLAUNCH_RATE_LIMIT_*``
+    settings.
+
+    ``CLOUDLAUNCH_RATE_LIMIT_BACKEND`` is either ``redis`` (buckets kept at
+    ``CLOUDLAUNCH_RATE_LIMIT_REDIS_URL``) or ``local`` (in-process buckets).
+    If the Redis backend can't be set up, e.g., because the ``redis``
+    package is missing, calls are limited with in-process buckets instead.
+
+    :rtype: :class:`RateLimiter`
+    """
+    global _limiter
+    with _limiter_lock:
+        if not _limiter:
+            backend = settings.CLOUDLAUNCH_RATE_LIMIT_BACKEND
+            if backend == 'redis':
+                try:
+                    backend = RedisRateLimitBackend(
+                        settings.CLOUDLAUNCH_RATE_LIMIT_REDIS_URL)
+                except Exception:
+                    log.exception("Could not set up the Redis rate limit "
+                                  "backend; limiting calls per process")
+                    backend = LocalRateLimitBackend()
+            elif backend == 'local':
+                backend = LocalRateLimitBackend()
+            else:
+                raise ValueError(
+                    "Unsupported rate limit backend: {}".format(backend))
+            _limiter = RateLimiter(
+                backend, rate=settings.CLOUDLAUNCH_RATE_LIMIT,
+                burst=settings.CLOUDLAUNCH_RATE_LIMIT_BURST,
+                min_rate=settings.CLOUDLAUNCH_RATE_LIMIT_MIN,
+                recovery=settings.CLOUDLAUNCH_RATE_LIMIT_RECOVERY)
+    return _limiter
+
+
+def add_rate_limiting(provider):
+    """
+    Limit the rate of a provider's calls per account and endpoint.
+
+    :rtype: :class:`CloudBridge.CloudProvider`
+    :return: The supplied provider.
+    """
+    provider.middleware.add(RateLimitingMiddleware(
+        get_limiter(), cloud_cache.get_account_key(provider),
+        retries=settings.CLOUDLAUNCH_RATE_LIMIT_RETRIES))
+    return provider
@@ -1,12 +1,20 @@
 import logging
 import yaml
+from datetime import timedelta
 
 import jsonmerge
 
 from bioblend.cloudman.launch import CloudManLauncher
 
+from celery.utils import uuid
+
 from cloudbridge.factory import ProviderList
 
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from rest_framework import exceptions
 from rest_framework import serializers
 
 from rest_polymorphic.serializers import PolymorphicSerializer
@@ -16,7 +24,9 @@ from djcloudbridge import serializers as cb_serializers
 from djcloudbridge import view_helpers as cb_view_helpers
 from djcloudbridge.drf_helpers import CustomHyperlinkedIdentityField
 
+from . import admission
 from . import models
+from . import payloads
 from . import tasks
 from . import util
 
@@ -196,15 +206,56 @@ class DeploymentTaskSerializer(serializers.ModelSerializer):
         else:
             return None
 
+    @staticmethod
+    def _get_coalesced_health_check(deployment):
+        """
+        Find a HEALTH_CHECK task of the deployment to return instead of
+        running a new health check.
+
+        That's the latest HEALTH_CHECK task if it is still queued or running
+        or if it succeeded less than ``CLOUDLAUNCH_HEALTH_CHECK_FRESHNESS``
+        seconds ago. Queued tasks expire without running, so tasks queued for
+        longer than that are not considered in flight.
+
+        :rtype: :class:`models.ApplicationDeploymentTask`
+        :return: The task or ``None`` if a new health check should be run.
+        """
+        task = models.ApplicationDeploymentTask.objects.filter(
+            deployment=deployment,
+            action=models.ApplicationDeploymentTask.HEALTH_CHECK).order_by(
+                '-added').first()
+        if not task:
+            return None
+        now = timezone.now()
+        status = task.status
+        if status in ('PENDING', 'STARTED', 'RETRY'):
+            if task.added > now - timedelta(
+                    seconds=tasks.HEALTH_CHECK_EXPIRES +
+                    tasks.HEALTH_CHECK_TIME_LIMIT):
+                return task
+        elif status == 'SUCCESS':
+            # Results are migrated to the database, which updates the task,
+            # right after the health check completes
+            if task.updated > now - timedelta(
+                    seconds=settings.CLOUDLAUNCH_HEALTH_CHECK_FRESHNESS):
+                return task
+        return None
+
     def create(self, validated_data):
         """
         Fire off a new task for the supplied action.
 
+        A HEALTH_CHECK is coalesced with the latest one of the deployment
+        while that one is in flight or its result is fresh, in which case
+        the latest task is returned instead (see
+        ``_get_coalesced_health_check``).
+
         Called automatically by the DRF following a POST request.
 
         :type validated_data: ``dict``
         :param validated_data: Dict containing action the task should perform.
-                               Valid actions are `HEALTH_CHECK`, `DELETE`.
+                               Valid actions are `HEALTH_CHECK`, `RESTART`,
+                               `DELETE`, `BAKE`.
         """
         log.debug("Deployment task data: %s", validated_data)
         action = getattr(models.ApplicationDeploymentTask,
@@ -215,14 +266,25 @@ class DeploymentTaskSerializer(serializers.ModelSerializer):
         dpk = self.context['view'].kwargs.get('deployment_pk')
         dpl = models.ApplicationDeployment.objects.get(id=dpk)
         creds = self._resolve_credentials(dpl, request)
-        cred_dict = creds.to_dict() if creds else {}
         try:
+            # Tasks are passed a reference to the credentials rather than
+            # the credentials themselves
+            cred_ref = payloads.get_credentials_ref(
+                creds.to_dict() if creds else None)
             if action == models.ApplicationDeploymentTask.HEALTH_CHECK:
-                async_result = tasks.health_check.delay(dpl.id, cred_dict)
+                coalesced = self._get_coalesced_health_check(dpl)
+                if coalesced:
+                    log.debug("Coalescing health check of deployment %s with "
+                              "task %s", dpl.name, coalesced.id)
+                    return coalesced
+                async_result = tasks.health_check.delay(dpl.id, cred_ref)
             elif action == models.ApplicationDeploymentTask.RESTART:
-                async_result = tasks.restart_appliance.delay(dpl.id, cred_dict)
+                async_result = tasks.restart_appliance.delay(dpl.id, cred_ref)
             elif action == models.ApplicationDeploymentTask.DELETE:
-                async_result = tasks.delete_appliance.delay(dpl.id, cred_dict)
+                async_result = tasks.delete_appliance.delay(dpl.id, cred_ref)
+            elif action == models.ApplicationDeploymentTask.BAKE:
+                async_result = tasks.bake_appliance_image.delay(dpl.id,
+                                                                cred_ref)
             return models.ApplicationDeploymentTask.objects.create(
                 action=action, deployment=dpl, celery_id=async_result.task_id)
         except serializers.ValidationError as ve:
@@ -297,20 +359,11 @@ class DeploymentSerializer(serializers.ModelSerializer):
             data['application_version'] = version.id
         return super(DeploymentSerializer, self).to_internal_value(data)
 
-    def create(self, validated_data):
-        """
-        Create a new ApplicationDeployment object.
-
-        Called automatically by the DRF following a POST request.
-        """
-        log.debug("Creating a new deployment: {0}".format(
-            validated_data.get("name")))
-        name = validated_data.get("name")
+    def _get_target_config_and_credentials(self, validated_data):
         target = validated_data.get("deployment_target_id")
         version = validated_data.get("application_version")
         target_version_config = models.ApplicationVersionTargetConfig.objects.get(
             application_version=version, target=target)
-        default_combined_config = target_version_config.compute_merged_config()
         request = self.context.get('view').request
         # FIXME: The target may not be a cloud, and therefore, the provider should not
         # be instantiated here
@@ -320,31 +373,96 @@ class DeploymentSerializer(serializers.ModelSerializer):
         else:
             # FIXME: For now, we don't handle non-cloud credentials
             credentials = None
+        return target_version_config, credentials
+
+    def _merge_app_config(self, target_version_config, validated_data):
+        default_combined_config = target_version_config.compute_merged_config()
+        app_config = validated_data.get("config_app", {})
+        return jsonmerge.merge(default_combined_config, app_config)
+
+    def _create_deployment(self, validated_data, target_version_config,
+                           credentials, merged_app_config,
+                           sanitised_app_config, celery_id):
+        """Save a deployment along with its usage record and LAUNCH task."""
+        request = self.context.get('view').request
+        validated_data = dict(validated_data)
+        validated_data.pop('application', None)
+        validated_data.pop('config_app', None)
+        validated_data['owner_id'] = request.user.id
+        validated_data['application_config'] = yaml.safe_dump(
+            merged_app_config, default_flow_style=False, allow_unicode=True)
+        validated_data['credentials_id'] = credentials.get('id') or None
+        app_deployment = super(DeploymentSerializer, self).create(validated_data)
+        self.log_usage(target_version_config, app_deployment, sanitised_app_config, request.user)
+        models.ApplicationDeploymentTask.objects.create(
+            action=models.ApplicationDeploymentTask.LAUNCH,
+            deployment=app_deployment, celery_id=celery_id)
+        return app_deployment
+
+    @staticmethod
+    def _discard_deployments(deployments):
+        """Delete deployments, and their usage records, never launched."""
+        for deployment in deployments:
+            try:
+                models.Usage.objects.filter(app_deployment=deployment).delete()
+                deployment.delete()
+            except Exception:
+                log.exception("Could not delete deployment %s, whose launch "
+                              "could not be queued", deployment.name)
+
+    @staticmethod
+    def _admit_launches(count=1):
+        """
+        Reject launches with a 429 response while the launch queue is full.
+
+        See ``admission.check_launch_admission``.
+        """
         try:
-            app_config = validated_data.get("config_app", {})
-            merged_app_config = jsonmerge.merge(
-                default_combined_config, app_config)
+            admission.check_launch_admission(count)
+        except admission.LaunchCapacityExceeded as e:
+            raise exceptions.Throttled(wait=e.wait, detail=str(e))
+
+    def create(self, validated_data):
+        """
+        Create a new ApplicationDeployment object.
+
+        Called automatically by the DRF following a POST request.
+        """
+        log.debug("Creating a new deployment: {0}".format(
+            validated_data.get("name")))
+        name = validated_data.get("name")
+        version = validated_data.get("application_version")
+        target_version_config, credentials = \
+            self._get_target_config_and_credentials(validated_data)
+        try:
+            merged_app_config = self._merge_app_config(
+                target_version_config, validated_data)
             final_ud_config, sanitised_app_config = self._validate_and_sanitise(
                 target_version_config, merged_app_config, name, version)
-            async_result = tasks.create_appliance.delay(
-                name, target_version_config.pk, credentials, merged_app_config,
-                final_ud_config)
-
-            del validated_data['application']
-            if 'config_app' in validated_data:
-                del validated_data['config_app']
-            validated_data['owner_id'] = request.user.id
-            validated_data['application_config'] = yaml.safe_dump(
-                merged_app_config, default_flow_style=False, allow_unicode=True)
-            validated_data['credentials_id'] = credentials.get('id') or None
-            app_deployment = super(DeploymentSerializer, self).create(validated_data)
-            self.log_usage(target_version_config, app_deployment, sanitised_app_config, request.user)
-            models.ApplicationDeploymentTask.objects.create(
-                action=models.ApplicationDeploymentTask.LAUNCH,
-                deployment=app_deployment, celery_id=async_result.task_id)
+            self._admit_launches()
+            app_deployment = None
+            try:
+                # The launch task looks the deployment up so create it, in
+                # full, before queuing the task
+                celery_id = uuid()
+                with transaction.atomic():
+                    app_deployment = self._create_deployment(
+                        validated_data, target_version_config, credentials,
+                        merged_app_config, sanitised_app_config, celery_id)
+                tasks.create_appliance.apply_async(
+                    [app_deployment.id,
+                     payloads.get_credentials_ref(credentials),
+                     payloads.store(final_ud_config)], task_id=celery_id)
+            except Exception:
+                # The launch was admitted but never queued; don't leave a
+                # deployment pending for good
+                admission.release_launches()
+                if app_deployment:
+                    self._discard_deployments([app_deployment])
+                raise
             return app_deployment
-        except serializers.ValidationError as ve:
-            raise ve
+        except (serializers.ValidationError, exceptions.Throttled):
+            raise
         except Exception as e:
             raise serializers.ValidationError(
                 {"error": "An exception creating a deployment of %s: %s)" %
@@ -380,6 +498,74 @@ class DeploymentSerializer(serializers.ModelSerializer):
         u.save()
 
 
+class BatchDeploymentSerializer(DeploymentSerializer):
+    """
+    Create a batch of identical deployments from a single request.
+
+    Deployments are named ``<name>-1`` to ``<name>-<count>`` and are launched
+    by a single task so the launch resources are resolved only once.
+    """
+    count = serializers.IntegerField(
+        write_only=True, min_value=1,
+        max_value=settings.CLOUDLAUNCH_MAX_BATCH_SIZE)
+
+    class Meta(DeploymentSerializer.Meta):
+        fields = DeploymentSerializer.Meta.fields + ('count',)
+
+    def create(self, validated_data):
+        """
+        Create ``count`` ApplicationDeployment objects and launch them.
+
+        :rtype: ``list`` of :class:`.ApplicationDeployment`
+        :return: The created deployments.
+        """
+        validated_data = dict(validated_data)
+        count = validated_data.pop('count')
+        name = validated_data.get("name")
+        log.debug("Creating a batch of %s deployments: %s", count, name)
+        version = validated_data.get("application_version")
+        target_version_config, credentials = \
+            self._get_target_config_and_credentials(validated_data)
+        try:
+            merged_app_config = self._merge_app_config(
+                target_version_config, validated_data)
+            final_ud_config, sanitised_app_config = self._validate_and_sanitise(
+                target_version_config, merged_app_config, name, version)
+            self._admit_launches(count)
+            deployments = []
+            created = []
+            launches = []
+            try:
+                with transaction.atomic():
+                    for i in range(1, count + 1):
+                        dpl_name = "%s-%s" % (name, i)
+                        celery_id = uuid()
+                        deployment = self._create_deployment(
+                            {**validated_data, 'name': dpl_name},
+                            target_version_config, credentials,
+                            merged_app_config, sanitised_app_config,
+                            celery_id)
+                        deployments.append(deployment)
+                        launches.append((deployment.id, celery_id))
+                created = deployments
+                tasks.create_appliance_batch.delay(
+                    launches, payloads.get_credentials_ref(credentials),
+                    payloads.store(final_ud_config))
+            except Exception:
+                # The launches were admitted but never queued; don't leave
+                # deployments pending for good
+                admission.release_launches(count)
+                self._discard_deployments(created)
+                raise
+            return deployments
+        except (serializers.ValidationError, exceptions.Throttled):
+            raise
+        except Exception as e:
+            raise serializers.ValidationError(
+                {"error": "An exception creating a deployment batch of %s: %s"
+                 % (version.backend_component_name, e)})
+
+
 class PublicKeySerializer(serializers.HyperlinkedModelSerializer):
     url = serializers.HyperlinkedIdentityField(
         view_name='public-key-detail', read_only=True)
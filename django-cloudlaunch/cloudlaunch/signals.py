@@ -1,6 +1,9 @@
 """App-wide Django signals."""
+import os
+
 from celery.utils.log import get_task_logger
 
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.dispatch import Signal
@@ -33,6 +36,15 @@ def delete_old_tasks(sender, deployment, **kwargs):
         old_task.delete()
 
 
+@receiver(post_delete, sender=models.ApplicationDeploymentTask)
+def delete_task_log(sender, instance, **kwargs):
+    """Delete the archived app configuration output of a deleted task."""
+    try:
+        os.remove(instance.log_path)
+    except FileNotFoundError:
+        pass
+
+
 @receiver(post_save, sender=cb_models.Zone)
 def create_cloud_deployment_target(sender, instance, created, **kwargs):
     """
@@ -2,18 +2,39 @@
 import copy
 import json
 import logging
+import os
 import yaml
+from datetime import timedelta
 
+from celery import states
 from celery.app import shared_task
+from celery.exceptions import Ignore
 from celery.exceptions import SoftTimeLimitExceeded
 from celery.result import AsyncResult
+from celery.signals import task_postrun
+from celery.signals import worker_process_init
 from celery.utils.log import get_task_logger
 
+from django.conf import settings
+from django.utils import timezone
+
 from djcloudbridge import domain_model
+from . import admission
+from . import circuit_breaker
 from . import models
+from . import payloads
+from . import progress
+from . import rate_limiter
 from . import signals
+from . import ssh_keys
 from . import util
 from . import serializers
+from .backend_plugins.base_vm_app import HTTP_MAX_POLLS
+from .backend_plugins.base_vm_app import HTTP_POLL_INTERVAL
+from .backend_plugins.base_vm_app import LAUNCH_DONE
+from .backend_plugins.base_vm_app import LAUNCH_PROVISION
+from .backend_plugins.base_vm_app import LAUNCH_WAIT_CONFIGURED
+from .backend_plugins.base_vm_app import LAUNCH_WAIT_HTTP
 
 log = get_task_logger('cloudlaunch')
 # Limit how much these libraries log
@@ -21,6 +42,17 @@ logging.getLogger('boto3').setLevel(logging.WARNING)
 logging.getLogger('botocore').setLevel(logging.WARNING)
 logging.getLogger('cloudbridge').setLevel(logging.INFO)
 
+# Seconds a health check may run for and may stay queued for before it
+# expires without running
+HEALTH_CHECK_TIME_LIMIT = 60
+HEALTH_CHECK_EXPIRES = 300
+# Seconds a bake may run for. Plugins that can't bake in stages wait on the
+# image, for up to the provider's default wait timeout (10 minutes).
+BAKE_TIME_LIMIT = 900
+# Seconds a delete may run for. Plugins that can't delete in stages wait on
+# the instance, for up to the provider's default wait timeout (10 minutes).
+DELETE_TIME_LIMIT = 900
+
 
 @shared_task(time_limit=120)
 def migrate_launch_task(task_id):
@@ -36,7 +68,10 @@ def migrate_launch_task(task_id):
     task_meta = task.backend.get_task_meta(task.id)
     adt.status = task_meta.get('status')
     adt.traceback = task_meta.get('traceback')
+    log_path = adt.log_path
     adt.celery_id = None
+    if os.path.exists(log_path):
+        os.rename(log_path, adt.log_path)
     sanitized_result = copy.deepcopy(task_meta['result'])
     if sanitized_result.get('cloudLaunch', {}).get('keyPair', {}).get(
             'material'):
@@ -61,33 +96,142 @@ def update_status_task(task_id):
     adt.save()
 
 
-@shared_task(expires=120)
-def create_appliance(name, cloud_version_config_id, credentials, app_config,
-                     user_data):
-    """Call the appropriate app plugin and initiate the app launch process."""
+def _get_cloud_provider(zone, credentials):
+    """
+    Create a provider for the zone whose calls are rate limited and fail fast
+    while the cloud is unavailable.
+
+    See ``rate_limiter.add_rate_limiting`` and
+    ``circuit_breaker.add_circuit_breaker``.
+    """
+    provider = domain_model.get_cloud_provider(zone, credentials)
+    circuit_breaker.add_circuit_breaker(provider)
+    return rate_limiter.add_rate_limiting(provider)
+
+
+def _get_launch_plugin_and_config(cloud_version_config_id, credentials,
+                                  user_data):
+    """
+    Instantiate the app plugin and compose the provider config for a launch.
+
+    :rtype: ``tuple``
+    :return: The app plugin instance and the ``provider_config`` dict to
+             supply to the plugin's ``deploy`` method.
+    """
+    cloud_version_conf = models.ApplicationVersionCloudConfig.objects.get(
+        pk=cloud_version_config_id)
+    zone = cloud_version_conf.target.target_zone
+    plugin = util.import_class(
+        cloud_version_conf.application_version.backend_component_name)()
+    # FIXME: Should not be instantiating provider here
+    provider = _get_cloud_provider(zone, credentials)
+    # Dump and reload to convert to standard dict
+    cloud_config = json.loads(json.dumps(serializers.CloudConfigPluginSerializer(
+        cloud_version_conf).data))
+    cloud_config['credentials'] = credentials
+    # TODO: Add keys (& support) for using existing, user-supplied hosts
+    provider_config = {'cloud_provider': provider,
+                       'cloud_config': cloud_config,
+                       'cloud_user_data': user_data,
+                       'baked_images': {
+                           baked.config_hash: baked.image.image_id
+                           for baked in cloud_version_conf.baked_images
+                           .select_related('image')}}
+    # TODO: Sanitize even in debug mode
+    log.debug("Provider_config: %s", provider_config)
+    return plugin, provider_config
+
+
+def _get_launch(deployment_id):
+    """
+    Look up what a launch of a deployment needs from the deployment.
+
+    :rtype: ``tuple``
+    :return: The deployment name, the id of its app version cloud config and
+             its (merged) app config.
+    """
+    deployment = models.ApplicationDeployment.objects.get(pk=deployment_id)
+    target_version_config = models.ApplicationVersionTargetConfig.objects.get(
+        application_version=deployment.application_version_id,
+        target=deployment.deployment_target_id)
+    return (deployment.name, target_version_config.pk,
+            yaml.safe_load(deployment.application_config))
+
+
+def _configures_at_boot(plugin, app_config):
+    """Check whether the hosts of an app configure themselves during boot."""
+    if not app_config.get('config_appliance'):
+        return False
+    try:
+        return plugin._get_configurer(app_config).configures_at_boot
+    except Exception:
+        # Let the launch report the configurer error
+        return False
+
+
+def _use_staged_launch(plugin, app_config):
+    """
+    Check whether to launch an app through ``run_launch_stage`` tasks.
+
+    Besides when enabled with ``CLOUDLAUNCH_STAGED_LAUNCH``, apps whose hosts
+    configure themselves during boot are always launched in stages since
+    only staged launches wait on the hosts to report back.
+    """
+    return (getattr(plugin, 'supports_staged_launch', False) and
+            (settings.CLOUDLAUNCH_STAGED_LAUNCH or
+             _configures_at_boot(plugin, app_config)))
+
+
+# Launch tasks are acknowledged once they have run so that a launch whose
+# worker is lost is redelivered and resumes from its last checkpoint (see
+# ``Task.checkpoint``)
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def create_appliance(deployment_id, credentials, user_data):
+    """
+    Call the appropriate app plugin and initiate the app launch process.
+
+    @type  deployment_id: ``int``
+    @param deployment_id: Id of the deployment to launch, from which its
+                          name and app config are looked up.
+
+    @type  credentials: ``dict``
+    @param credentials: Reference to the cloud credentials to launch with
+                        (see ``payloads.get_credentials_ref``).
+
+    @type  user_data: ``str``
+    @param user_data: Payload id of the instance user data, if any (see
+                      ``payloads.store``).
+    """
+    task = Task(create_appliance)
     try:
+        checkpoint = task.get_checkpoint()
+        if not checkpoint:
+            # First run of the launch, rather than a redelivery
+            admission.release_launches()
+        if checkpoint.get('staged'):
+            log.info("Launch %s was already handed over to its stages",
+                     task.id)
+            raise Ignore()
+        name, cloud_version_config_id, app_config = _get_launch(deployment_id)
         log.debug("Creating appliance %s", name)
-        cloud_version_conf = models.ApplicationVersionCloudConfig.objects.get(
-            pk=cloud_version_config_id)
-        zone = cloud_version_conf.target.target_zone
-        plugin = util.import_class(
-            cloud_version_conf.application_version.backend_component_name)()
-        # FIXME: Should not be instantiating provider here
-        provider = domain_model.get_cloud_provider(zone, credentials)
-        # Dump and reload to convert to standard dict
-        cloud_config = json.loads(json.dumps(serializers.CloudConfigPluginSerializer(
-            cloud_version_conf).data))
-        cloud_config['credentials'] = credentials
-        # TODO: Add keys (& support) for using existing, user-supplied hosts
-        provider_config = {'cloud_provider': provider,
-                           'cloud_config': cloud_config,
-                           'cloud_user_data': user_data}
-        # TODO: Sanitize even in debug mode
-        log.debug("Provider_config: %s", provider_config)
+        plugin, provider_config = _get_launch_plugin_and_config(
+            cloud_version_config_id, payloads.resolve_credentials(credentials),
+            payloads.load(user_data))
         log.info("Creating app %s with the following app config: %s",
                  name, plugin.sanitise_app_config(app_config))
-        deploy_result = plugin.deploy(name, Task(create_appliance), app_config,
-                                      provider_config)
+        if _use_staged_launch(plugin, app_config):
+            # Hand the launch over to short, rescheduled stage tasks. Their
+            # progress and result are recorded under this task's id so this
+            # task must not record a result of its own.
+            task.checkpoint(staged=True)
+            run_launch_stage.delay(create_appliance.request.id, {
+                'deployment_id': deployment_id,
+                'credentials': credentials,
+                'user_data': user_data,
+                'app_config': None,
+                'state': {}})
+            raise Ignore()
+        deploy_result = plugin.deploy(name, task, app_config, provider_config)
         # Upgrade task result immediately
         update_status_task.apply_async([create_appliance.request.id],
                                         countdown=1)
@@ -95,6 +239,8 @@ def create_appliance(name, cloud_version_config_id, credentials, app_config,
         migrate_launch_task.apply_async([create_appliance.request.id],
                                         countdown=3600)
         return deploy_result
+    except Ignore:
+        raise
     except SoftTimeLimitExceeded:
         msg = "Create appliance task time limit exceeded; stopping the task."
         log.warning(msg)
@@ -105,6 +251,226 @@ def create_appliance(name, cloud_version_config_id, credentials, app_config,
         raise Exception(msg) from exc
 
 
+@worker_process_init.connect
+def _fill_key_pair_pool(**kwargs):
+    """Fill the ssh key pair pool of a worker before its first launch."""
+    ssh_keys.get_key_pair_pool().fill()
+
+
+@task_postrun.connect
+def _clear_finished_launch(sender=None, task_id=None, state=None, **kwargs):
+    """Clear the progress and checkpoint of a launch once it has finished."""
+    # Ignored launches were handed over to their stages and are cleared once
+    # the last stage has run
+    if sender.name == create_appliance.name and state != states.IGNORED:
+        _clear_launch(task_id)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def run_launch_stage(self, launch_task_id, launch):
+    """
+    Run one stage of a staged appliance launch and schedule the next one.
+
+    Rather than holding a worker for the whole launch, each invocation runs
+    a single short step (see ``BaseVMAppPlugin.run_launch_stage``) and then
+    reschedules itself, with a countdown while waiting on the instance or
+    the app, until the launch is done.
+
+    @type  launch_task_id: ``str``
+    @param launch_task_id: Id of the ``create_appliance`` task that started
+                           the launch, under which the launch progress and
+                           result are recorded.
+
+    @type  launch: ``dict``
+    @param launch: The ``create_appliance`` arguments along with the plugin
+                   launch ``state`` and the payload id of the ``app_config``
+                   once it differs from the deployment's.
+    """
+    task = Task(self, task_id=launch_task_id)
+    stage = launch['state'].get('stage', LAUNCH_PROVISION)
+    if stage == LAUNCH_WAIT_CONFIGURED:
+        # Pass on the report of a host configured during boot, if received
+        launch['state']['phone_home'] = models.PhoneHome.objects.filter(
+            launch_task_id=launch_task_id, status__isnull=False).values(
+            'status', 'output').first()
+    try:
+        name, cloud_version_config_id, app_config = _get_launch(
+            launch['deployment_id'])
+        if launch['app_config']:
+            app_config = payloads.load(launch['app_config'])
+        original_app_config = copy.deepcopy(app_config)
+        plugin, provider_config = _get_launch_plugin_and_config(
+            cloud_version_config_id,
+            payloads.resolve_credentials(launch['credentials']),
+            payloads.load(launch['user_data']))
+        launch['state'] = plugin.run_launch_stage(
+            name, task, app_config, provider_config, launch['state'])
+        if app_config != original_app_config:
+            # Carry the changes the plugin made over to the next stages
+            launch['app_config'] = payloads.store(app_config)
+        # The launch's progress must be in the result backend while it waits
+        # for its next stage
+        task.flush()
+    except Exception as exc:
+        msg = "Create appliance task failed: %s" % str(exc)
+        log.error(msg)
+        self.backend.mark_as_failure(launch_task_id, Exception(msg))
+        _schedule_launch_followup(launch_task_id)
+        models.PhoneHome.objects.filter(
+            launch_task_id=launch_task_id).delete()
+        return
+    if stage == LAUNCH_PROVISION and launch['state'].get('phone_home_token'):
+        # Accept the report of the launched host from now on
+        models.PhoneHome.objects.update_or_create(
+            launch_task_id=launch_task_id,
+            defaults={'token': launch['state']['phone_home_token']})
+    elif (stage == LAUNCH_WAIT_CONFIGURED and
+          launch['state']['stage'] != LAUNCH_WAIT_CONFIGURED):
+        models.PhoneHome.objects.filter(
+            launch_task_id=launch_task_id).delete()
+    if launch['state']['stage'] == LAUNCH_DONE:
+        log.info("Staged launch of %s completed", name)
+        self.backend.mark_as_done(launch_task_id, launch['state']['result'])
+        _schedule_launch_followup(launch_task_id)
+    elif (launch['state']['stage'] == LAUNCH_WAIT_HTTP and
+          settings.CLOUDLAUNCH_HTTP_PROBER):
+        # The http prober service completes the launch once the app is ready
+        url, ok_status_codes = launch['state']['http_check']
+        log.debug("Handing launch of %s over to the http prober for %s",
+                  name, url)
+        models.PendingHttpCheck.objects.update_or_create(
+            launch_task_id=launch_task_id, defaults={
+                'url': url,
+                'ok_status_codes': json.dumps(ok_status_codes),
+                'result': json.dumps(launch['state']['result']),
+                'expires': timezone.now() + timedelta(
+                    seconds=HTTP_POLL_INTERVAL * HTTP_MAX_POLLS)})
+    else:
+        log.debug("Launch of %s moving to stage %s in %ss", name,
+                  launch['state']['stage'], launch['state']['countdown'])
+        run_launch_stage.apply_async(
+            [launch_task_id, launch], countdown=launch['state']['countdown'])
+
+
+@shared_task(bind=True, time_limit=120)
+def complete_http_wait(self, launch_task_id, ready):
+    """
+    Complete a staged launch that was waiting on its app to respond.
+
+    Called by the http prober service once the app of a pending http check
+    is ready or the check has expired. As with the blocking launch, a launch
+    whose app never became ready is still completed.
+
+    @type  launch_task_id: ``str``
+    @param launch_task_id: Id of the LAUNCH task of the pending http check.
+
+    @type  ready: ``bool``
+    @param ready: Whether the app responded with an OK status code.
+    """
+    check = models.PendingHttpCheck.objects.filter(
+        launch_task_id=launch_task_id).first()
+    if not check:
+        # The prober delivers its results at least once
+        log.debug("Http check of launch %s was already completed",
+                  launch_task_id)
+        return
+    if not ready:
+        log.warning("App at %s did not become ready in time", check.url)
+    self.backend.mark_as_done(launch_task_id, json.loads(check.result))
+    check.delete()
+    _schedule_launch_followup(launch_task_id)
+
+
+def _clear_launch(launch_task_id):
+    """Discard the progress and checkpoint of a finished launch."""
+    # Its state is read from the result backend from now on
+    progress.discard(launch_task_id)
+    models.LaunchCheckpoint.objects.filter(
+        launch_task_id=launch_task_id).delete()
+
+
+def _schedule_launch_followup(launch_task_id):
+    """Schedule the status update and result migration of a finished launch."""
+    _clear_launch(launch_task_id)
+    # Upgrade task result immediately
+    update_status_task.apply_async([launch_task_id], countdown=1)
+    # Schedule a task to migrate result one hour from now
+    migrate_launch_task.apply_async([launch_task_id], countdown=3600)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def create_appliance_batch(self, launches, credentials, user_data):
+    """
+    Launch a batch of identical appliances.
+
+    The plugin and provider are set up once for the whole batch and the
+    plugin's ``deploy_batch`` method is called to launch the appliances.
+
+    @type  launches: ``list`` of ``tuple``
+    @param launches: A ``(deployment_id, task_id)`` pair for each deployment
+                     in the batch. Progress and the result of each deployment
+                     are recorded under the supplied ``task_id``, which is
+                     the ``celery_id`` of the deployment's LAUNCH task.
+
+    @type  credentials: ``dict``
+    @param credentials: Reference to the cloud credentials to launch with
+                        (see ``payloads.get_credentials_ref``).
+
+    @type  user_data: ``str``
+    @param user_data: Payload id of the instance user data, if any.
+    """
+    task_ids = [task_id for _, task_id in launches]
+    names = []
+    try:
+        if not any(Task(self, task_id=task_id).get_checkpoint()
+                   for task_id in task_ids):
+            # First run of the batch, rather than a redelivery
+            admission.release_launches(len(launches))
+        names = [_get_launch(deployment_id)[0]
+                 for deployment_id, _ in launches]
+        log.debug("Creating a batch of appliances %s", names)
+        # The deployments of a batch share their config
+        _, cloud_version_config_id, app_config = _get_launch(launches[0][0])
+        plugin, provider_config = _get_launch_plugin_and_config(
+            cloud_version_config_id, payloads.resolve_credentials(credentials),
+            payloads.load(user_data))
+        if (getattr(plugin, 'supports_staged_launch', False) and
+                _configures_at_boot(plugin, app_config)):
+            # Only staged launches wait on hosts configured during boot so
+            # each deployment is launched through its own stage tasks
+            for deployment_id, task_id in launches:
+                task = Task(self, task_id=task_id)
+                if task.get_checkpoint().get('staged'):
+                    # Handed over before the batch was redelivered
+                    continue
+                task.checkpoint(staged=True)
+                run_launch_stage.delay(task_id, {
+                    'deployment_id': deployment_id,
+                    'credentials': credentials,
+                    'user_data': user_data,
+                    'app_config': None,
+                    'state': {}})
+            return {'deployments': len(launches), 'staged': True}
+        log.info("Creating a batch of %s apps with the following app config: "
+                 "%s", len(names), plugin.sanitise_app_config(app_config))
+        results = plugin.deploy_batch(
+            names, [Task(self, task_id=task_id) for task_id in task_ids],
+            app_config, provider_config)
+    except Exception as exc:
+        log.error("Create appliance batch task failed: %s", exc)
+        results = [exc] * len(launches)
+    for task_id, result in zip(task_ids, results):
+        if isinstance(result, Exception):
+            msg = "Create appliance task failed: %s" % str(result)
+            log.error("%s: %s", task_id, msg)
+            self.backend.mark_as_failure(task_id, Exception(msg))
+        else:
+            self.backend.mark_as_done(task_id, result)
+        _schedule_launch_followup(task_id)
+    return {'deployments': len(launches),
+            'failed': len([r for r in results if isinstance(r, Exception)])}
+
+
 def _get_app_plugin(deployment):
     """
     Retrieve appliance plugin for a deployment.
@@ -159,7 +525,8 @@ def _serialize_deployment(deployment):
     return result
 
 
-@shared_task(bind=True, time_limit=60, expires=300)
+@shared_task(bind=True, time_limit=HEALTH_CHECK_TIME_LIMIT,
+             expires=HEALTH_CHECK_EXPIRES)
 def health_check(self, deployment_id, credentials):
     """
     Check the health of the supplied deployment.
@@ -176,7 +543,8 @@ def health_check(self, deployment_id, credentials):
         dpl = _serialize_deployment(deployment)
         # FIXME: Should not be instantiating provider here
         target_zone = deployment.deployment_target.target_zone
-        provider = domain_model.get_cloud_provider(target_zone, credentials)
+        provider = _get_cloud_provider(
+            target_zone, payloads.resolve_credentials(credentials))
         result = plugin.health_check(provider, dpl)
     except Exception as e:
         msg = "Health check failed: %s" % str(e)
@@ -205,7 +573,8 @@ def restart_appliance(self, deployment_id, credentials):
         dpl = _serialize_deployment(deployment)
         # FIXME: Should not be instantiating provider here
         target_zone = deployment.deployment_target.target_zone
-        provider = domain_model.get_cloud_provider(target_zone, credentials)
+        provider = _get_cloud_provider(
+            target_zone, payloads.resolve_credentials(credentials))
         result = plugin.restart(provider, dpl)
     except Exception as e:
         msg = "Restart task failed: %s" % str(e)
@@ -218,12 +587,127 @@ def restart_appliance(self, deployment_id, credentials):
     return result
 
 
-@shared_task(bind=True, expires=120)
+# Bakes never expire; a bake request left in the queue would leave its task
+# pending for good
+@shared_task(bind=True, time_limit=BAKE_TIME_LIMIT)
+def bake_appliance_image(self, deployment_id, credentials):
+    """
+    Bakes an image of this appliance's configured host
+
+    The image is recorded as a ``BakedImage`` of the deployment's app version
+    cloud config, keyed by the hash of the host's configuration, so that
+    later launches with the same configuration boot the baked image.
+
+    Plugins supporting it (see ``BaseVMAppPlugin.start_bake``) only request
+    the image here. The image is confirmed by ``confirm_bake`` tasks, which
+    record it and the result under this task's id, so that no worker waits
+    on the image to become available.
+    """
+    try:
+        deployment = models.ApplicationDeployment.objects.get(pk=deployment_id)
+        log.debug("Baking an image of deployment %s", deployment.name)
+        plugin = _get_app_plugin(deployment)
+        dpl = _serialize_deployment(deployment)
+        # FIXME: Should not be instantiating provider here
+        target_zone = deployment.deployment_target.target_zone
+        provider = _get_cloud_provider(
+            target_zone, payloads.resolve_credentials(credentials))
+        if getattr(plugin, 'supports_staged_bake', False):
+            bake_state = plugin.start_bake(provider, dpl)
+            Task(self).update_state(
+                state='PROGRESSING',
+                meta={'action': "Baking image %s" % bake_state['image_id']})
+            confirm_bake.apply_async(
+                [self.request.id, deployment_id, credentials, bake_state],
+                countdown=bake_state['countdown'])
+            # The result is recorded by confirm_bake
+            raise Ignore()
+        result = plugin.bake(provider, dpl)
+        _record_baked_image(deployment, result)
+    except Ignore:
+        raise
+    except Exception as e:
+        msg = "Bake task failed: %s" % str(e)
+        log.error(msg)
+        raise Exception(msg) from e
+    # Schedule a task to migrate results right after task completion
+    # Do this as a separate task because until this task completes, we
+    # cannot obtain final status or traceback.
+    migrate_task_result.apply_async([self.request.id], countdown=1)
+    return result
+
+
+@shared_task(bind=True, time_limit=120)
+def confirm_bake(self, bake_task_id, deployment_id, credentials, bake_state):
+    """
+    Confirm an image requested by ``bake_appliance_image``.
+
+    Checks whether the image is available (see ``BaseVMAppPlugin.check_bake``)
+    and reschedules itself until it is, at which point the image is recorded
+    as a ``BakedImage``.
+
+    @type  bake_task_id: ``str``
+    @param bake_task_id: Id of the ``bake_appliance_image`` task, under which
+                         the result of the bake is recorded.
+
+    @type  bake_state: ``dict``
+    @param bake_state: The state of the bake, as returned by ``start_bake``.
+    """
+    try:
+        deployment = models.ApplicationDeployment.objects.get(pk=deployment_id)
+        plugin = _get_app_plugin(deployment)
+        provider = _get_cloud_provider(
+            deployment.deployment_target.target_zone,
+            payloads.resolve_credentials(credentials))
+        if not plugin.check_bake(provider, bake_state):
+            confirm_bake.apply_async(
+                [bake_task_id, deployment_id, credentials, bake_state],
+                countdown=bake_state['countdown'])
+            return
+        result = {'image_id': bake_state['image_id'],
+                  'config_hash': bake_state['config_hash']}
+        _record_baked_image(deployment, result)
+    except Exception as e:
+        msg = "Bake task failed: %s" % str(e)
+        log.error(msg)
+        self.backend.mark_as_failure(bake_task_id, Exception(msg))
+        migrate_task_result.apply_async([bake_task_id], countdown=1)
+        return
+    log.info("Image %s of deployment %s is available", result['image_id'],
+             deployment.name)
+    self.backend.mark_as_done(bake_task_id, result)
+    progress.discard(bake_task_id)
+    migrate_task_result.apply_async([bake_task_id], countdown=1)
+
+
+def _record_baked_image(deployment, result):
+    """Record an image baked from a deployment as a ``BakedImage``."""
+    target_zone = deployment.deployment_target.target_zone
+    cloud_version_conf = models.ApplicationVersionCloudConfig.objects.get(
+        application_version=deployment.application_version,
+        target=deployment.deployment_target)
+    image = models.Image.objects.create(
+        name=deployment.name[:60], image_id=result['image_id'],
+        description="Baked from deployment %s" % deployment.name,
+        region=target_zone.region)
+    models.BakedImage.objects.update_or_create(
+        app_version_cloud_config=cloud_version_conf,
+        config_hash=result['config_hash'], defaults={'image': image})
+
+
+# Deletes never expire; a delete request left in the queue would leave its
+# task pending for good
+@shared_task(bind=True, time_limit=DELETE_TIME_LIMIT)
 def delete_appliance(self, deployment_id, credentials):
     """
     Deletes this appliances
     If successful, will also mark the supplied ``deployment`` as
     ``archived`` in the database.
+
+    Plugins supporting it (see ``BaseVMAppPlugin.start_delete``) only
+    request the deletion here. The deletion is confirmed by ``confirm_delete``
+    tasks, which archive the deployment and record the result under this
+    task's id, so that no worker waits on the instance to be deleted.
     """
     try:
         deployment = models.ApplicationDeployment.objects.get(pk=deployment_id)
@@ -232,11 +716,28 @@ def delete_appliance(self, deployment_id, credentials):
         dpl = _serialize_deployment(deployment)
         # FIXME: Should not be instantiating provider here
         target_zone = deployment.deployment_target.target_zone
-        provider = domain_model.get_cloud_provider(target_zone, credentials)
-        result = plugin.delete(provider, dpl)
+        provider = _get_cloud_provider(
+            target_zone, payloads.resolve_credentials(credentials))
+        if getattr(plugin, 'supports_staged_delete', False):
+            delete_state = plugin.start_delete(provider, dpl)
+            if delete_state:
+                Task(self).update_state(
+                    state='PROGRESSING',
+                    meta={'action': "Deleting instance %s" %
+                                    delete_state['instance_id']})
+                confirm_delete.apply_async(
+                    [self.request.id, deployment_id, credentials,
+                     delete_state], countdown=delete_state['countdown'])
+                # The result is recorded by confirm_delete
+                raise Ignore()
+            result = False
+        else:
+            result = plugin.delete(provider, dpl)
         if result is True:
             deployment.archived = True
             deployment.save()
+    except Ignore:
+        raise
     except Exception as e:
         msg = "Delete task failed: %s" % str(e)
         log.error(msg)
@@ -248,6 +749,55 @@ def delete_appliance(self, deployment_id, credentials):
     return result
 
 
+@shared_task(bind=True, time_limit=120)
+def confirm_delete(self, delete_task_id, deployment_id, credentials,
+                   delete_state):
+    """
+    Confirm a deletion requested by ``delete_appliance``.
+
+    Checks whether the deployment's instance is gone (see
+    ``BaseVMAppPlugin.check_delete``) and reschedules itself until it is, at
+    which point the deployment is archived.
+
+    @type  delete_task_id: ``str``
+    @param delete_task_id: Id of the ``delete_appliance`` task, under which
+                           the result of the deletion is recorded.
+
+    @type  delete_state: ``dict``
+    @param delete_state: The state of the deletion, as returned by
+                         ``start_delete``.
+    """
+    try:
+        deployment = models.ApplicationDeployment.objects.get(pk=deployment_id)
+        plugin = _get_app_plugin(deployment)
+        provider = _get_cloud_provider(
+            deployment.deployment_target.target_zone,
+            payloads.resolve_credentials(credentials))
+        deleted = plugin.check_delete(provider, delete_state)
+    except Exception as e:
+        msg = "Delete task failed: %s" % str(e)
+        log.error(msg)
+        self.backend.mark_as_failure(delete_task_id, Exception(msg))
+        _schedule_delete_followup(delete_task_id)
+        return
+    if not deleted:
+        confirm_delete.apply_async(
+            [delete_task_id, deployment_id, credentials, delete_state],
+            countdown=delete_state['countdown'])
+        return
+    log.info("Deletion of deployment %s confirmed", deployment.name)
+    deployment.archived = True
+    deployment.save()
+    self.backend.mark_as_done(delete_task_id, True)
+    _schedule_delete_followup(delete_task_id)
+
+
+def _schedule_delete_followup(delete_task_id):
+    """Schedule the result migration of a finished deletion."""
+    progress.discard(delete_task_id)
+    migrate_task_result.apply_async([delete_task_id], countdown=1)
+
+
 class Task(object):
     """
     An abstraction class for handling task actions.
@@ -256,16 +806,35 @@ class Task(object):
     independent of CloudLaunch and its task broker.
     """
 
-    def __init__(self, broker_task):
+    def __init__(self, broker_task, task_id=None):
         self.task = broker_task
+        self.task_id = task_id
+        self._writer = progress.ProgressWriter(
+            self._write_state, settings.CLOUDLAUNCH_PROGRESS_WRITE_INTERVAL)
+        self._checkpoint = None
+
+    def _write_state(self, task_id, state, meta):
+        self.task.update_state(task_id=task_id, state=state, meta=meta)
+
+    @property
+    def id(self):
+        """Id of the task whose state is updated through this object."""
+        return self.task_id or self.task.request.id
 
     def update_state(self, task_id=None, state=None, meta=None):
         """
         Update task state.
 
+        The state is recorded as the task's latest progress right away but
+        written to the result backend at most every
+        ``CLOUDLAUNCH_PROGRESS_WRITE_INTERVAL`` seconds while it doesn't
+        change (see ``progress.ProgressWriter``). Updates held back are
+        written by ``flush``.
+
         @type  task_id: ``str``
-        @param task_id: Id of the task to update. Defaults to the id of the
-                        current task.
+        @param task_id: Id of the task to update. Defaults to the task id
+                        this object was created with or, if none, the id of
+                        the current task.
 
         @type  state: ``str
         @param state: New state.
@@ -273,4 +842,41 @@ class Task(object):
         @type  meta: ``dict``
         @param meta: State meta-data.
         """
-        self.task.update_state(state=state, meta=meta)
+        self._writer.update(task_id or self.id, state, meta)
+
+    def flush(self):
+        """Write the latest state updates held back to the result backend."""
+        self._writer.flush()
+
+    def get_checkpoint(self):
+        """
+        Get the last checkpoint recorded for the task.
+
+        :rtype: ``dict``
+        :return: A copy of the checkpoint; an empty dict if none has been
+                 recorded, i.e., the task is not resuming an interrupted
+                 launch.
+        """
+        if self._checkpoint is None:
+            checkpoint = models.LaunchCheckpoint.objects.filter(
+                launch_task_id=self.id).first()
+            self._checkpoint = json.loads(checkpoint.state) if checkpoint else {}
+        return copy.deepcopy(self._checkpoint)
+
+    def checkpoint(self, **state):
+        """
+        Record the progress of a launch.
+
+        The supplied values are merged into the last checkpoint of the task,
+        which a launch task redelivered after its worker was lost resumes
+        from. The checkpoint is discarded once the launch has finished.
+
+        @type  state: JSON-serializable values
+        @param state: The values to record.
+        """
+        checkpoint = self.get_checkpoint()
+        checkpoint.update(state)
+        models.LaunchCheckpoint.objects.update_or_create(
+            launch_task_id=self.id,
+            defaults={'state': json.dumps(checkpoint)})
+        self._checkpoint = checkpoint
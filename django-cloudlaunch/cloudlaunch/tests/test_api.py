@@ -1,10 +1,13 @@
 from contextlib import contextmanager
+from datetime import timedelta
 import json
+import os
 from unittest.mock import patch
 import uuid
 import yaml
 
 from celery.result import AsyncResult
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.test import TestCase
@@ -19,7 +22,11 @@ from cloudlaunch.models import (
     ApplicationVersionCloudConfig,
     ApplicationDeploymentTask,
     CloudDeploymentTarget,
-    Image)
+    Image,
+    PhoneHome)
+from cloudlaunch import admission
+from cloudlaunch import payloads
+from cloudlaunch.configurers import ConfigurerOutput
 
 
 @contextmanager
@@ -283,63 +290,53 @@ class ApplicationDeploymentTests(BaseAuthenticatedAPITestCase):
 
     def test_create_deployment(self):
         """Create deployment from 'application' and 'application_version'."""
-        with mocked_celery_task_call(
-                "cloudlaunch.tasks.create_appliance.delay",
-                'test-deployment',
-                self.app_version_cloud_config.id,
-                self.credentials.to_dict(),
-                self.DEFAULT_LAUNCH_CONFIG,
-                None) as async_result:
-
+        with patch("cloudlaunch.tasks.create_appliance.apply_async") as mock_launch:
             response = self.client.post(reverse('deployments-list'), {
                 'name': 'test-deployment',
                 'application': self.application_version.application.slug,
                 'application_version': self.application_version.version,
                 'deployment_target_id': self.deployment_target.id,
             })
-            self.assertResponse(response, status=201, data_contains={
-                'name': 'test-deployment',
-                'application_version': self.application_version.id,
-                'deployment_target': {
-                    'id': self.deployment_target.id,
-                    'target_zone': {
-                        'zone_id': self.target_zone.name
-                    }
-                },
-                'application_config': self.DEFAULT_LAUNCH_CONFIG,
-                'app_version_details': {
-                    'version': self.application_version.version,
-                    'application': {
-                        'slug': self.application_version.application.slug,
-                    }
-                },
-                'latest_task': {
-                    'celery_id': async_result.id,
-                    'action': 'LAUNCH'
-                },
-                'launch_task': {
-                    'celery_id': async_result.id,
-                    'action': 'LAUNCH'
-                }
-            })
         # Check that deployment and its LAUNCH task were created
         app_deployment = ApplicationDeployment.objects.get()
         launch_task = ApplicationDeploymentTask.objects.get(
                 action=ApplicationDeploymentTask.LAUNCH,
                 deployment=app_deployment)
-        self.assertIsNotNone(launch_task)
+        # The launch task is passed references rather than the credentials
+        # and configs
+        mock_launch.assert_called_once_with(
+            [app_deployment.id, {'id': self.credentials.id}, None],
+            task_id=launch_task.celery_id)
+        self.assertResponse(response, status=201, data_contains={
+            'name': 'test-deployment',
+            'application_version': self.application_version.id,
+            'deployment_target': {
+                'id': self.deployment_target.id,
+                'target_zone': {
+                    'zone_id': self.target_zone.name
+                }
+            },
+            'application_config': self.DEFAULT_LAUNCH_CONFIG,
+            'app_version_details': {
+                'version': self.application_version.version,
+                'application': {
+                    'slug': self.application_version.application.slug,
+                }
+            },
+            'latest_task': {
+                'celery_id': launch_task.celery_id,
+                'action': 'LAUNCH'
+            },
+            'launch_task': {
+                'celery_id': launch_task.celery_id,
+                'action': 'LAUNCH'
+            }
+        })
+
 
     def test_merging_app_config(self):
         """Specify app_config and verify it is merged correctly."""
-        with mocked_celery_task_call(
-                "cloudlaunch.tasks.create_appliance.delay",
-                'test-deployment',
-                self.app_version_cloud_config.id,
-                self.credentials.to_dict(),
-                {'foo': 1, 'bar': 3, 'baz': 4,
-                 'config_cloudlaunch': {'instance_user_data': "userdata"}},
-                'userdata') as async_result:
-
+        with patch("cloudlaunch.tasks.create_appliance.apply_async") as mock_launch:
             response = self.client.post(reverse('deployments-list'), {
                 'name': 'test-deployment',
                 'application': self.application_version.application.slug,
@@ -347,44 +344,135 @@ class ApplicationDeploymentTests(BaseAuthenticatedAPITestCase):
                 'deployment_target_id': self.deployment_target.id,
                 'config_app': json.dumps(self.DEFAULT_APP_CONFIG),
             })
-            self.assertResponse(response, status=201, data_contains={
-                'name': 'test-deployment',
-                'application_version': self.application_version.id,
-                'deployment_target': {
-                    'id': self.deployment_target.id,
-                    'target_zone': {
-                        'zone_id': self.target_zone.name
-                    }
-                },
-                'application_config': {
-                    'foo': 1,  # default from DEFAULT_LAUNCH_CONFIG
-                    'bar': 3,  # config_app overrides DEFAULT_LAUNCH_CONFIG
-                    'baz': 4,  # added by config_app
-                    'config_cloudlaunch': {
-                        'instance_user_data': "userdata"
-                    }
-                },
-                'app_version_details': {
-                    'version': self.application_version.version,
-                    'application': {
-                        'slug': self.application_version.application.slug,
-                    }
-                },
-                'latest_task': {
-                    'celery_id': async_result.id,
-                    'action': 'LAUNCH'
-                },
-                'launch_task': {
-                    'celery_id': async_result.id,
-                    'action': 'LAUNCH'
-                }
-            })
-        # Check that deployment and its LAUNCH task were created
         app_deployment = ApplicationDeployment.objects.get()
         launch_task = ApplicationDeploymentTask.objects.get(
                 action=ApplicationDeploymentTask.LAUNCH,
                 deployment=app_deployment)
-        self.assertIsNotNone(launch_task)
+        # The user data is passed as a payload and the merged app config is
+        # looked up from the deployment
+        deployment_id, _, user_data = mock_launch.call_args[0][0]
+        self.assertEqual(deployment_id, app_deployment.id)
+        self.assertEqual(payloads.load(user_data), 'userdata')
+        self.assertResponse(response, status=201, data_contains={
+            'name': 'test-deployment',
+            'application_version': self.application_version.id,
+            'deployment_target': {
+                'id': self.deployment_target.id,
+                'target_zone': {
+                    'zone_id': self.target_zone.name
+                }
+            },
+            'application_config': {
+                'foo': 1,  # default from DEFAULT_LAUNCH_CONFIG
+                'bar': 3,  # config_app overrides DEFAULT_LAUNCH_CONFIG
+                'baz': 4,  # added by config_app
+                'config_cloudlaunch': {
+                    'instance_user_data': "userdata"
+                }
+            },
+            'app_version_details': {
+                'version': self.application_version.version,
+                'application': {
+                    'slug': self.application_version.application.slug,
+                }
+            },
+            'latest_task': {
+                'celery_id': launch_task.celery_id,
+                'action': 'LAUNCH'
+            },
+            'launch_task': {
+                'celery_id': launch_task.celery_id,
+                'action': 'LAUNCH'
+            }
+        })
+
+
+    def test_create_deployment_batch(self):
+        """Create several deployments with a single batch request."""
+        with patch("cloudlaunch.tasks.create_appliance_batch.delay") as mock_batch:
+            response = self.client.post(reverse('deployments-batch'), {
+                'name': 'test-deployment',
+                'application': self.application_version.application.slug,
+                'application_version': self.application_version.version,
+                'deployment_target_id': self.deployment_target.id,
+                'count': 3,
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [d['name'] for d in response.data],
+            ['test-deployment-1', 'test-deployment-2', 'test-deployment-3'])
+        # A single launch task is queued for the whole batch
+        mock_batch.assert_called_once()
+        launches = mock_batch.call_args[0][0]
+        self.assertEqual(len(launches), 3)
+        # Each deployment gets its own LAUNCH task tracking its progress
+        for deployment_id, celery_id in launches:
+            launch_task = ApplicationDeploymentTask.objects.get(
+                action=ApplicationDeploymentTask.LAUNCH,
+                deployment=deployment_id)
+            self.assertEqual(launch_task.celery_id, celery_id)
+
+    def test_deployment_batch_size_limit(self):
+        """A batch larger than the configured limit is rejected."""
+        with patch("cloudlaunch.tasks.create_appliance_batch.delay") as mock_batch:
+            response = self.client.post(reverse('deployments-batch'), {
+                'name': 'test-deployment',
+                'application': self.application_version.application.slug,
+                'application_version': self.application_version.version,
+                'deployment_target_id': self.deployment_target.id,
+                'count': 10000,
+            })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        mock_batch.assert_not_called()
+        self.assertEqual(ApplicationDeployment.objects.count(), 0)
+
+    def test_deployment_queue_failure(self):
+        """A deployment whose launch can't be queued is not kept."""
+        with patch("cloudlaunch.tasks.create_appliance.apply_async",
+                   side_effect=Exception("Broker unavailable")):
+            response = self.client.post(reverse('deployments-list'), {
+                'name': 'test-deployment',
+                'application': self.application_version.application.slug,
+                'application_version': self.application_version.version,
+                'deployment_target_id': self.deployment_target.id,
+            })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ApplicationDeployment.objects.count(), 0)
+        self.assertEqual(ApplicationDeploymentTask.objects.count(), 0)
+
+    def test_deployment_batch_queue_failure(self):
+        """No deployment of a batch whose launch can't be queued is kept."""
+        with patch("cloudlaunch.tasks.create_appliance_batch.delay",
+                   side_effect=Exception("Broker unavailable")):
+            response = self.client.post(reverse('deployments-batch'), {
+                'name': 'test-deployment',
+                'application': self.application_version.application.slug,
+                'application_version': self.application_version.version,
+                'deployment_target_id': self.deployment_target.id,
+                'count': 3,
+            })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ApplicationDeployment.objects.count(), 0)
+        self.assertEqual(ApplicationDeploymentTask.objects.count(), 0)
+
+    def test_launch_admission(self):
+        """A launch is rejected with a 429 while the launch queue is full."""
+        admission._backend = admission.LocalAdmissionBackend()
+        self.addCleanup(setattr, admission, '_backend', None)
+        admission.check_launch_admission(
+            settings.CLOUDLAUNCH_LAUNCH_QUEUE_LIMIT)
+        with patch("cloudlaunch.tasks.create_appliance.apply_async") as mock_launch:
+            response = self.client.post(reverse('deployments-list'), {
+                'name': 'test-deployment',
+                'application': self.application_version.application.slug,
+                'application_version': self.application_version.version,
+                'deployment_target_id': self.deployment_target.id,
+            })
+        self.assertEqual(response.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        mock_launch.assert_not_called()
+        self.assertEqual(ApplicationDeployment.objects.count(), 0)
 
 
 class ApplicationDeploymentTaskTests(BaseAuthenticatedAPITestCase):
@@ -437,7 +525,7 @@ class ApplicationDeploymentTaskTests(BaseAuthenticatedAPITestCase):
         with mocked_celery_task_call(
                 "cloudlaunch.tasks.health_check.delay",
                 self.app_deployment.id,
-                self.app_deployment.credentials.to_dict()) as async_result:
+                {'id': self.app_deployment.credentials.id}) as async_result:
 
             response = self.client.post(
                 reverse('deployment_task-list',
@@ -455,12 +543,40 @@ class ApplicationDeploymentTaskTests(BaseAuthenticatedAPITestCase):
                                                      deployment=self.app_deployment)
         self.assertIsNotNone(task)
 
+    def test_coalesce_health_check_tasks(self):
+        """Test that duplicate HEALTH_CHECK tasks are coalesced."""
+        url = reverse('deployment_task-list',
+                      kwargs={'deployment_pk': self.app_deployment.id})
+        with mocked_celery_task_call(
+                "cloudlaunch.tasks.health_check.delay",
+                self.app_deployment.id,
+                {'id': self.app_deployment.credentials.id}) as async_result:
+            self.client.post(url, {'action': 'HEALTH_CHECK'})
+            # The first check is still pending
+            response = self.client.post(url, {'action': 'HEALTH_CHECK'})
+            self.assertResponse(response, status=201, data_contains={
+                'celery_id': async_result.id})
+        task = ApplicationDeploymentTask.objects.get(action='HEALTH_CHECK')
+        # Migrate a stale result of the check
+        ApplicationDeploymentTask.objects.filter(id=task.id).update(
+            celery_id=None, _status='SUCCESS',
+            updated=task.updated - timedelta(minutes=5))
+        with mocked_celery_task_call(
+                "cloudlaunch.tasks.health_check.delay",
+                self.app_deployment.id,
+                {'id': self.app_deployment.credentials.id}) as async_result:
+            response = self.client.post(url, {'action': 'HEALTH_CHECK'})
+            self.assertResponse(response, status=201, data_contains={
+                'celery_id': async_result.id})
+        self.assertEqual(ApplicationDeploymentTask.objects.filter(
+            action='HEALTH_CHECK').count(), 2)
+
     def test_create_restart_task(self):
         """Test creating a RESTART type task."""
         with mocked_celery_task_call(
                 "cloudlaunch.tasks.restart_appliance.delay",
                 self.app_deployment.id,
-                self.app_deployment.credentials.to_dict()) as async_result:
+                {'id': self.app_deployment.credentials.id}) as async_result:
 
             response = self.client.post(
                 reverse('deployment_task-list',
@@ -483,7 +599,7 @@ class ApplicationDeploymentTaskTests(BaseAuthenticatedAPITestCase):
         with mocked_celery_task_call(
                 "cloudlaunch.tasks.delete_appliance.delay",
                 self.app_deployment.id,
-                self.app_deployment.credentials.to_dict()) as async_result:
+                {'id': self.app_deployment.credentials.id}) as async_result:
 
             response = self.client.post(
                 reverse('deployment_task-list',
@@ -530,6 +646,52 @@ class ApplicationDeploymentTaskTests(BaseAuthenticatedAPITestCase):
             1,
             "Only one LAUNCH task should exist.")
 
+    def test_task_log(self):
+        """Test retrieving the archived configuration output of a task."""
+        task = ApplicationDeploymentTask.objects.create(
+            deployment=self.app_deployment,
+            action=ApplicationDeploymentTask.LAUNCH,
+            celery_id=str(uuid.uuid4()))
+        url = reverse('deployment_task-log',
+                      kwargs={'deployment_pk': self.app_deployment.id,
+                              'pk': task.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        output = ConfigurerOutput(log_path=task.log_path)
+        output.write("TASK [Gathering Facts]")
+        output.write("ok: [10.0.0.1]")
+        output.close()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content),
+                         b"TASK [Gathering Facts]\nok: [10.0.0.1]\n")
+        # The log is removed along with the task
+        task.delete()
+        self.assertFalse(os.path.exists(task.log_path))
+
+
+class PhoneHomeTests(APITestCase):
+
+    def test_phone_home(self):
+        """Test that only the first report of a waiting launch is recorded."""
+        url = reverse('phone-home', kwargs={'token': 'abc-123'})
+        response = self.client.post(url, {'status': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        PhoneHome.objects.create(launch_task_id=str(uuid.uuid4()),
+                                 token='abc-123')
+        response = self.client.post(url, {'status': 'done'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            url, {'status': 0, 'output': 'configured\n'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        phone_home = PhoneHome.objects.get(token='abc-123')
+        self.assertEqual(phone_home.status, 0)
+        self.assertEqual(phone_home.output, 'configured\n')
+        response = self.client.post(url, {'status': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class ApplicationDeploymentTaskModelTestCase(TestCase):
 
@@ -1,9 +1,21 @@
+import asyncio
+import copy
+from unittest.mock import ANY
+from unittest.mock import MagicMock
 from unittest.mock import patch
 import yaml
 
+from cloudbridge.interfaces import InstanceState
+from cloudbridge.interfaces.resources import MachineImageState
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
 from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.test import override_settings
 from django.urls import reverse
 from djcloudbridge import models as cb_models
+import paramiko
 from rest_framework.test import APILiveServerTestCase
 
 from cloudlaunch.models import (
@@ -14,6 +26,17 @@ from cloudlaunch.models import (
     ApplicationDeploymentTask,
     CloudDeploymentTarget,
     Image)
+from cloudlaunch import admission
+from cloudlaunch import circuit_breaker
+from cloudlaunch import cloud_cache
+from cloudlaunch import instance_poller
+from cloudlaunch import locks
+from cloudlaunch import payloads
+from cloudlaunch import progress
+from cloudlaunch import rate_limiter
+from cloudlaunch import ssh_keys
+from cloudlaunch.backend_plugins.base_vm_app import BaseVMAppPlugin
+from cloudlaunch.http_prober import HttpReadinessProber
 
 
 class CLLaunchTestBase(APILiveServerTestCase):
@@ -50,6 +73,10 @@ class CLLaunchTestBase(APILiveServerTestCase):
         patcher_migrate_result = patch('cloudlaunch.tasks.migrate_task_result')
         patcher_migrate_result.start()
         self.addCleanup(patcher_migrate_result.stop)
+        # Resources cached by a previous test no longer exist
+        cloud_cache.get_cache().clear()
+        instance_poller.get_poller().clear()
+        payloads.get_cache().clear()
 
         super().setUp()
 
@@ -193,6 +220,22 @@ class ApplicationLaunchTests(CLLaunchTestBase):
             self.assertIsNotNone(launch_task)
             mock_del.get.assert_not_called()
 
+    @override_settings(CLOUDLAUNCH_STAGED_LAUNCH=True)
+    def test_create_deployment_staged(self):
+        """Checks that a staged launch completes the deployment's LAUNCH task."""
+        with patch('cloudbridge.base.resources.BaseInstance.wait_till_ready') as mock_wait:
+            response = self._create_deployment()
+            self.assertResponse(response, status=201, data_contains={
+                'name': 'test-deployment'})
+            app_deployment = ApplicationDeployment.objects.get()
+            launch_task = ApplicationDeploymentTask.objects.get(
+                action=ApplicationDeploymentTask.LAUNCH,
+                deployment=app_deployment)
+            self.assertEqual(launch_task.status, "SUCCESS")
+            self.assertTrue(launch_task.result['cloudLaunch']['instance']['id'])
+            # The staged launch polls the instance instead of blocking on it
+            mock_wait.assert_not_called()
+
     def test_launch_error_triggers_cleanup(self):
         """
         Checks whether an error during launch triggers a cleanup of the instance.
@@ -204,7 +247,7 @@ class ApplicationLaunchTests(CLLaunchTestBase):
             if count_ref[0] > 0 and count_ref[0] < 3:
                 raise Exception("Some exception occurred while waiting")
 
-        with patch('cloudbridge.base.resources.BaseInstance.wait_for',
+        with patch('cloudlaunch.instance_poller.InstanceStatePoller.wait_for',
                    side_effect=lambda *args, **kwargs: succeed_on_second_try(
                        counter_ref, *args, **kwargs)) as mock_wait:
             self._create_deployment()
@@ -213,3 +256,460 @@ class ApplicationLaunchTests(CLLaunchTestBase):
                 action=ApplicationDeploymentTask.LAUNCH,
                 deployment=app_deployment)
             self.assertNotEquals(launch_task.status, "SUCCESS")
+
+
+class HttpReadinessProberTests(APILiveServerTestCase):
+
+    def _wait_for_all(self, checks):
+        done = {}
+
+        async def on_done(check, ready):
+            done[check['url']] = ready
+
+        asyncio.run(HttpReadinessProber(max_delay=1).wait_for_all(
+            checks, on_done))
+        return done
+
+    def test_wait_for_all(self):
+        """Checks that concurrently watched apps are reported as they finish."""
+        ready_url = self.live_server_url + reverse('application-list')
+        # Nothing listens on the discard port
+        down_url = 'http://localhost:9/'
+        done = self._wait_for_all([
+            {'url': ready_url, 'timeout': 5},
+            {'url': down_url, 'timeout': 2}])
+        self.assertEqual(done, {ready_url: True, down_url: False})
+
+    def test_ok_status_codes(self):
+        """Checks that error codes other than the accepted ones are not ready."""
+        url = self.live_server_url + '/no-such-page/'
+        done = self._wait_for_all([
+            {'url': url, 'ok_status_codes': [], 'timeout': 2}])
+        self.assertEqual(done, {url: False})
+        done = self._wait_for_all([
+            {'url': url, 'ok_status_codes': [404], 'timeout': 2}])
+        self.assertEqual(done, {url: True})
+
+
+class SSHKeysTests(SimpleTestCase):
+
+    def test_key_pair_pool(self):
+        """Checks that pooled key pairs are usable and handed out once."""
+        pool = ssh_keys.KeyPairPool(size=2)
+        key_pairs = [pool.get() for _ in range(4)]
+        self.assertEqual(len(set(key_pairs)), 4)
+        public_key, private_key = key_pairs[-1]
+        self.assertTrue(public_key.startswith('ssh-ed25519 '))
+        pkey = ssh_keys.load_private_key(private_key)
+        self.assertEqual(pkey.get_base64(), public_key.split()[1])
+
+    def test_load_legacy_private_key(self):
+        """Checks that PKCS#8 encoded RSA keys, without a key type, load."""
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        private_key = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()).decode('utf-8')
+        self.assertIsInstance(ssh_keys.load_private_key(private_key),
+                              paramiko.RSAKey)
+
+
+class BakedImageTests(SimpleTestCase):
+
+    APP_CONFIG = {
+        'config_appliance': {
+            'runner': 'ansible',
+            'repository': 'https://github.com/afgane/Rancher-Ansible',
+            'inventoryTemplate': ''
+        }
+    }
+
+    def test_launch_from_baked_image(self):
+        """Checks that a matching baked image is used and skips configure."""
+        plugin = BaseVMAppPlugin()
+        config_hash = plugin._get_config_hash(self.APP_CONFIG, 'abc123')
+        self.assertEqual(len(config_hash), 64)
+        self.assertNotEqual(
+            config_hash, plugin._get_config_hash(self.APP_CONFIG, 'def456'))
+        provider_config = {'cloud_config': {'image': {'image_id': 'abc123'}},
+                           'baked_images': {config_hash: 'baked123'}}
+        self.assertEqual(
+            plugin._get_baked_image(self.APP_CONFIG, provider_config),
+            (config_hash, 'baked123'))
+        p_result = {'cloudLaunch': {'bakedImageID': 'baked123'}}
+        self.assertTrue(plugin._skips_configure(self.APP_CONFIG, p_result))
+        self.assertFalse(plugin._skips_configure(
+            {'config_appliance': dict(self.APP_CONFIG['config_appliance'],
+                                      rerunOnBakedImage=True)}, p_result))
+        # Hosts that configure themselves during boot can't be baked
+        self.assertIsNone(plugin._get_config_hash(
+            {'config_appliance': {'runner': 'cloudinit',
+                                  'config_script': 'true'}}, 'abc123'))
+
+
+class CloudResourceCacheTests(SimpleTestCase):
+
+    class Provider(object):
+        PROVIDER_ID = 'mock'
+
+        def __init__(self, config):
+            self.config = config
+
+    def test_cache_per_account(self):
+        cache = cloud_cache.CloudResourceCache(ttl=60)
+        provider = self.Provider({'aws_region_name': 'us-east-1'})
+        lookups = []
+
+        def lookup():
+            lookups.append(1)
+            return 'image'
+
+        for _ in range(2):
+            self.assertEqual(cache.get_or_lookup(
+                self.Provider({'aws_region_name': 'us-east-1'}), 'image',
+                'abc123', lookup), 'image')
+        self.assertEqual(len(lookups), 1)
+        # Other accounts or regions have their own entries
+        self.assertIsNone(cache.get(
+            self.Provider({'aws_region_name': 'us-west-1'}), 'image',
+            'abc123'))
+        cache.invalidate(provider, 'image', 'abc123')
+        self.assertIsNone(cache.get(provider, 'image', 'abc123'))
+        # Missing resources are not cached
+        cache.get_or_lookup(provider, 'image', 'def456', lambda: None)
+        cache.put(provider, 'image', 'def456', 'created')
+        self.assertEqual(cache.get(provider, 'image', 'def456'), 'created')
+
+
+class InstanceStatePollerTests(SimpleTestCase):
+
+    def test_shared_listing(self):
+        """Checks that pollers sharing a backend share their listings."""
+        backend = instance_poller.LocalInstanceStateBackend()
+        pollers = [instance_poller.InstanceStatePoller(backend, interval=60)
+                   for _ in range(2)]
+        provider = MagicMock(PROVIDER_ID='mock', config={'region': 'r1'})
+        provider.compute.instances.__iter__.side_effect = lambda: iter([
+            MagicMock(id='i-1', state=InstanceState.RUNNING),
+            MagicMock(id='i-2', state=InstanceState.PENDING)])
+        self.assertEqual(pollers[0].get_state(provider, 'i-1'),
+                         InstanceState.RUNNING)
+        self.assertEqual(pollers[1].get_state(provider, 'i-2'),
+                         InstanceState.PENDING)
+        provider.compute.instances.__iter__.assert_called_once()
+        # Instances missing from the listing are looked up on their own
+        provider.compute.instances.get.return_value = None
+        self.assertEqual(pollers[1].get_state(provider, 'i-3'),
+                         InstanceState.UNKNOWN)
+        provider.compute.instances.get.assert_called_once_with('i-3')
+
+
+class LocksTests(SimpleTestCase):
+
+    @override_settings(CLOUDLAUNCH_LOCK_LEASE=5, CLOUDLAUNCH_LOCK_TIMEOUT=1)
+    def test_lock_per_account(self):
+        provider = CloudResourceCacheTests.Provider(
+            {'aws_region_name': 'us-east-1'})
+        with patch('cloudlaunch.locks._backend', locks.LocalLockBackend()):
+            with locks.lock(provider, 'key_pair:cloudlaunch-key-pair'):
+                # Other resources and accounts are not locked
+                with locks.lock(provider, 'vm_firewall:cloudlaunch'):
+                    pass
+                with locks.lock(CloudResourceCacheTests.Provider(
+                        {'aws_region_name': 'us-west-1'}),
+                        'key_pair:cloudlaunch-key-pair'):
+                    pass
+                with self.assertRaises(locks.LockTimeout):
+                    with locks.lock(provider, 'key_pair:cloudlaunch-key-pair',
+                                    timeout=0.1):
+                        pass
+            with locks.lock(provider, 'key_pair:cloudlaunch-key-pair'):
+                pass
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def test_adaptive_rate(self):
+        limiter = rate_limiter.RateLimiter(
+            rate_limiter.LocalRateLimitBackend(), rate=10, burst=2,
+            min_rate=1, recovery=60)
+        backend = limiter.backend
+        key = limiter._get_key('account', 'compute.instances')
+        # A full bucket allows a burst of calls
+        self.assertEqual(backend.take(key, 10, 2, 60), 0)
+        self.assertEqual(backend.take(key, 10, 2, 60), 0)
+        self.assertGreater(backend.take(key, 10, 2, 60), 0)
+        # Throttling halves the rate, down to the minimum
+        limiter.throttled('account', 'compute.instances')
+        self.assertAlmostEqual(backend._buckets[key]['rate'], 5, places=1)
+        for _ in range(5):
+            limiter.throttled('account', 'compute.instances')
+        self.assertEqual(backend._buckets[key]['rate'], 1)
+
+    def test_is_throttling_error(self):
+        class ClientError(Exception):
+            response = {'Error': {'Code': 'RequestLimitExceeded'}}
+
+        try:
+            try:
+                raise ClientError()
+            except ClientError as e:
+                raise Exception("Wrapped") from e
+        except Exception as e:
+            self.assertTrue(rate_limiter.is_throttling_error(e))
+        self.assertFalse(rate_limiter.is_throttling_error(
+            Exception("Instance not found")))
+
+
+@override_settings(CLOUDLAUNCH_LAUNCH_QUEUE_LIMIT=3)
+class AdmissionTests(SimpleTestCase):
+
+    def setUp(self):
+        admission._backend = admission.LocalAdmissionBackend()
+        self.addCleanup(setattr, admission, '_backend', None)
+
+    def test_admitted_launches_counted(self):
+        admission.check_launch_admission(2)
+        admission.check_launch_admission()
+        # A full queue rejects launches until queued launches start
+        with self.assertRaises(admission.LaunchCapacityExceeded) as ctx:
+            admission.check_launch_admission()
+        self.assertGreater(ctx.exception.wait, 0)
+        admission.release_launches()
+        admission.check_launch_admission()
+        # A batch is admitted only if all its launches fit
+        admission.release_launches(3)
+        with self.assertRaises(admission.LaunchCapacityExceeded):
+            admission.check_launch_admission(4)
+        admission.check_launch_admission(3)
+
+    def test_backend_errors_admit_launches(self):
+        with patch.object(admission._backend, 'admit',
+                          side_effect=Exception("Connection refused")):
+            admission.check_launch_admission(10)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_open_and_close(self):
+        breaker = circuit_breaker.CircuitBreaker(threshold=2,
+                                                 reset_timeout=60)
+        for _ in range(2):
+            self.assertFalse(breaker.before_call('ec2'))
+            breaker.record_failure('ec2')
+        # Open circuits fail calls fast
+        with self.assertRaises(circuit_breaker.CloudUnavailable):
+            breaker.before_call('ec2')
+        # Other endpoints are not affected
+        self.assertFalse(breaker.before_call('nova'))
+        # Once the reset timeout has passed, a single probe is let through
+        breaker._circuits['ec2'].opened -= 60
+        self.assertTrue(breaker.before_call('ec2'))
+        with self.assertRaises(circuit_breaker.CloudUnavailable):
+            breaker.before_call('ec2')
+        breaker.record_success('ec2')
+        self.assertFalse(breaker.before_call('ec2'))
+
+    def test_is_unavailability_error(self):
+        self.assertTrue(circuit_breaker.is_unavailability_error(
+            ConnectionRefusedError()))
+        self.assertFalse(circuit_breaker.is_unavailability_error(
+            KeyError('i-123')))
+
+
+class PayloadsTests(SimpleTestCase):
+
+    @override_settings(CLOUDLAUNCH_PAYLOAD_COMPRESS_SIZE=100)
+    def test_compression(self):
+        small = {'user_data': 'x' * 10}
+        large = {'user_data': 'x' * 1000}
+        self.assertEqual(payloads._decode(payloads._encode(small)), small)
+        encoded = payloads._encode(large)
+        self.assertTrue(encoded.startswith(payloads.COMPRESSED_PREFIX))
+        self.assertLess(len(encoded), 100)
+        self.assertEqual(payloads._decode(encoded), large)
+
+    def test_resolved_cache(self):
+        cache = payloads._ResolvedCache(ttl=60)
+        resolved = []
+
+        def resolve():
+            resolved.append(1)
+            return {'aws_access_key': 'key'}
+
+        creds = cache.get_or_resolve(('credentials', 1), resolve)
+        creds['aws_access_key'] = 'changed'
+        # Resolved once and each caller gets its own copy
+        self.assertEqual(cache.get_or_resolve(('credentials', 1), resolve),
+                         {'aws_access_key': 'key'})
+        self.assertEqual(len(resolved), 1)
+
+
+class ProgressTests(SimpleTestCase):
+
+    def setUp(self):
+        progress._backend = progress.LocalProgressBackend()
+        self.addCleanup(setattr, progress, '_backend', None)
+
+    def test_coalesced_writes(self):
+        written = []
+        writer = progress.ProgressWriter(
+            lambda *args: written.append(args), interval=60)
+        writer.update('t1', 'PROGRESSING', {'action': 'Launching'})
+        writer.update('t1', 'PROGRESSING', {'action': 'Waiting'})
+        writer.update('t1', 'PROGRESSING', {'action': 'Configuring'})
+        # Only the first update is written; the latest is recorded
+        self.assertEqual(written, [('t1', 'PROGRESSING',
+                                    {'action': 'Launching'})])
+        self.assertEqual(progress.get('t1')['meta'],
+                         {'action': 'Configuring'})
+        # State changes are written right away
+        writer.update('t1', 'ERROR', {'action': 'Failed'})
+        self.assertEqual(written[-1], ('t1', 'ERROR', {'action': 'Failed'}))
+        writer.update('t1', 'ERROR', {'action': 'Failed again'})
+        # The last update held back is written on flush
+        writer.flush()
+        self.assertEqual(len(written), 3)
+        self.assertEqual(written[-1],
+                         ('t1', 'ERROR', {'action': 'Failed again'}))
+        writer.flush()
+        self.assertEqual(len(written), 3)
+
+    def test_latest_progress_read(self):
+        task = ApplicationDeploymentTask(celery_id='t2')
+        progress.record('t2', 'PROGRESSING', {'action': 'Configuring'})
+        with patch('cloudlaunch.models.AsyncResult') as async_result:
+            self.assertEqual(task.status, 'PROGRESSING')
+            self.assertEqual(task.result, {'action': 'Configuring'})
+            async_result.assert_not_called()
+        progress.discard('t2')
+        self.assertIsNone(progress.get('t2'))
+
+
+class TaskRoutesTests(SimpleTestCase):
+
+    def test_all_tasks_routed(self):
+        """Checks that every CloudLaunch task is routed to its queue."""
+        from celery import current_app
+        from cloudlaunch import tasks  # noqa
+        from cloudlaunchserver import celeryconfig
+        names = [name for name in current_app.tasks
+                 if name.startswith('cloudlaunch.')]
+        self.assertIn('cloudlaunch.tasks.create_appliance', names)
+        for name in names:
+            self.assertIn(name, celeryconfig.task_routes)
+
+
+class LaunchCheckpointTests(SimpleTestCase):
+
+    class CheckpointedTask(object):
+        """A task keeping its checkpoint in memory."""
+
+        id = 'launch-task'
+
+        def __init__(self, checkpoint):
+            self.checkpoint_state = checkpoint
+
+        def get_checkpoint(self):
+            return copy.deepcopy(self.checkpoint_state)
+
+        def checkpoint(self, **state):
+            self.checkpoint_state.update(state)
+
+        def update_state(self, *args, **kwargs):
+            pass
+
+    CHECKPOINT = {
+        'app_config': {'deployment_config': {'name': 'test'},
+                       'config_cloudlaunch': {}},
+        'host_config': {},
+        'instance_id': 'i-123',
+        'launch_info': {'keyPair': {'id': 'kp', 'name': 'kp',
+                                    'material': None}},
+        'public_ip': '192.0.2.10',
+        'hostname': 'test.example.org'}
+
+    @patch('cloudlaunch.instance_poller.get_poller')
+    def test_resume_launch(self, get_poller):
+        """Checks that a resumed launch doesn't launch another instance."""
+        inst = MagicMock(id='i-123', public_ips=['192.0.2.10'],
+                         private_ips=['10.0.0.10'])
+        provider = MagicMock()
+        provider.compute.instances.get.return_value = inst
+        plugin = BaseVMAppPlugin()
+        task = self.CheckpointedTask(copy.deepcopy(self.CHECKPOINT))
+        with patch.object(plugin, '_launch_instance') as launch_instance:
+            result = plugin.deploy('test', task, {},
+                                   {'cloud_provider': provider})
+            launch_instance.assert_not_called()
+        get_poller.return_value.wait_till_ready.assert_called_once_with(
+            ANY, 'i-123')
+        self.assertEqual(result['cloudLaunch']['instance'], {'id': 'i-123'})
+        self.assertEqual(result['cloudLaunch']['hostname'], 'test.example.org')
+        self.assertEqual(task.checkpoint_state['resumes'], 1)
+        self.assertEqual(task.checkpoint_state['provisioned'],
+                         {'cloudLaunch': result['cloudLaunch']})
+
+    @override_settings(CLOUDLAUNCH_LAUNCH_MAX_RESUMES=2)
+    def test_give_up_resuming(self):
+        """Checks that a launch resumed too often fails and is cleaned up."""
+        plugin = BaseVMAppPlugin()
+        task = self.CheckpointedTask(dict(self.CHECKPOINT, resumes=2))
+        with patch.object(plugin, '_cleanup_instance') as cleanup_instance:
+            with self.assertRaises(Exception):
+                plugin.deploy('test', task, {},
+                              {'cloud_provider': MagicMock()})
+            cleanup_instance.assert_called_once()
+
+
+class StagedDeleteTests(SimpleTestCase):
+
+    DEPLOYMENT = {'launch_status': 'SUCCESS',
+                  'launch_result': {'cloudLaunch': {
+                      'instance': {'id': 'i-123'}}}}
+
+    @patch('cloudlaunch.instance_poller.get_poller')
+    def test_staged_delete(self, get_poller):
+        """Checks that a deletion is requested and confirmed by polling."""
+        plugin = BaseVMAppPlugin()
+        self.assertTrue(plugin.supports_staged_delete)
+        provider = MagicMock()
+        inst = provider.compute.instances.get.return_value
+        delete_state = plugin.start_delete(provider, self.DEPLOYMENT)
+        inst.delete.assert_called_once()
+        self.assertEqual(delete_state['instance_id'], 'i-123')
+        get_poller.return_value.get_state.return_value = InstanceState.RUNNING
+        self.assertFalse(plugin.check_delete(provider, delete_state))
+        # The delete is requested again once the retry interval has passed
+        delete_state['requested'] -= 120
+        self.assertFalse(plugin.check_delete(provider, delete_state))
+        self.assertEqual(delete_state['attempts'], 2)
+        self.assertEqual(inst.delete.call_count, 2)
+        get_poller.return_value.get_state.return_value = InstanceState.UNKNOWN
+        self.assertTrue(plugin.check_delete(provider, delete_state))
+
+
+class StagedBakeTests(SimpleTestCase):
+
+    DEPLOYMENT = {'launch_status': 'SUCCESS',
+                  'launch_result': {'cloudLaunch': {
+                      'instance': {'id': 'i-123'}, 'configHash': 'a' * 64}}}
+
+    def test_staged_bake(self):
+        """Checks that an image is requested and confirmed by polling."""
+        plugin = BaseVMAppPlugin()
+        self.assertTrue(plugin.supports_staged_bake)
+        provider = MagicMock()
+        inst = provider.compute.instances.get.return_value
+        inst.create_image.return_value.id = 'img-123'
+        bake_state = plugin.start_bake(provider, self.DEPLOYMENT)
+        self.assertEqual(bake_state['image_id'], 'img-123')
+        self.assertEqual(bake_state['config_hash'], 'a' * 64)
+        img = provider.compute.images.get.return_value
+        img.state = MachineImageState.PENDING
+        self.assertFalse(plugin.check_bake(provider, bake_state))
+        img.state = MachineImageState.AVAILABLE
+        self.assertTrue(plugin.check_bake(provider, bake_state))
+        img.state = MachineImageState.ERROR
+        with self.assertRaises(Exception):
+            plugin.check_bake(provider, bake_state)
@@ -86,6 +86,8 @@ urlpatterns = [
     # Public services
     re_path(public_services_regex_pattern, include('public_appliances.urls')),
     re_path(r'^api/v1/schema/$', schema_view),
+    re_path(r'^api/v1/phone-home/(?P<token>[\w-]+)/$',
+            views.PhoneHomeView.as_view(), name='phone-home'),
     re_path(r'^image-autocomplete/$', views.ImageAutocomplete.as_view(),
             name='image-autocomplete',
     )
@@ -1,8 +1,35 @@
 """A set of utility functions used by the framework."""
+import os
 from importlib import import_module
 
+from django.conf import settings
+from django.urls import reverse
+
 
 def import_class(name):
     parts = name.rsplit('.', 1)
     cls = getattr(import_module(parts[0]), parts[1])
     return cls
+
+
+def get_task_log_path(task_key):
+    """
+    Return the path of the archived app configuration output of a task.
+
+    :type task_key: ``str``
+    :param task_key: The key of the task; see
+                     ``ApplicationDeploymentTask.log_path``.
+    """
+    return os.path.join(settings.CLOUDLAUNCH_TASK_LOG_DIR,
+                        '{0}.log.gz'.format(task_key))
+
+
+def get_phone_home_url(token):
+    """
+    Return the URL hosts configured during boot report their outcome to.
+
+    :type token: ``str``
+    :param token: The secret token identifying the launch of the host.
+    """
+    return settings.CLOUDLAUNCH_SERVER_URL.rstrip('/') + reverse(
+        'phone-home', kwargs={'token': token})
@@ -1,10 +1,18 @@
+import gzip
+import os
+
+from django.http import Http404
 from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django_filters import rest_framework as dj_filters
 from dj_rest_auth.registration.views import RegisterView
 from rest_framework import authentication
 from rest_framework import filters
 from rest_framework import generics
+from rest_framework import status
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -144,6 +152,23 @@ class DeploymentViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return models.ApplicationDeployment.objects.filter(owner=user)
 
+    @action(detail=False, methods=['post'],
+            serializer_class=serializers.BatchDeploymentSerializer)
+    def batch(self, request):
+        """
+        Launch ``count`` identical deployments with a single request.
+
+        The response lists the created deployments; the status of each one
+        is tracked through its own LAUNCH task.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deployments = serializer.save()
+        data = serializers.DeploymentSerializer(
+            deployments, many=True,
+            context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
 
 class DeploymentTaskViewSet(viewsets.ModelViewSet):
     """List tasks associated with a deployment."""
@@ -162,6 +187,45 @@ class DeploymentTaskViewSet(viewsets.ModelViewSet):
         return models.ApplicationDeploymentTask.objects.filter(
             deployment=deployment, deployment__owner=user)
 
+    @action(detail=True, methods=['get'])
+    def log(self, request, pk=None, deployment_pk=None):
+        """Return the archived output of the app configuration of a task."""
+        task = self.get_object()
+        if not os.path.exists(task.log_path):
+            raise Http404("No log available for task %s" % task.id)
+        return StreamingHttpResponse(gzip.open(task.log_path, 'rt'),
+                                     content_type='text/plain')
+
+
+class PhoneHomeView(APIView):
+    """
+    Receive the configuration report of a host configured during boot.
+
+    Hosts configured by the ``cloudinit`` runner post the exit ``status``
+    and last lines of ``output`` of their configuration script here. The
+    secret token in the URL identifies the launch, so no other
+    authentication is used.
+    """
+    exclude_from_schema = True
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request, token, format=None):
+        try:
+            exit_status = int(request.data.get('status'))
+        except (TypeError, ValueError):
+            return Response({'status': ["A valid integer is required."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        output = str(request.data.get('output') or '')
+        # Only the first report of a registered launch is recorded
+        reported = models.PhoneHome.objects.filter(
+            token=token, status__isnull=True).update(
+            status=exit_status, output=output[-1024 * 16:],
+            reported=timezone.now())
+        if not reported:
+            raise Http404("No launch is waiting on this report")
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class PublicKeyList(generics.ListCreateAPIView):
     """List public ssh keys associated with the user profile."""
@@ -1,5 +1,7 @@
 import os
 
+from kombu import Queue
+
 broker_url = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 result_backend = 'django-db'
 beat_scheduler = "django_celery_beat.schedulers:DatabaseScheduler"
@@ -7,3 +9,59 @@ result_serializer = 'json'
 task_serializer = 'json'
 accept_content = ['json']
 #accept_content = ['json', 'yaml']
+
+# Tasks are routed to dedicated queues by how long they hold a worker so
+# that, e.g., a burst of launches can't hold up health checks. A worker
+# started without -Q consumes all the queues, in the order listed here; see
+# docs/topics/task_queues.rst for the recommended worker topology.
+task_queues = (
+    Queue('health'),
+    Queue('lifecycle'),
+    Queue('housekeeping'),
+    # Accepted launches never expire; admission control bounds the launches
+    # waiting in this queue instead (see cloudlaunch/admission.py)
+    Queue('launch', durable=True),
+)
+# Every task of CloudLaunch is routed explicitly below; the default queue
+# only catches tasks of other apps
+task_default_queue = 'housekeeping'
+task_routes = {
+    # Short checks of running deployments, polled by the UI
+    'cloudlaunch.tasks.health_check': {'queue': 'health'},
+    # Launches, which hold a worker for minutes unless staged
+    'cloudlaunch.tasks.create_appliance': {'queue': 'launch'},
+    'cloudlaunch.tasks.create_appliance_batch': {'queue': 'launch'},
+    'cloudlaunch.tasks.run_launch_stage': {'queue': 'launch', 'priority': 0},
+    'cloudlaunch.tasks.complete_http_wait': {'queue': 'launch',
+                                             'priority': 0},
+    # Actions on running deployments
+    'cloudlaunch.tasks.restart_appliance': {'queue': 'lifecycle'},
+    'cloudlaunch.tasks.delete_appliance': {'queue': 'lifecycle'},
+    'cloudlaunch.tasks.confirm_delete': {'queue': 'lifecycle', 'priority': 0},
+    'cloudlaunch.tasks.bake_appliance_image': {'queue': 'lifecycle'},
+    'cloudlaunch.tasks.confirm_bake': {'queue': 'lifecycle', 'priority': 0},
+    # Bookkeeping of task results
+    'cloudlaunch.tasks.update_status_task': {'queue': 'housekeeping',
+                                             'priority': 0},
+    'cloudlaunch.tasks.migrate_launch_task': {'queue': 'housekeeping'},
+    'cloudlaunch.tasks.migrate_task_result': {'queue': 'housekeeping'},
+    # Celery's daily cleanup of expired task results, scheduled by beat
+    'celery.backend_cleanup': {'queue': 'housekeeping'},
+    'cloudlaunchserver.celery.debug_task': {'queue': 'housekeeping'},
+}
+# Priorities order the tasks within a queue. With Redis, 0 is the highest
+# priority, so the stages of launches already under way go ahead of new
+# launches. Each worker process reserves one task at a time so that queued
+# tasks are consumed in priority order.
+#
+# Launch tasks are acknowledged once they have run. With Redis, a task not
+# acknowledged within the visibility timeout, e.g., because its worker was
+# killed, is redelivered, so the timeout must exceed the longest launch.
+task_default_priority = 5
+broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    'visibility_timeout': 4 * 3600,
+}
+worker_prefetch_multiplier = 1
@@ -305,6 +305,126 @@ LOGGING = {
 CLOUDLAUNCH_APP_REGISTRY_URL = 'https://raw.githubusercontent.com/galaxyproject/' \
                                'cloudlaunch-registry/master/app-registry.yaml'
 
+# Maximum number of deployments that can be created by a single batch launch
+CLOUDLAUNCH_MAX_BATCH_SIZE = 50
+# Maximum number of deployments of a batch that are launched concurrently
+CLOUDLAUNCH_BATCH_MAX_WORKERS = 10
+# Launch appliances through short, rescheduled stage tasks instead of a
+# single task that holds a worker while waiting on the instance and the app.
+# Only applies to app plugins that support it (see
+# BaseVMAppPlugin.supports_staged_launch).
+CLOUDLAUNCH_STAGED_LAUNCH = os.environ.get(
+    'CLOUDLAUNCH_STAGED_LAUNCH', 'false').lower() == 'true'
+# Hand the wait for a staged launch's app to respond over http to the http
+# prober service (run with `manage.py run_http_prober`) instead of polling
+# the app from rescheduled stage tasks.
+CLOUDLAUNCH_HTTP_PROBER = os.environ.get(
+    'CLOUDLAUNCH_HTTP_PROBER', 'false').lower() == 'true'
+
+# URL at which launched hosts can reach this server, e.g., to report that
+# they've completed their configuration (see the cloudinit app runner)
+CLOUDLAUNCH_SERVER_URL = os.environ.get('CLOUDLAUNCH_SERVER_URL',
+                                        'http://localhost:8000')
+
+# Working directory for running app configurers, such as Ansible playbooks
+CLOUDLAUNCH_PLUGIN_RUNNERS_DIR = '/tmp/cloudlaunch_plugin_runners'
+# Local mirrors of playbook repositories, shared by all configurer runs, and
+# the number of seconds after which a mirror is refreshed from its remote
+CLOUDLAUNCH_PLAYBOOK_CACHE_DIR = os.path.join(CLOUDLAUNCH_PLUGIN_RUNNERS_DIR,
+                                              'mirrors')
+CLOUDLAUNCH_PLAYBOOK_CACHE_TTL = 300
+# Number of hosts Ansible configures in parallel
+CLOUDLAUNCH_ANSIBLE_FORKS = 20
+# Archived (gzip compressed) output of app configurers, one file per task
+CLOUDLAUNCH_TASK_LOG_DIR = os.environ.get(
+    'CLOUDLAUNCH_TASK_LOG_DIR', os.path.join(BASE_DIR, 'task_logs'))
+# Type of the ssh keys generated to configure launched hosts (ed25519 or
+# rsa) and the number of key pairs each process keeps generated in advance
+CLOUDLAUNCH_SSH_KEY_TYPE = 'ed25519'
+CLOUDLAUNCH_SSH_KEY_POOL_SIZE = 10
+# Seconds for which cloud resource lookups (images, key pairs, VM firewalls
+# and DNS zones) are cached per cloud account and region; 0 disables caching
+CLOUDLAUNCH_CLOUD_CACHE_TTL = 300
+# Locks serializing the creation of cloud resources shared by launches, such
+# as key pairs, VM firewalls and routers: 'database' (PostgreSQL advisory
+# locks), 'redis' or 'local' (in-process locks). With other databases than
+# PostgreSQL, 'database' falls back to in-process locks, which don't
+# serialize the worker processes, and logs a warning.
+# A lock is waited for for up to CLOUDLAUNCH_LOCK_TIMEOUT seconds. Only Redis
+# locks have a lease: a Redis lock expires CLOUDLAUNCH_LOCK_LEASE seconds
+# after it was acquired, even if still held, so the lease must exceed the
+# time it takes to create a resource. Database locks are held until released
+# or until the connection of the worker holding them closes.
+CLOUDLAUNCH_LOCK_BACKEND = os.environ.get('CLOUDLAUNCH_LOCK_BACKEND',
+                                          'database')
+CLOUDLAUNCH_LOCK_REDIS_URL = os.environ.get(
+    'CLOUDLAUNCH_LOCK_REDIS_URL',
+    os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'))
+CLOUDLAUNCH_LOCK_LEASE = 60
+CLOUDLAUNCH_LOCK_TIMEOUT = 120
+# Seconds between listings of the instances of a cloud account, which serve
+# all the waits on the state of instances of the account. The listed states
+# are shared by all workers through Redis ('redis') or kept per process
+# ('local').
+CLOUDLAUNCH_INSTANCE_POLL_INTERVAL = 5
+CLOUDLAUNCH_INSTANCE_STATE_BACKEND = os.environ.get(
+    'CLOUDLAUNCH_INSTANCE_STATE_BACKEND', 'redis')
+CLOUDLAUNCH_INSTANCE_STATE_REDIS_URL = CLOUDLAUNCH_LOCK_REDIS_URL
+# Rate limits of the calls made to each endpoint (e.g., compute.instances) of
+# a cloud account, shared by all workers through Redis ('redis') or kept per
+# process ('local'). Calls per second, and the burst size, of an endpoint;
+# the rate is halved, down to the minimum, when the cloud throttles a call
+# (which is retried) and then recovers over the given number of seconds.
+CLOUDLAUNCH_RATE_LIMIT_BACKEND = os.environ.get(
+    'CLOUDLAUNCH_RATE_LIMIT_BACKEND', 'redis')
+CLOUDLAUNCH_RATE_LIMIT_REDIS_URL = CLOUDLAUNCH_LOCK_REDIS_URL
+CLOUDLAUNCH_RATE_LIMIT = 5
+CLOUDLAUNCH_RATE_LIMIT_BURST = 10
+CLOUDLAUNCH_RATE_LIMIT_MIN = 0.2
+CLOUDLAUNCH_RATE_LIMIT_RECOVERY = 60
+CLOUDLAUNCH_RATE_LIMIT_RETRIES = 3
+# Number of consecutive calls to a cloud endpoint that must fail, because it
+# can't be reached or returns server errors, before further calls fail fast,
+# and the seconds after which a call is let through to probe the endpoint
+CLOUDLAUNCH_CIRCUIT_BREAKER_THRESHOLD = 5
+CLOUDLAUNCH_CIRCUIT_BREAKER_RESET = 30
+# Seconds for which the result of a health check is returned for further
+# health check requests of the deployment instead of running a new check
+CLOUDLAUNCH_HEALTH_CHECK_FRESHNESS = 30
+# Maximum number of admitted launches waiting for their task to start;
+# further launches are rejected with a 429 response (0 disables the limit).
+# The launches waiting are counted in Redis ('redis') or per process
+# ('local'), and the count is reset once no launches have been admitted for
+# the time it takes to start a full queue. The wait reported to clients
+# assumes launches take CLOUDLAUNCH_LAUNCH_DURATION seconds and run
+# CLOUDLAUNCH_LAUNCH_CONCURRENCY at a time, which should match the
+# concurrency of the launch workers.
+CLOUDLAUNCH_LAUNCH_QUEUE_LIMIT = 50
+CLOUDLAUNCH_ADMISSION_BACKEND = os.environ.get(
+    'CLOUDLAUNCH_ADMISSION_BACKEND', 'redis')
+CLOUDLAUNCH_ADMISSION_REDIS_URL = CLOUDLAUNCH_LOCK_REDIS_URL
+CLOUDLAUNCH_LAUNCH_CONCURRENCY = 8
+CLOUDLAUNCH_LAUNCH_DURATION = 300
+# Number of times a launch is resumed from its last checkpoint after losing
+# its worker before it is failed and its instance deleted
+CLOUDLAUNCH_LAUNCH_MAX_RESUMES = 3
+# Data passed to tasks by reference (see cloudlaunch/payloads.py): seconds
+# payloads are kept for, size in bytes above which they are compressed and
+# seconds workers cache resolved payloads and credentials for
+CLOUDLAUNCH_PAYLOAD_TTL = 24 * 3600
+CLOUDLAUNCH_PAYLOAD_COMPRESS_SIZE = 4096
+CLOUDLAUNCH_PAYLOAD_CACHE_TTL = 300
+# Latest progress of running tasks, read by clients instead of the result
+# backend: kept in Redis ('redis'), per process ('local') or not kept
+# ('none'), for at most the given number of seconds. Progress updates that
+# don't change a task's state are written to the result backend at most
+# every CLOUDLAUNCH_PROGRESS_WRITE_INTERVAL seconds.
+CLOUDLAUNCH_PROGRESS_BACKEND = os.environ.get(
+    'CLOUDLAUNCH_PROGRESS_BACKEND', 'redis')
+CLOUDLAUNCH_PROGRESS_REDIS_URL = CLOUDLAUNCH_LOCK_REDIS_URL
+CLOUDLAUNCH_PROGRESS_TTL = 3600
+CLOUDLAUNCH_PROGRESS_WRITE_INTERVAL = 5
+
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 
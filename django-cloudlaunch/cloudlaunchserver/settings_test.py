@@ -24,3 +24,11 @@ DATABASES = {
         'NAME': '/tmp/cloudlaunch_testdb.sqlite3',
     }
 }
+
+CLOUDLAUNCH_TASK_LOG_DIR = '/tmp/cloudlaunch_test_task_logs'
+CLOUDLAUNCH_LOCK_BACKEND = 'local'
+CLOUDLAUNCH_INSTANCE_POLL_INTERVAL = 1
+CLOUDLAUNCH_INSTANCE_STATE_BACKEND = 'local'
+CLOUDLAUNCH_RATE_LIMIT_BACKEND = 'local'
+CLOUDLAUNCH_PROGRESS_BACKEND = 'local'
+CLOUDLAUNCH_ADMISSION_BACKEND = 'local'
@@ -94,9 +94,16 @@ REQS_BASE = [
     'netaddr',
     # Utility package for retrying operations
     'tenacity',
+    # Async http client for probing launched apps
+    'aiohttp',
+    # Celery message broker, and the locks, rate limits and task progress
+    # shared by the workers
+    'redis',
     # For serving static files in production mode
     'whitenoise[brotli]',
-    'paramiko'
+    'paramiko',
+    # For generating the ssh keys used to configure launched hosts
+    'cryptography'
 ]
 
 REQS_PROD = ([
@@ -115,8 +122,6 @@ REQS_TEST = ([
 )
 
 REQS_DEV = ([
-    # As celery message broker during development
-    'redis',
     'sphinx>=1.3.1',
     'sphinx_rtd_theme',
     'bump2version',
@@ -138,7 +143,8 @@ setup(
     package_data={
         'cloudlaunch': [
             'backend_plugins/cloudman2/rancher2_aws_iam_policy.json',
-            'backend_plugins/cloudman2/rancher2_aws_iam_trust_policy.json'],
+            'backend_plugins/cloudman2/rancher2_aws_iam_trust_policy.json',
+            'ansible_plugins/callback/*.py'],
     },
     include_package_data=True,
     install_requires=REQS_BASE,
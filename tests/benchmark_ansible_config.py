@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Benchmark playbook wall time with and without the generated ansible.cfg.
+
+A throwaway OpenSSH server is started on localhost as a stand-in for a
+launched host and a sample playbook, with fact gathering and a number of
+small tasks, is run against it twice in a row (as with the multiple
+playbooks of an app), first with Ansible's default configuration and then
+with the configuration generated by ``AnsibleAppConfigurer``.
+
+Requires ``sshd``, ``ssh-keygen`` and ``ansible-playbook`` on the path (or
+``/usr/sbin/sshd``). Run from the repository root:
+
+    python tests/benchmark_ansible_config.py --tasks 20 --rounds 3
+"""
+import argparse
+import getpass
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'django-cloudlaunch'))
+
+INVENTORY = """
+localhost
+
+[all:vars]
+ansible_ssh_port={port}
+ansible_user='{user}'
+ansible_ssh_private_key_file={key}
+ansible_python_interpreter={python}
+ansible_ssh_extra_args='-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null'
+""".strip()
+
+SSHD_CONFIG = """
+Port {port}
+ListenAddress 127.0.0.1
+HostKey {work_dir}/host_key
+AuthorizedKeysFile {work_dir}/authorized_keys
+PidFile {work_dir}/sshd.pid
+StrictModes no
+UsePAM no
+PasswordAuthentication no
+""".strip()
+
+
+def find_sshd():
+    sshd = shutil.which('sshd') or '/usr/sbin/sshd'
+    if not os.path.exists(sshd):
+        sys.exit("sshd is required to run this benchmark")
+    return sshd
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_sshd(work_dir, port):
+    for key in ('host_key', 'client_key'):
+        if not os.path.exists(os.path.join(work_dir, key)):
+            subprocess.check_call(['ssh-keygen', '-q', '-t', 'ed25519',
+                                   '-N', '', '-f', os.path.join(work_dir, key)])
+    shutil.copy(os.path.join(work_dir, 'client_key.pub'),
+                os.path.join(work_dir, 'authorized_keys'))
+    config = os.path.join(work_dir, 'sshd_config')
+    with open(config, 'w') as f:
+        f.write(SSHD_CONFIG.format(port=port, work_dir=work_dir))
+    sshd = subprocess.Popen([find_sshd(), '-D', '-e', '-f', config],
+                            stderr=subprocess.DEVNULL)
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return sshd
+        except OSError:
+            time.sleep(0.1)
+    sshd.terminate()
+    sys.exit("sshd did not start")
+
+
+def write_playbook(run_dir, tasks, port, key):
+    with open(os.path.join(run_dir, 'playbook.yml'), 'w') as f:
+        f.write("- hosts: all\n  gather_facts: true\n  tasks:\n")
+        for i in range(tasks):
+            f.write("    - name: task {0}\n"
+                    "      command: echo {0}\n".format(i))
+    with open(os.path.join(run_dir, 'inventory.ini'), 'w') as f:
+        f.write(INVENTORY.format(port=port, user=getpass.getuser(), key=key,
+                                 python=sys.executable))
+
+
+def run_playbook(run_dir):
+    start = time.time()
+    subprocess.check_call(
+        ['ansible-playbook', '-i', 'inventory.ini', 'playbook.yml'],
+        cwd=run_dir, stdout=subprocess.DEVNULL,
+        env=dict(os.environ, ANSIBLE_CONFIG=os.path.join(run_dir,
+                                                         'ansible.cfg')))
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tasks', type=int, default=20,
+                        help='Number of tasks in the sample playbook')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Number of times to repeat each measurement')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='cl_ansible_bench_')
+    from django.conf import settings
+    settings.configure(
+        CLOUDLAUNCH_PLUGIN_RUNNERS_DIR=os.path.join(work_dir, 'runners'),
+        CLOUDLAUNCH_ANSIBLE_FORKS=20)
+    from cloudlaunch.configurers import AnsibleAppConfigurer
+
+    key = os.path.join(work_dir, 'client_key')
+    results = {}
+    for name in ('default', 'generated'):
+        times = []
+        for _ in range(args.rounds):
+            # Use a new server, on a new port, for each round so that no
+            # persistent ssh connections are carried over between rounds
+            port = free_port()
+            configurer = AnsibleAppConfigurer()
+            sshd = start_sshd(work_dir, port)
+            try:
+                run_dir = tempfile.mkdtemp(dir=work_dir)
+                write_playbook(run_dir, args.tasks, port, key)
+                if name == 'generated':
+                    configurer._write_ansible_cfg(run_dir, 'localhost')
+                else:
+                    open(os.path.join(run_dir, 'ansible.cfg'), 'w').close()
+                # Two playbooks against the same host, as for a typical app
+                times.append(run_playbook(run_dir) + run_playbook(run_dir))
+            finally:
+                sshd.terminate()
+                shutil.rmtree(configurer._get_fact_cache_dir('localhost'),
+                              ignore_errors=True)
+        results[name] = min(times)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print("Wall time of two runs of a {0} task playbook (best of {1}):"
+          .format(args.tasks, args.rounds))
+    for name, seconds in results.items():
+        print("  {0:<10} {1:6.2f}s".format(name, seconds))
+    print("  speedup    {0:6.2f}x".format(
+        results['default'] / results['generated']))
+
+
+if __name__ == '__main__':
+    main()
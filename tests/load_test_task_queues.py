@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Load test health check latency under a burst of launches.
+
+Stand-ins for the ``create_appliance`` and ``health_check`` tasks, named as
+the real tasks and routed with the queues, routes and priorities of
+``cloudlaunchserver.celeryconfig``, are run by Celery workers started for
+the test. A burst of launches, each holding a worker for ``--launch-time``
+seconds, is queued and health checks are then queued every second. The
+time each health check spent queued is measured twice: with all the tasks
+in a single queue consumed by one pool of workers and with the dedicated
+queues, each consumed by its own workers, of the recommended topology.
+
+Uses a filesystem broker in a temporary directory unless another broker
+(e.g., ``redis://localhost:6379/15``) is supplied. Run from the repository
+root:
+
+    python tests/load_test_task_queues.py --launches 40 --launch-time 10
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from celery import Celery
+
+# Load the Celery config on its own; the cloudlaunchserver package sets up
+# Django when imported
+CELERY_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'django-cloudlaunch', 'cloudlaunchserver', 'celeryconfig.py')
+spec = importlib.util.spec_from_file_location('celeryconfig', CELERY_CONFIG)
+celeryconfig = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(celeryconfig)
+
+app = Celery('load_test_task_queues')
+
+
+def configure(broker, work_dir, dedicated):
+    app.config_from_object(celeryconfig)
+    transport_options = dict(celeryconfig.broker_transport_options)
+    if broker.startswith('filesystem'):
+        transport_options.update({
+            'data_folder_in': os.path.join(work_dir, 'broker'),
+            'data_folder_out': os.path.join(work_dir, 'broker'),
+            'control_folder': os.path.join(work_dir, 'control'),
+            'store_processed': False,
+            'polling_interval': 0.05})
+    app.conf.update(broker_url=broker, result_backend=None,
+                    broker_transport_options=transport_options,
+                    worker_hijack_root_logger=False)
+    if not dedicated:
+        app.conf.update(task_queues=None, task_routes=None,
+                        task_default_queue='celery')
+    os.makedirs(os.path.join(work_dir, 'broker'), exist_ok=True)
+
+
+@app.task(name='cloudlaunch.tasks.create_appliance')
+def create_appliance(seconds):
+    time.sleep(seconds)
+
+
+@app.task(name='cloudlaunch.tasks.health_check')
+def health_check(sent, results_path):
+    with open(results_path, 'a') as f:
+        f.write("{0}\n".format(time.time() - sent))
+
+
+def start_worker(args, work_dir, dedicated, queues, concurrency):
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker',
+           '--broker', args.broker, '--work-dir', work_dir,
+           '--concurrency', str(concurrency)]
+    if dedicated:
+        cmd += ['--dedicated', '--queues', queues]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+
+def run_worker(args):
+    configure(args.broker, args.work_dir, args.dedicated)
+    argv = ['worker', '--pool', 'threads', '--loglevel', 'WARNING',
+            '--concurrency', str(args.concurrency), '--without-heartbeat',
+            '--without-mingle', '--without-gossip']
+    if args.queues:
+        argv += ['--queues', args.queues]
+    app.worker_main(argv)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(args, dedicated):
+    work_dir = tempfile.mkdtemp(prefix='cl_queue_load_')
+    configure(args.broker, work_dir, dedicated)
+    if dedicated:
+        workers = [start_worker(args, work_dir, True, 'launch',
+                                args.launch_workers),
+                   start_worker(args, work_dir, True, 'health',
+                                args.health_workers)]
+    else:
+        workers = [start_worker(args, work_dir, False, None,
+                                args.launch_workers + args.health_workers)]
+    results_path = os.path.join(work_dir, 'latencies')
+    try:
+        # Let the workers start consuming
+        time.sleep(3)
+        for _ in range(args.launches):
+            create_appliance.delay(args.launch_time)
+        for _ in range(args.duration):
+            health_check.delay(time.time(), results_path)
+            time.sleep(1)
+        # Wait for the queued health checks to be run
+        deadline = time.time() + args.launches * args.launch_time
+        latencies = []
+        while time.time() < deadline:
+            if os.path.exists(results_path):
+                with open(results_path) as f:
+                    latencies = [float(line) for line in f]
+            if len(latencies) >= args.duration:
+                break
+            time.sleep(0.5)
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return latencies
+
+
+def report_scenario(args):
+    latencies = run_scenario(args, args.scenario == 'dedicated')
+    if len(latencies) < args.duration:
+        print("  {0:<10} only {1} of {2} health checks ran".format(
+            args.scenario, len(latencies), args.duration))
+        return
+    print("  {0:<10} p50 {1:6.2f}s  p95 {2:6.2f}s  max {3:6.2f}s".format(
+        args.scenario, percentile(latencies, 0.5),
+        percentile(latencies, 0.95), max(latencies)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--broker', default='filesystem://',
+                        help='Broker URL; use a dedicated Redis database')
+    parser.add_argument('--launches', type=int, default=40,
+                        help='Number of launches queued in a burst')
+    parser.add_argument('--launch-time', type=int, default=10,
+                        help='Seconds each launch holds a worker')
+    parser.add_argument('--duration', type=int, default=30,
+                        help='Number of health checks, queued every second')
+    parser.add_argument('--launch-workers', type=int, default=6,
+                        help='Concurrency of the launch queue workers')
+    parser.add_argument('--health-workers', type=int, default=2,
+                        help='Concurrency of the health queue workers')
+    parser.add_argument('--scenario', choices=('shared', 'dedicated'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--worker', action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--dedicated', action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--queues', help=argparse.SUPPRESS)
+    parser.add_argument('--concurrency', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return run_worker(args)
+
+    if args.scenario:
+        return report_scenario(args)
+
+    print("Queued time of health checks during a burst of {0} launches of "
+          "{1}s, with {2} workers:".format(
+              args.launches, args.launch_time,
+              args.launch_workers + args.health_workers), flush=True)
+    # Run each scenario in its own process as Celery keeps the connections
+    # and routes it was first configured with
+    for name in ('shared', 'dedicated'):
+        subprocess.check_call([sys.executable] + sys.argv +
+                              ['--scenario', name])
+
+
+if __name__ == '__main__':
+    main()